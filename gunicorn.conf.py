@@ -0,0 +1,92 @@
+# === gunicorn の設定（本番配信） ===
+# プロジェクト直下で `gunicorn` を実行すると読み込まれる（別の場所からなら `gunicorn -c gunicorn.conf.py`）。
+# 値はすべて環境変数で上書きできる。
+#
+#   SERVER_MODE=sync  : gthread ワーカー（WSGI）。プロセス×スレッドで同期ビューを捌く（既定）
+#   SERVER_MODE=async : uvicorn ワーカー（ASGI）。同期ビューは Django がスレッドプールで実行する
+#
+# 再起動: SIGHUP でワーカーを順に入れ替える（preload_app 中はコードを読み直さないので、
+# デプロイ時は USR2 で新しいマスターを起動 → 旧マスターに WINCH, QUIT の順で送る）。
+# SIGTERM ではリクエスト処理中のワーカーを graceful_timeout 秒まで待ってから終了する。
+#
+# メトリクス: ワーカーが2つ以上なら METRICS_MULTIPROC_DIR（未設定ならマスターごとの一時ディレクトリ）に
+# 各ワーカーの値を書き出し、/metrics/ はどのワーカーが答えても全ワーカーの合計を返す。
+import os
+import tempfile
+
+from kanban_project.serving import default_workers
+
+mode = os.environ.get('SERVER_MODE', 'sync')
+if mode not in ('sync', 'async'):
+    raise ValueError(f'unknown SERVER_MODE: {mode}')
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', default_workers(mode)))
+
+if mode == 'async':
+    wsgi_app = 'kanban_project.asgi:application'
+    worker_class = 'kanban_project.workers.DjangoUvicornWorker'
+else:
+    wsgi_app = 'kanban_project.wsgi:application'
+    worker_class = 'gthread'
+    threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# マスターでアプリを読み込んでから fork する（起動が速く、読み込んだコードのメモリを共有できる）
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() != 'false'
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+# メモリの断片化・リークに備えて一定数のリクエストごとにワーカーを入れ替える（一斉に入れ替わらないようにずらす）
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+# ワーカーの生存確認ファイルをメモリ上に置く（ディスクが遅いとタイムアウト扱いで殺されることがある）
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+forwarded_allow_ips = os.environ.get('FORWARDED_ALLOW_IPS', '127.0.0.1')
+
+# Django の設定を読む前（ここ）で決めて、ワーカーに環境変数として引き継ぐ。
+# 待ち受けアドレスごとのディレクトリなので、USR2 で起動した新しいマスターも同じ場所を使う
+metrics_dir = os.environ.get('METRICS_MULTIPROC_DIR', '')
+if not metrics_dir and workers > 1:
+    metrics_dir = os.path.join(worker_tmp_dir or tempfile.gettempdir(),
+                               'kanban-metrics-' + bind.replace(':', '_').replace('/', '_'))
+    os.environ['METRICS_MULTIPROC_DIR'] = metrics_dir
+
+
+def on_starting(server):
+    # 前回の残りは消すが、USR2 の再起動中（旧マスターとワーカーがまだ動いている）は消さずに引き継ぐ
+    if metrics_dir:
+        from tasks.metrics import claim_directory
+        claim_directory(metrics_dir)
+
+
+def when_ready(server):
+    # fork 前にビューとテンプレートを読み込んでおく（preload_app のときだけ。そうでなければワーカーごとに読み込む）
+    if preload_app:
+        from kanban_project.serving import warm_up
+        warm_up()
+
+
+def post_fork(server, worker):
+    # マスターから受け継いだ DB 接続は使い回さない
+    from django.db import connections
+    connections.close_all()
+
+
+def worker_exit(server, worker):
+    # キューに残ったバックグラウンド処理を済ませてから、終了するワーカーが最後の値を書き出す
+    from tasks.background import drain
+    drain()
+    if metrics_dir:
+        from tasks.metrics import flush
+        flush(metrics_dir)
+
+
+def child_exit(server, worker):
+    # 終了したワーカーの値を archive.json にまとめる（再起動・max_requests での入れ替えで数値が戻らない）
+    if metrics_dir:
+        from tasks.metrics import archive_process
+        archive_process(metrics_dir, worker.pid)
@@ -0,0 +1,39 @@
+"""
+本番配信用の補助（gunicorn.conf.py から使う）。
+
+preload_app でマスタープロセスがアプリを読み込んだ後、fork する前に warm_up() を呼び、
+URL 設定・ビュー・主要テンプレートのコンパイルまで済ませておく。fork 後のワーカーはそれを
+コピーオンライトで共有するので、各ワーカーの最初のリクエストが遅くならない。
+"""
+import os
+
+# fork 前にコンパイルしておくテンプレート（cached ローダーが有効なときだけ意味がある）
+WARM_TEMPLATES = [
+    'registration/login.html',
+    'tasks/board.html',
+    'tasks/kanban.html',
+    'tasks/task_form.html',
+    'tasks/notification_list.html',
+    'tasks/invitation_list.html',
+    'tasks/profile.html',
+]
+
+
+def default_workers(mode, cores=None):
+    """CPU コア数からワーカー数を決める。sync（スレッド併用）は 2×コア+1、async はコア数。"""
+    cores = cores or os.cpu_count() or 1
+    return cores if mode == 'async' else cores * 2 + 1
+
+
+def warm_up():
+    from django.template import TemplateDoesNotExist
+    from django.template.loader import get_template
+    from django.urls import get_resolver
+
+    # URL パターンを解決してビューのモジュールまで import する
+    get_resolver().reverse_dict
+    for name in WARM_TEMPLATES:
+        try:
+            get_template(name)
+        except TemplateDoesNotExist:
+            pass
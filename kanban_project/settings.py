@@ -20,14 +20,17 @@ env = environ.Env()
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
-env.read_env(os.path.join(BASE_DIR, '.env'))
+# .env は開発用。本番は環境変数を直接渡すので、ファイルが無ければ読まない
+ENV_FILE = os.path.join(BASE_DIR, '.env')
+if os.path.exists(ENV_FILE):
+    env.read_env(ENV_FILE)
 SECRET_KEY = env('SECRET_KEY')
 DEBUG = env.bool('DEBUG', default=False)
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
 
-ALLOWED_HOSTS = ['*']
+ALLOWED_HOSTS = env.list('ALLOWED_HOSTS', default=['*'])
 
 # Application definition
 
@@ -42,7 +45,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # /healthz/ と /readyz/ はここで応答し、以降のミドルウェア（セッション等）を通さない
+    'tasks.health.HealthCheckMiddleware',
+    # /metrics/ の応答と、リクエストごとの時間・SQL の計測
+    'tasks.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'tasks.assets.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -53,17 +61,26 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'kanban_project.urls'
 
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+if env.bool('TEMPLATE_CACHE', default=True):
+    TEMPLATE_LOADERS = [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # コンパイル済みテンプレートをプロセス内に保持する（TEMPLATE_CACHE=False なら毎回読み直す）
+            'loaders': TEMPLATE_LOADERS,
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'tasks.context_processors.unread_notifications',
             ],
         },
     },
@@ -75,10 +92,15 @@ WSGI_APPLICATION = 'kanban_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# トランザクションは BEGIN IMMEDIATE で始める（kanban_project/sqlite_backend）。
+# 書き込みが重なったときは timeout 秒まで待ってから "database is locked" にする
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'kanban_project.sqlite_backend',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'timeout': env.int('SQLITE_TIMEOUT', default=20),
+        },
     }
 }
 
@@ -136,19 +158,83 @@ STATICFILES_DIRS = [
 
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# collectstatic でハッシュ付きのファイル名と .gz/.br を作り、tasks.assets のミドルウェアが
+# 長期キャッシュのヘッダー付きで配信する（DEBUG 中は runserver が配信。前段のWebサーバーに任せるなら SERVE_STATIC_FILES=False）
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'tasks.assets.CompressedManifestStaticFilesStorage'},
+}
+SERVE_STATIC_FILES = env.bool('SERVE_STATIC_FILES', default=not DEBUG)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-LOGIN_REDIRECT_URL = 'board'
-
-LOGOUT_REDIRECT_URL = 'login'
-
 SESSION_COOKIE_AGE = 1209600
 
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False
 
+# === セッション ===
+# SESSION_MODE: db（従来通り） / cached_db（キャッシュ+DB） / cache（キャッシュのみ） / signed_cookies
+SESSION_MODE = env('SESSION_MODE', default='db')
+SESSION_ENGINE = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}[SESSION_MODE]
+SESSION_CACHE_ALIAS = 'sessions'
+
+# === キャッシュ ===
+# default はプロセス内 LRU（tasks.cache.TieredCache）+ 共有キャッシュの2段構成。
+# 共有層は CACHE_SHARED_BACKEND で選ぶ: locmem（開発用の代用品） / file / redis
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+CACHE_SHARED_BACKEND = env('CACHE_SHARED_BACKEND', default='locmem')
+CACHE_SHARED_LOCATION = env('CACHE_SHARED_LOCATION', default={
+    'locmem': 'shared',
+    'file': os.path.join(BASE_DIR, '.cache', 'shared'),
+    'redis': 'redis://127.0.0.1:6379/1',
+}[CACHE_SHARED_BACKEND])
+
+# セッション用キャッシュ: locmem（プロセス内）または file。MAX_ENTRIES を超えると古いものから捨てる
+SESSION_CACHE_BACKEND = env('SESSION_CACHE_BACKEND', default='locmem')
+CACHES = {
+    'default': {
+        'BACKEND': 'tasks.cache.TieredCache',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_MAX_ENTRIES': env.int('CACHE_LOCAL_MAX_ENTRIES', default=1000),
+            'LOCAL_TIMEOUT': env.int('CACHE_LOCAL_TIMEOUT', default=5),
+        },
+    },
+    'shared': {
+        'BACKEND': CACHE_BACKENDS[CACHE_SHARED_BACKEND],
+        'LOCATION': CACHE_SHARED_LOCATION,
+        'TIMEOUT': 300,
+        'OPTIONS': {} if CACHE_SHARED_BACKEND == 'redis' else {
+            'MAX_ENTRIES': env.int('CACHE_SHARED_MAX_ENTRIES', default=50000),
+        },
+    },
+    'sessions': {
+        'BACKEND': CACHE_BACKENDS[SESSION_CACHE_BACKEND],
+        'LOCATION': os.path.join(BASE_DIR, '.cache', 'sessions') if SESSION_CACHE_BACKEND == 'file' else 'sessions',
+        'TIMEOUT': SESSION_COOKIE_AGE,
+        'OPTIONS': {
+            'MAX_ENTRIES': env.int('SESSION_CACHE_MAX_ENTRIES', default=10000),
+        },
+    },
+}
+
+# 2段階認証の途中状態（ユーザーIDと「ログイン状態を保持」）を署名付きCookieに入れ、
+# ログイン前にセッション行を作らないようにする
+PRE_2FA_SIGNED_COOKIE = env.bool('PRE_2FA_SIGNED_COOKIE', default=True)
+
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
@@ -175,4 +261,20 @@ LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'board'
 
 # ログアウトしたら、ログイン画面に戻る設定
-LOGOUT_REDIRECT_URL = 'login'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = 'login'
+
+# 一括招待APIで1回に受け付ける人数の上限
+BULK_INVITE_LIMIT = env.int('BULK_INVITE_LIMIT', default=1000)
+
+# コミット後のバックグラウンド処理（通知・集計など）のスレッド数（プロセスごと）。
+# SQLite は書き込みが1本ずつなので 1。PostgreSQL などでは増やしてよい
+BACKGROUND_TASKS_WORKERS = env.int('BACKGROUND_TASKS_WORKERS', default=1)
+
+# === メトリクス（/metrics/） ===
+# どちらも未設定なら /metrics/ は 403 を返す（既定では公開しない）。
+# METRICS_TOKEN: Authorization: Bearer <token> のリクエストに返す
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+# METRICS_ALLOWED_IPS: REMOTE_ADDR がこのアドレス・ネットワーク（例: 127.0.0.1,10.0.0.0/8）に入るリクエストに返す
+METRICS_ALLOWED_IPS = env.list('METRICS_ALLOWED_IPS', default=[])
+# 複数プロセスの値を合計するためのディレクトリ（gunicorn.conf.py がワーカー数 2 以上なら設定する）
+METRICS_MULTIPROC_DIR = env('METRICS_MULTIPROC_DIR', default='')
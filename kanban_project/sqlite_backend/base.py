@@ -0,0 +1,13 @@
+from django.db.backends.sqlite3 import base
+
+# === SQLite: トランザクションを書き込みロックから始める ===
+# 標準の BEGIN（DEFERRED）は最初の SELECT で読み取りロックを取り、後の INSERT/UPDATE で書き込みロックへ昇格する。
+# その間に別の接続（コミット後のバックグラウンド処理など）が書き込み待ちに入っていると、昇格は待たずに
+# "database is locked" で失敗する（待つとデッドロックになるため SQLite がすぐに諦める）。
+# BEGIN IMMEDIATE で最初に書き込みロックを取れば、競合した側は OPTIONS['timeout'] 秒まで順番を待つだけになる。
+# （Django 5.1 以降の OPTIONS['transaction_mode'] = 'IMMEDIATE' と同じ動作）
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
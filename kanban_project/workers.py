@@ -0,0 +1,10 @@
+"""
+gunicorn の async モードで使う uvicorn ワーカー。
+
+Django は ASGI の lifespan に対応していないので、起動のたびに出る警告と問い合わせを止める。
+"""
+from uvicorn.workers import UvicornWorker
+
+
+class DjangoUvicornWorker(UvicornWorker):
+    CONFIG_KWARGS = {**UvicornWorker.CONFIG_KWARGS, 'lifespan': 'off'}
@@ -0,0 +1,19 @@
+document.addEventListener('DOMContentLoaded', () => {
+    const urlParams = new URLSearchParams(window.location.search);
+    if (!urlParams.has('q')) { setMode('personal', document.querySelector('.selector-btn')); } 
+    else { setMode('all', null); }
+});
+
+function setMode(mode, btnElement) {
+    if (btnElement) {
+        document.querySelectorAll('.selector-btn').forEach(btn => btn.classList.remove('active'));
+        btnElement.classList.add('active');
+    }
+    const rows = document.querySelectorAll('.c-task-row');
+    rows.forEach(row => {
+        const taskType = row.dataset.type;
+        if (mode === 'all') row.style.display = 'flex';
+        else if (mode === 'personal') row.style.display = (taskType === 'personal') ? 'flex' : 'none';
+        else if (mode === 'team') row.style.display = (taskType === 'team') ? 'flex' : 'none';
+    });
+}
@@ -0,0 +1,56 @@
+// カンバン列: 追加読み込みとドラッグ&ドロップでの列移動（URL等はテンプレートの KANBAN から受け取る）
+let draggedCard = null;
+
+function loadMore(btn) {
+    const column = btn.closest('.k-column');
+    const url = KANBAN.columnUrl.replace('STATUS', column.dataset.status) + '?cursor=' + encodeURIComponent(btn.dataset.cursor);
+    fetch(url).then(r => r.json()).then(d => {
+        column.querySelector('.k-cards').insertAdjacentHTML('beforeend', d.html);
+        btn.dataset.cursor = d.next_cursor || '';
+        btn.style.display = d.next_cursor ? 'block' : 'none';
+    });
+}
+
+document.addEventListener('dragstart', e => {
+    const card = e.target.closest && e.target.closest('.k-card');
+    if (!card) return;
+    draggedCard = card;
+    card.classList.add('dragging');
+});
+document.addEventListener('dragend', () => {
+    if (draggedCard) draggedCard.classList.remove('dragging');
+    draggedCard = null;
+});
+
+document.querySelectorAll('.k-column').forEach(column => {
+    column.addEventListener('dragover', e => { e.preventDefault(); column.classList.add('drag-over'); });
+    column.addEventListener('dragleave', () => column.classList.remove('drag-over'));
+    column.addEventListener('drop', e => {
+        e.preventDefault();
+        column.classList.remove('drag-over');
+        if (!draggedCard) return;
+        const card = draggedCard;
+        const origin = card.parentNode, originNext = card.nextSibling;
+        const list = column.querySelector('.k-cards');
+        // ドロップ位置の直後のカードの前に差し込む
+        const next = [...list.querySelectorAll('.k-card:not(.dragging)')]
+            .find(el => e.clientY < el.getBoundingClientRect().top + el.offsetHeight / 2);
+        list.insertBefore(card, next || null);
+        const prev = card.previousElementSibling;
+        fetch(KANBAN.moveUrl, {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json', 'X-CSRFToken': KANBAN.csrfToken},
+            body: JSON.stringify({
+                task_id: card.dataset.task, status: column.dataset.status,
+                before_task_id: prev ? prev.dataset.task : null,
+                after_task_id: next ? next.dataset.task : null
+            })
+        }).then(r => r.json()).then(d => {
+            if (d.status !== 'success') { origin.insertBefore(card, originNext); return; }
+            Object.entries(d.counts).forEach(([status, n]) => {
+                const el = document.getElementById('count-' + status);
+                if (el) el.innerText = n;
+            });
+        });
+    });
+});
@@ -0,0 +1,148 @@
+// タスク詳細: WBS・チャット・メンバー操作（URL等はテンプレートの TASK_FORM から受け取る）
+document.addEventListener('DOMContentLoaded', () => {
+    updateProgressBarColor(TASK_FORM.initialPercent, TASK_FORM.initialOverdue);
+
+    // チャット初期表示
+    const tabs = document.querySelectorAll('.thread-tab');
+    if(tabs.length > 0) {
+        const firstThreadId = document.getElementById('activeThreadId').value;
+        filterMessages(firstThreadId);
+    }
+});
+
+// --- WBS機能 ---
+function updateProgressBar(percent, isOverdue) {
+    document.getElementById('wbs-progress-text').innerText = percent;
+    const bar = document.getElementById('wbs-progress-fill');
+    bar.style.width = percent + '%';
+    updateProgressBarColor(percent, isOverdue);
+}
+
+// ... (以下、残りの関数は変更なし) ...
+
+function updateProgressBarColor(percent, isOverdue) {
+    const bar = document.getElementById('wbs-progress-fill');
+    // 新規作成時は要素がない場合のエラー回避
+    if (!bar) return; 
+
+    bar.classList.remove('prog-gray', 'prog-blue', 'prog-green', 'prog-red');
+    if (isOverdue) bar.classList.add('prog-red');
+    else if (percent === 100) bar.classList.add('prog-green');
+    else if (percent > 0) bar.classList.add('prog-blue');
+    else bar.classList.add('prog-gray');
+}
+
+function addSubtask(tid, parentId) { 
+    const v = parentId ? prompt('子タスク名') : document.getElementById('new-subtask-title').value; if(!v)return;
+    fetch(TASK_FORM.urls.addSubtask, { method:'POST', headers:{'Content-Type':'application/json','X-CSRFToken':TASK_FORM.csrfToken}, body:JSON.stringify({task_id:tid, title:v, parent_id:parentId || null}) }).then(r=>r.json()).then(d=>{ if(d.status==='success') location.reload(); });
+}
+
+// 祖先ノードの完了状態をサーバーの集計値に合わせる
+function applyWbsNodes(nodes) {
+    (nodes || []).forEach(n => {
+        const el = document.getElementById(`subtask-${n.id}`);
+        if (el) el.classList.toggle('done', n.is_complete);
+    });
+}
+
+// 切り替え後の値と読んだときの version を送る。他の人が先に切り替えていたら（409）サーバーの状態に合わせる
+function toggleSubtask(id, checkbox) {
+    fetch(TASK_FORM.urls.toggleSubtask, { method:'POST', headers:{'Content-Type':'application/json','X-CSRFToken':TASK_FORM.csrfToken}, body:JSON.stringify({subtask_id:id, is_done:checkbox.checked, version:Number(checkbox.dataset.version)}) }).then(r=>r.json()).then(d=>{
+        if(d.status!=='success' && d.status!=='conflict') { checkbox.checked = !checkbox.checked; return; }
+        checkbox.checked = d.is_done;
+        checkbox.dataset.version = d.version;
+        applyWbsNodes(d.nodes);
+        updateProgressBar(d.progress, d.is_overdue);
+    });
+}
+
+function deleteSubtask(id) {
+    if(!confirm('削除しますか？'))return;
+    fetch(TASK_FORM.urls.deleteSubtask, { method:'POST', headers:{'Content-Type':'application/json','X-CSRFToken':TASK_FORM.csrfToken}, body:JSON.stringify({subtask_id:id}) }).then(r=>r.json()).then(d=>{ document.getElementById(`subtask-${id}`).closest('.wbs-node').remove(); applyWbsNodes(d.nodes); updateProgressBar(d.progress, d.is_overdue); });
+}
+
+// WBSのドラッグ&ドロップ並び替え（移動した行のランクだけをサーバーで更新）
+let draggedSubtask = null;
+document.addEventListener('DOMContentLoaded', () => {
+    const list = document.getElementById('wbs-list');
+    if (!list) return;
+    // 並び替えは同じ親の兄弟の間だけ
+    list.addEventListener('dragstart', e => { e.stopPropagation(); draggedSubtask = e.target.closest('.wbs-node'); });
+    list.addEventListener('dragover', e => {
+        e.preventDefault();
+        let over = e.target.closest('.wbs-node');
+        while (over && draggedSubtask && over.parentNode !== draggedSubtask.parentNode) over = over.parentNode.closest('.wbs-node');
+        if (!draggedSubtask || !over || over === draggedSubtask) return;
+        const row = over.querySelector('.wbs-item');
+        const after = e.clientY > row.getBoundingClientRect().top + row.offsetHeight / 2;
+        draggedSubtask.parentNode.insertBefore(draggedSubtask, after ? over.nextSibling : over);
+    });
+    list.addEventListener('drop', e => {
+        e.preventDefault();
+        if (!draggedSubtask) return;
+        const item = draggedSubtask; draggedSubtask = null;
+        const prev = item.previousElementSibling, next = item.nextElementSibling;
+        fetch(TASK_FORM.urls.moveSubtask, { method:'POST', headers:{'Content-Type':'application/json','X-CSRFToken':TASK_FORM.csrfToken}, body:JSON.stringify({subtask_id:item.dataset.id, before_id: prev ? prev.dataset.id : null, after_id: next ? next.dataset.id : null}) }).then(r=>r.json()).then(d=>{ if(d.status!=='success') location.reload(); });
+    });
+});
+
+// --- チャット・スレッド ---
+function switchThread(tab, threadId) {
+    document.querySelectorAll('.thread-tab').forEach(el => el.classList.remove('active'));
+    tab.classList.add('active');
+    document.getElementById('currentThreadName').innerText = tab.querySelector('.thread-name').innerText.trim();
+    document.getElementById('activeThreadId').value = threadId;
+    document.getElementById('reportThreadId').value = threadId;
+    filterMessages(threadId);
+}
+function filterMessages(threadId) {
+    const rows = document.querySelectorAll('.msg-row'); let count = 0;
+    rows.forEach(row => { if (row.dataset.thread === threadId) { row.style.display = 'flex'; count++; } else { row.style.display = 'none'; } });
+    const noMsg = document.querySelector('.no-msg'); if(noMsg) noMsg.style.display = (count === 0) ? 'block' : 'none';
+    scrollToFirstUnread(threadId);
+    markThreadRead(threadId);
+}
+// 未読があれば最初の未読メッセージへ、無ければ末尾へスクロールする
+function scrollToFirstUnread(threadId) {
+    const chat = document.getElementById('chatScroll'); if(!chat) return;
+    const badge = document.querySelector(`.thread-tab.active .thread-unread`);
+    const first = badge && document.querySelector(`.msg-row[data-thread="${threadId}"][data-seq="${Number(badge.dataset.lastRead) + 1}"]`);
+    if (first) chat.scrollTop = first.offsetTop - chat.offsetTop; else chat.scrollTop = chat.scrollHeight;
+}
+// 開いたスレッドの既読位置を最新まで進め、未読バッジを消す
+function markThreadRead(threadId) {
+    const tab = document.querySelector('.thread-tab.active'); if(!tab) return;
+    const badge = tab.querySelector('.thread-unread'); if(!badge) return;
+    fetch(TASK_FORM.urls.markThreadRead, { method:'POST', headers:{'Content-Type':'application/json','X-CSRFToken':TASK_FORM.csrfToken}, body:JSON.stringify({thread_id:threadId, seq:Number(tab.dataset.lastSeq)}) }).then(r=>r.json()).then(d=>{ if(d.status==='success') badge.remove(); });
+}
+function toggleChatSearch() { const box = document.getElementById('chatSearchBox'); box.classList.toggle('active'); if(box.classList.contains('active')) box.querySelector('input').focus(); else { box.querySelector('input').value = ''; filterChat(''); } }
+// 検索はサーバー側でスレッド内に絞って行い、ヒットした行だけを表示する（入力が止まってから問い合わせる）
+let chatSearchTimer = null;
+function filterChat(keyword) {
+    clearTimeout(chatSearchTimer);
+    const currentThreadId = document.getElementById('activeThreadId').value;
+    if (!keyword.trim()) { filterMessages(currentThreadId); return; }
+    chatSearchTimer = setTimeout(() => {
+        const url = TASK_FORM.urls.searchThread.replace('/0/', `/${currentThreadId}/`) + '?q=' + encodeURIComponent(keyword.trim());
+        fetch(url).then(r=>r.json()).then(d=>{
+            if(d.status!=='success') return;
+            const hits = new Set(d.results.map(c => String(c.id)));
+            document.querySelectorAll('.msg-row').forEach(row => { row.style.display = (row.dataset.thread === currentThreadId && hits.has(row.dataset.id)) ? 'flex' : 'none'; });
+        });
+    }, 250);
+}
+function createThread(taskId) {
+    const name = document.getElementById('newThreadName').value; if(!name) return;
+    fetch(TASK_FORM.urls.createThread, { method: 'POST', headers: { 'Content-Type': 'application/json', 'X-CSRFToken': TASK_FORM.csrfToken }, body: JSON.stringify({ task_id: taskId, name: name }) }).then(res => res.json()).then(data => { if(data.status==='success') location.reload(); });
+}
+
+// --- その他UI操作 ---
+function saveRole(aid, inp) { fetch(TASK_FORM.urls.updateRole, { method:'POST', headers:{'Content-Type':'application/json','X-CSRFToken':TASK_FORM.csrfToken}, body:JSON.stringify({assignment_id:aid, role_name:inp.value}) }).then(r=>r.json()).then(d=>{ if(d.status==='success'){ inp.style.borderColor='#10b981'; setTimeout(()=>inp.style.borderColor='#e2e8f0',2000); }}); }
+function openModal(id) { document.getElementById(id).classList.add('active'); if(id==='reportModal') document.getElementById('reportThreadId').value = document.getElementById('activeThreadId').value; }
+function closeModal(id) { document.getElementById(id).classList.remove('active'); }
+function openProfileModal(btn) { const d = btn.dataset; document.getElementById('modalName').innerText = d.username; document.getElementById('modalBio').innerText = d.bio || '未設定'; const av = document.getElementById('modalAvatar'); if(d.icon) av.innerHTML = `<img src="${d.icon}">`; else av.innerText = d.username.charAt(0); const f = document.getElementById('removeMemberForm'); if(TASK_FORM.currentUserId && TASK_FORM.taskOwnerId && TASK_FORM.currentUserId === TASK_FORM.taskOwnerId && d.id !== TASK_FORM.currentUserId) { f.style.display = 'block'; document.getElementById('removeTargetId').value = d.id; } else { f.style.display = 'none'; } document.getElementById('profileModal').classList.add('active'); }
+function closeProfileModal() { document.getElementById('profileModal').classList.remove('active'); }
+function showFileName(input) { const p = document.getElementById('file-name-preview'); if(input.files[0]){ p.style.display='block'; p.innerText=input.files[0].name; } else { p.style.display='none'; } }
+function toggleDesc() { document.getElementById('descDropdown').classList.toggle('open'); document.getElementById('toggleDescBtn').classList.toggle('active'); }
+function toggleMobileMembers() { const m = document.getElementById('membersArea'); if(m.classList.contains('active')) m.classList.remove('active'); else m.classList.add('active'); }
+function copyInviteLink() { navigator.clipboard.writeText(window.location.href.replace('edit','join')).then(()=>alert('リンクをコピーしました')); }
@@ -0,0 +1,103 @@
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery
+
+from .models import Task, TaskAssignment
+
+# === タスクのアクセス権 ===
+# ユーザーごとに「参加タスク → ロール」「作成したタスク」をまとめてキャッシュし、
+# ビュー・APIの権限チェックはすべてここを通す（1リクエストにつきキャッシュ参照1回）。
+# TaskAssignment / Invitation / Task の変更時に tasks.signals から無効化される。
+#
+# ただし共有キャッシュがプロセスごと（locmem）の構成では、無効化は変更を処理したワーカーにしか届かない。
+# そのため書き込み（GET/HEAD 以外）はキャッシュを使わず DB で確かめ、外されたメンバーが他のワーカーで
+# 書き込めないようにする。閲覧は MEMBERSHIP_CACHE_TIMEOUT 秒まで古い権限で見えることがある（古い許可は許容）。
+# 逆にキャッシュに無いタスクは DB で確かめてから拒否する（他のワーカーで参加した直後に 404 にしない）。
+
+MEMBERSHIP_CACHE_TIMEOUT = 60
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+Access = namedtuple('Access', ['task_id', 'assignment_id', 'role_name', 'is_member', 'is_owner'])
+
+
+def cache_key(user_id):
+    return f'access:memberships:{user_id}'
+
+
+def _load(user_id):
+    members = {task_id: (assignment_id, role_name)
+               for task_id, assignment_id, role_name in TaskAssignment.objects.filter(user_id=user_id)
+               .values_list('task_id', 'id', 'role_name')}
+    owned = set(Task.objects.filter(user_id=user_id).values_list('id', flat=True))
+    return {'members': members, 'owned': owned}
+
+
+def memberships(request):
+    # 同じリクエスト内ではキャッシュも1回しか見ない
+    data = getattr(request, '_task_memberships', None)
+    if data is None:
+        user_id = request.user.id
+        data = cache.get_or_set(cache_key(user_id), lambda: _load(user_id), MEMBERSHIP_CACHE_TIMEOUT)
+        request._task_memberships = data
+    return data
+
+
+def invalidate(*user_ids):
+    cache.delete_many([cache_key(user_id) for user_id in user_ids if user_id])
+
+
+def _check_database(user_id, task_id):
+    # (担当ID, ロール, 作成者ID) を1クエリで。タスクが無ければ None
+    assignment = TaskAssignment.objects.filter(task=OuterRef('pk'), user_id=user_id)
+    return (Task.objects.filter(id=task_id)
+            .annotate(assignment_id=Subquery(assignment.values('id')[:1]),
+                      role_name=Subquery(assignment.values('role_name')[:1]))
+            .values_list('assignment_id', 'role_name', 'user_id').first())
+
+
+def _database_access(request, task_id):
+    # 同じリクエストで何度聞かれても DB は1回
+    checked = getattr(request, '_task_database_access', None)
+    if checked is None:
+        checked = request._task_database_access = {}
+    if task_id not in checked:
+        row = _check_database(request.user.id, task_id)
+        if row is None:
+            checked[task_id] = (None, False)
+        else:
+            assignment_id, role_name, owner_id = row
+            checked[task_id] = ((assignment_id, role_name) if assignment_id else None, owner_id == request.user.id)
+    return checked[task_id]
+
+
+def get_access(request, task_id):
+    """(user, task) の権限。参加も作成もしていなければ None。"""
+    if not request.user.is_authenticated or task_id is None:
+        return None
+    try:
+        task_id = int(task_id)
+    except (TypeError, ValueError):
+        return None
+    if request.method in SAFE_METHODS:
+        data = memberships(request)
+        member = data['members'].get(task_id)
+        is_owner = task_id in data['owned']
+        if member is None and not is_owner:
+            member, is_owner = _database_access(request, task_id)
+    else:
+        member, is_owner = _database_access(request, task_id)
+    if member is None and not is_owner:
+        return None
+    assignment_id, role_name = member or (None, None)
+    return Access(task_id, assignment_id, role_name, member is not None, is_owner)
+
+
+def is_member(request, task_id):
+    access = get_access(request, task_id)
+    return access is not None and access.is_member
+
+
+def is_owner(request, task_id):
+    access = get_access(request, task_id)
+    return access is not None and access.is_owner
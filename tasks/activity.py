@@ -0,0 +1,71 @@
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .background import run_after_commit
+from .models import ActivityEvent, Task, TaskAssignment, TaskDailyStat
+
+# === アクティビティログと日次集計 ===
+# 変更のたびにイベントを1行追記し（呼び出し側のトランザクション内、INSERT 1回のみ）、
+# その日の集計（担当ステータス別の人数・サブタスクの総数/完了数）はコミット後にバックグラウンドで更新する。
+# バーンダウン・累積フロー図は集計行だけを読み、イベントは走査しない。
+
+MAX_DAYS = 180
+
+
+def record(task_id, actor, kind, subject_id=None, old_value='', new_value=''):
+    event = ActivityEvent.objects.create(task_id=task_id, actor=actor, kind=kind, subject_id=subject_id,
+                                         old_value=old_value or '', new_value=new_value or '')
+    run_after_commit(refresh_day, task_id, timezone.localdate(event.created_at))
+    return event
+
+
+def refresh_day(task_id, day):
+    """task の day の集計を現在の状態で作り直す。"""
+    counters = Task.objects.filter(id=task_id).values_list('subtask_leaf_count', 'subtask_done_count').first()
+    if counters is None:
+        return
+    counts = dict(TaskAssignment.objects.filter(task_id=task_id).values_list('status')
+                  .annotate(n=Count('id')).order_by())
+    values = {'todo': counts.get('todo', 0), 'doing': counts.get('doing', 0), 'done': counts.get('done', 0),
+              'subtask_leaf_count': counters[0], 'subtask_done_count': counters[1]}
+    # update_or_create は SELECT してから書くので、SQLite では読み取りロックから書き込みロックへの昇格が
+    # 他の書き込みとぶつかると待たずに database is locked で失敗する。書き込みから始めて待てるようにする
+    stats = TaskDailyStat.objects.filter(task_id=task_id, day=day)
+    if stats.update(**values):
+        return
+    try:
+        with transaction.atomic():
+            TaskDailyStat.objects.create(task_id=task_id, day=day, **values)
+    except IntegrityError:
+        # 同じ日の集計を別のジョブが先に作った
+        stats.update(**values)
+
+
+def timeline(task_id, days=30):
+    """直近 days 日分のバーンダウン・累積フロー。変更のなかった日は前日の値を引き継ぐ。"""
+    days = max(1, min(days, MAX_DAYS))
+    end = timezone.localdate()
+    start = end - timedelta(days=days - 1)
+    stats = TaskDailyStat.objects.filter(task_id=task_id)
+    rows = list(stats.filter(day__gte=start, day__lte=end).order_by('day'))
+    # 期間の初日より前の最後の集計を初期値にする
+    previous = stats.filter(day__lt=start).order_by('-day').first()
+
+    series = {'days': [], 'todo': [], 'doing': [], 'done': [], 'remaining': [], 'total': []}
+    current = previous
+    index = 0
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        while index < len(rows) and rows[index].day == day:
+            current = rows[index]
+            index += 1
+        series['days'].append(day.isoformat())
+        for status in ('todo', 'doing', 'done'):
+            series[status].append(getattr(current, status) if current else 0)
+        total = current.subtask_leaf_count if current else 0
+        series['total'].append(total)
+        series['remaining'].append(total - current.subtask_done_count if current else 0)
+    return series
@@ -0,0 +1,178 @@
+import gzip
+import mimetypes
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.cache import cc_delim_re, patch_vary_headers
+
+# === 静的ファイルの配信 ===
+# collectstatic でハッシュ付きのファイル名（style.3f2a9c1b7e4d.css）と圧縮版（.gz / .br）を作り、
+# 実行時はミドルウェアが STATIC_ROOT から直接返す。ハッシュ付きの名前は中身が変わると名前も変わるので
+# 1年キャッシュさせ、ハッシュ無しの名前は短いキャッシュにする。
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.map')
+MIN_COMPRESS_SIZE = 256
+FOREVER = 60 * 60 * 24 * 365
+SHORT = 60
+
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{12}\.')
+
+
+def load_brotli():
+    # brotli は任意で、使うのは collectstatic のときだけなので、ここで初めて import する（ワーカーの起動には不要）
+    try:
+        import brotli
+    except ImportError:  # 無ければ gzip のみ作る
+        return None
+    return brotli
+
+
+def compress(path):
+    """path の gzip / brotli 版を作る。元より小さくならないものは作らない。"""
+    brotli = load_brotli()
+    with open(path, 'rb') as f:
+        data = f.read()
+    created = []
+    variants = [('.gz', lambda d: gzip.compress(d, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', lambda d: brotli.compress(d, quality=11)))
+    for suffix, encode in variants:
+        encoded = encode(data)
+        if len(encoded) < len(data):
+            with open(path + suffix, 'wb') as f:
+                f.write(encoded)
+            created.append(path + suffix)
+    return created
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage の後処理で、ハッシュ付きファイルの圧縮版も作る。"""
+
+    def stored_name(self, name):
+        # collectstatic 前（マニフェストが無い開発環境）はハッシュ無しの名前のまま返す
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        for name in set(self.hashed_files.values()):
+            if not name.endswith(COMPRESSIBLE_EXTENSIONS) or self.size(name) < MIN_COMPRESS_SIZE:
+                continue
+            for created in compress(self.path(name)):
+                yield name, created[len(self.location) + 1:], True
+
+
+def parse_accept_encoding(header):
+    """Accept-Encoding を {coding: q} にする。q が数値として読めない指定は無視する。"""
+    codings = {}
+    for item in cc_delim_re.split(header.strip()):
+        coding, *params = item.split(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = None
+        if q is not None:
+            codings[coding] = q
+    return codings
+
+
+class StaticFile:
+    def __init__(self, path):
+        self.path = path
+        stat = os.stat(path)
+        self.size = stat.st_size
+        self.last_modified = formatdate(stat.st_mtime, usegmt=True)
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.immutable = bool(HASHED_NAME_RE.search(os.path.basename(path)))
+        # (Content-Encoding, パス, サイズ)。優先する順
+        self.encodings = [(encoding, path + suffix, os.path.getsize(path + suffix))
+                          for encoding, suffix in (('br', '.br'), ('gzip', '.gz'))
+                          if os.path.exists(path + suffix)]
+
+    def select(self, accept_encoding):
+        """q が最も大きい圧縮版（同じなら br を優先）。q=0 で断られたものは返さず、無ければ元のファイル。"""
+        codings = parse_accept_encoding(accept_encoding)
+        default = codings.get('*', 0)
+        best, best_q = None, 0
+        for encoding, path, size in self.encodings:
+            q = codings.get(encoding, default)
+            if q > best_q:
+                best, best_q = (encoding, path, size), q
+        return best or (None, self.path, self.size)
+
+
+class StaticFilesMiddleware:
+    """STATIC_URL 以下を STATIC_ROOT から返す（セッション等のミドルウェアより前に置く）。"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = '/' + settings.STATIC_URL.lstrip('/')
+        self.root = settings.STATIC_ROOT
+        self.enabled = getattr(settings, 'SERVE_STATIC_FILES', True) and bool(self.root)
+        self.files = None
+
+    def load_files(self):
+        # 起動後最初のリクエストで STATIC_ROOT を1回だけ走査する（collectstatic 後は再起動が前提）
+        files = {}
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith(('.gz', '.br')):
+                    continue
+                path = os.path.join(directory, name)
+                url = self.prefix + os.path.relpath(path, self.root).replace(os.sep, '/')
+                files[url] = StaticFile(path)
+        return files
+
+    def __call__(self, request):
+        if not self.enabled or not request.path.startswith(self.prefix):
+            return self.get_response(request)
+        if self.files is None:
+            self.files = self.load_files() if os.path.isdir(self.root) else {}
+        static_file = self.files.get(request.path)
+        if static_file is None or request.method not in ('GET', 'HEAD'):
+            return self.get_response(request)
+        return self.serve(request, static_file)
+
+    def serve(self, request, static_file):
+        if self.not_modified(request, static_file):
+            response = HttpResponseNotModified()
+        else:
+            encoding, path, size = static_file.select(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+            if request.method == 'HEAD':
+                response = HttpResponse(content_type=static_file.content_type)
+            else:
+                response = FileResponse(open(path, 'rb'), content_type=static_file.content_type)
+            response['Content-Length'] = size
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['Last-Modified'] = static_file.last_modified
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if static_file.immutable:
+            response['Cache-Control'] = f'public, max-age={FOREVER}, immutable'
+        else:
+            response['Cache-Control'] = f'public, max-age={SHORT}'
+        return response
+
+    @staticmethod
+    def not_modified(request, static_file):
+        since = request.META.get('HTTP_IF_MODIFIED_SINCE')
+        if not since:
+            return False
+        try:
+            return parsedate_to_datetime(since) >= parsedate_to_datetime(static_file.last_modified)
+        except (TypeError, ValueError):
+            return False
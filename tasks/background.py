@@ -0,0 +1,72 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from . import metrics
+
+# === コミット後のバックグラウンド処理 ===
+# ジョブキューは使わず、コミット後にプロセス内のスレッドプール（BACKGROUND_TASKS_WORKERS 本）で実行して
+# リクエストを待たせない。スレッド数を絞るのは、SQLite では書き込みが1本ずつしか進まず、
+# ジョブが増えるほどリクエストの書き込みとロックを取り合うため。
+# ワーカーの終了時は drain() でキューに残ったジョブを実行し終えてから終了する（gunicorn.conf.py の worker_exit）。
+# BACKGROUND_TASKS_SYNC = True の場合はコミット直後に同じスレッドで実行する（テスト・計測用）。
+
+logger = logging.getLogger(__name__)
+
+_pool = {'pid': None, 'executor': None}
+_pool_lock = threading.Lock()
+
+
+def _executor():
+    # fork した子プロセスには親のスレッドが無いので、プロセスごとに作り直す
+    pid = os.getpid()
+    if _pool['pid'] != pid:
+        with _pool_lock:
+            if _pool['pid'] != pid:
+                _pool['executor'] = ThreadPoolExecutor(max_workers=getattr(settings, 'BACKGROUND_TASKS_WORKERS', 1),
+                                                       thread_name_prefix='background')
+                _pool['pid'] = pid
+    return _pool['executor']
+
+
+def _run_counted(func, args):
+    try:
+        func(*args)
+    except Exception:
+        metrics.BACKGROUND_JOBS.inc('failed')
+        logger.exception('background job %s failed', func.__qualname__)
+        raise
+    metrics.BACKGROUND_JOBS.inc('finished')
+
+
+def _run_in_pool(func, args):
+    try:
+        _run_counted(func, args)
+    except Exception:
+        pass  # ログとメトリクスには記録済み
+    finally:
+        connection.close()
+
+
+def run_after_commit(func, *args):
+    def start():
+        metrics.BACKGROUND_JOBS.inc('started')
+        if getattr(settings, 'BACKGROUND_TASKS_SYNC', False):
+            _run_counted(func, args)
+        else:
+            _executor().submit(_run_in_pool, func, args)
+
+    transaction.on_commit(start)
+
+
+def drain():
+    """キューに残ったジョブをすべて実行し終えるまで待つ（プロセスの終了前に呼ぶ）。"""
+    with _pool_lock:
+        executor = _pool['executor'] if _pool['pid'] == os.getpid() else None
+        _pool['pid'] = _pool['executor'] = None
+    if executor is not None:
+        executor.shutdown(wait=True)
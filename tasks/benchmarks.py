@@ -0,0 +1,807 @@
+import gzip
+import random
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.staticfiles import finders
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import (Task, TaskAssignment, SubTask, Notification, Comment, ChatThread, Profile, Invitation,
+                     ActivityEvent, TaskDailyStat, ThreadReadCursor)
+from . import ranking, wbs, notifications, invitations, activity, chat, startup, kanban, concurrency, metrics, background
+
+# === ベンチマーク ===
+# manage.py benchmark <名前> で実行する。各シナリオはロールバックされるトランザクション内で動く（transactional=False を除く）
+
+BENCHMARKS = {}
+
+
+def benchmark(name, transactional=True):
+    # transactional=False のシナリオ（複数スレッドから書き込むもの）はロールバックせずに実行するので、
+    # 作ったデータは自分で消す
+    def register(func):
+        func.transactional = transactional
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+@contextmanager
+def measure(results, label, count=1):
+    with CaptureQueriesContext(connection) as ctx:
+        start = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - start
+    results.append({'label': label, 'seconds': elapsed, 'queries': len(ctx), 'count': count})
+
+
+def make_user(username):
+    return User.objects.create_user(username, f'{username}@example.com', 'benchmark-password')
+
+
+# --- 並び替え: 分数ランク vs 全件振り直し ---
+
+@benchmark('reorder')
+def bench_reorder(results, size=1000, moves=50, seed=0):
+    rng = random.Random(seed)
+    owner = make_user('bench_reorder')
+    task = Task.objects.create(title='reorder', user=owner)
+    SubTask.objects.bulk_create(
+        [SubTask(task=task, title=f'sub {i}', rank=rank) for i, rank in enumerate(ranking.spread(size))])
+
+    # 画面側が持っている並び順を模して、前後のIDはメモリ上の一覧から取る
+    order = list(SubTask.objects.filter(task=task).values_list('id', flat=True))
+    with measure(results, f'fractional rank move ({size} items)', moves):
+        for _ in range(moves):
+            moved, target = rng.sample(range(size), 2)
+            moved_id = order.pop(moved)
+            order.insert(target, moved_id)
+            before_id = order[target - 1] if target > 0 else None
+            after_id = order[target + 1] if target + 1 < size else None
+            neighbors = dict(SubTask.objects.filter(id__in=[i for i in (before_id, after_id) if i])
+                             .values_list('id', 'rank'))
+            rank = ranking.rank_between(neighbors.get(before_id), neighbors.get(after_id))
+            SubTask.objects.filter(id=moved_id).update(rank=rank)
+            if ranking.needs_rebalance(rank):
+                ranking.rebalance(SubTask.objects.filter(task=task), 'rank')
+
+    # 比較用: 整数の位置を持ち、移動のたびに全行の位置を書き直す方式
+    rows = list(SubTask.objects.filter(task=task))
+    with measure(results, f'renumber all rows ({size} items)', moves):
+        for _ in range(moves):
+            moved, target = rng.sample(range(size), 2)
+            rows.insert(target, rows.pop(moved))
+            for position, row in enumerate(rows):
+                row.rank = f'{position:08d}'
+            SubTask.objects.bulk_update(rows, ['rank'], batch_size=500)
+
+    with measure(results, f'rebalance ({size} items)'):
+        ranking.rebalance(SubTask.objects.filter(task=task), 'rank')
+
+
+# --- 階層WBS: 部分木取得と進捗の積み上げ ---
+
+@benchmark('wbs_tree')
+def bench_wbs_tree(results, fanout=10, levels=4, toggles=200, seed=0):
+    rng = random.Random(seed)
+    owner = make_user('bench_wbs')
+    task = Task.objects.create(title='wbs', user=owner)
+
+    # 階層ごとに bulk_create し、最後に path と集計値をまとめて作る
+    parents = [None]
+    total = 0
+    with measure(results, 'build tree'):
+        for _ in range(levels):
+            level = []
+            for parent in parents:
+                level += [SubTask(task=task, parent=parent, title=f'node {total + i}', rank=rank, is_done=rng.random() < 0.3)
+                          for i, rank in enumerate(ranking.spread(fanout))]
+                total += fanout
+            parents = SubTask.objects.bulk_create(level, batch_size=500)
+        wbs.rebuild(task)
+    results[-1]['label'] = f'build tree ({total} nodes)'
+
+    with measure(results, 'load whole tree (1 query)'):
+        wbs.load_tree(task)
+
+    root = SubTask.objects.filter(task=task, parent=None).first()
+    with measure(results, 'load one subtree (1 query)'):
+        wbs.load_tree(task, root=root)
+
+    with measure(results, 'task.progress_percent() from rollup', 100):
+        for _ in range(100):
+            Task.objects.get(id=task.id).progress_percent()
+
+    leaves = list(SubTask.objects.filter(task=task, depth=levels - 1))
+    with measure(results, 'toggle leaf with incremental rollup', toggles):
+        for _ in range(toggles):
+            wbs.toggle_subtask(rng.choice(leaves))
+
+    # 比較用: リクエストごとに子を1階層ずつ辿って進捗を数える方式
+    def walk(node_ids):
+        leaf = done = 0
+        for node in SubTask.objects.filter(id__in=node_ids):
+            children = list(node.children.values_list('id', flat=True))
+            if children:
+                l, d = walk(children)
+                leaf += l
+                done += d
+            else:
+                leaf += 1
+                done += node.is_done
+        return leaf, done
+
+    with measure(results, 'subtree progress from rollup'):
+        SubTask.objects.values_list('leaf_count', 'done_count').get(id=root.id)
+
+    with measure(results, 'subtree progress by naive recursive walk'):
+        walk([root.id])
+
+
+# --- 通知のファンアウト ---
+
+@benchmark('notifications')
+def bench_notifications(results, members=500, messages=10):
+    owner = make_user('bench_notify_owner')
+    task = Task.objects.create(title='notify', user=owner)
+    users = User.objects.bulk_create(
+        [User(username=f'bench_notify_{i}', email=f'bench_notify_{i}@example.com') for i in range(members)])
+    recipient_ids = [user.id for user in users]
+
+    with measure(results, f'fan-out to {members} members (insert)'):
+        notifications._fan_out(recipient_ids, 'message', 'message:bench', 'new message', task.id, owner.id)
+
+    with measure(results, f'fan-out to {members} members (coalesced)', messages):
+        for i in range(messages):
+            notifications._fan_out(recipient_ids, 'message', 'message:bench', f'new message {i}', task.id, owner.id)
+
+    # 比較用: メンバーごとに1行ずつ作る方式
+    with measure(results, f'per-member create ({members} members)', messages):
+        for i in range(messages):
+            for user_id in recipient_ids:
+                Notification.objects.create(recipient_id=user_id, actor_id=owner.id, task=task, kind='message',
+                                            group_key=f'plain:{i}', message=f'new message {i}')
+
+
+# --- セッション: 1リクエストあたりの読み書き ---
+
+@benchmark('sessions')
+def bench_sessions(results, requests=500):
+    engines = {
+        'db': 'django.contrib.sessions.backends.db',
+        'cached_db': 'django.contrib.sessions.backends.cached_db',
+        'cache': 'django.contrib.sessions.backends.cache',
+        'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+    }
+    for mode, engine in engines.items():
+        store_class = import_module(engine).SessionStore
+        session = store_class()
+        session['_auth_user_id'] = '1'
+        session.save()
+        # signed_cookies はセッションキーそのものが Cookie の中身
+        key = session.session_key
+
+        with measure(results, f'{mode}: read per request', requests):
+            for _ in range(requests):
+                store_class(key).get('_auth_user_id')
+
+        with measure(results, f'{mode}: read + write per request', requests):
+            for i in range(requests):
+                store = store_class(key)
+                store['last_seen'] = i
+                store.save()
+                key = store.session_key
+
+
+# --- 静的ファイル: ボード1画面あたりの転送量 ---
+
+ASSET_RE = re.compile(r'<(?:link[^>]+href|script[^>]+src)="([^"]+)"')
+
+
+@benchmark('assets')
+def bench_assets(results, tasks=30):
+    from django.test import Client
+
+    user = make_user('bench_assets')
+    for i in range(tasks):
+        task = Task.objects.create(title=f'タスク {i}', description='説明' * 20, user=user)
+        TaskAssignment.objects.create(task=task, user=user)
+    client = Client()
+    client.force_login(user)
+
+    with measure(results, 'board view render'):
+        html = client.get(reverse('board')).content
+    # ページが参照している自前の CSS/JS（CDN は除く）
+    assets = []
+    for url in ASSET_RE.findall(html.decode()):
+        if url.startswith(settings.STATIC_URL) or url.startswith('/' + settings.STATIC_URL):
+            name = url.split(settings.STATIC_URL, 1)[1]
+            path = finders.find(re.sub(r'\.[0-9a-f]{12}(\.\w+)$', r'\1', name))
+            with open(path, 'rb') as f:
+                assets.append(f.read())
+
+    def gz(data):
+        return len(gzip.compress(data))
+
+    asset_bytes = b''.join(assets)
+    # 抽出前は同じ CSS/JS が毎回 HTML に埋め込まれていた
+    results.append({'label': 'inline styles/scripts (every view, raw)', 'bytes': len(html + asset_bytes)})
+    results.append({'label': 'inline styles/scripts (every view, gzip)', 'bytes': gz(html + asset_bytes)})
+    results.append({'label': 'first view: html + assets (gzip)', 'bytes': gz(html) + sum(gz(a) for a in assets)})
+    results.append({'label': 'repeat view: html only (raw)', 'bytes': len(html)})
+    results.append({'label': 'repeat view: html only (gzip)', 'bytes': gz(html)})
+
+
+# --- テンプレート: タスク詳細ページの描画 ---
+
+@contextmanager
+def block_timer(timings, calls):
+    """include / inclusion_tag の描画時間をテンプレート名ごとに合計する（再帰は一番外側だけ数える）。"""
+    from django.template.library import InclusionNode
+    from django.template.loader_tags import IncludeNode
+
+    active = set()
+
+    def wrap(original, name_of):
+        def render(node, context):
+            name = name_of(node, context)
+            if name in active:
+                return original(node, context)
+            active.add(name)
+            start = time.perf_counter()
+            try:
+                return original(node, context)
+            finally:
+                active.discard(name)
+                timings[name] += time.perf_counter() - start
+                calls[name] += 1
+        return render
+
+    originals = (IncludeNode.render, InclusionNode.render)
+    IncludeNode.render = wrap(IncludeNode.render, lambda node, context: str(node.template.resolve(context)))
+    InclusionNode.render = wrap(InclusionNode.render, lambda node, context: node.filename)
+    try:
+        yield
+    finally:
+        IncludeNode.render, InclusionNode.render = originals
+
+
+@benchmark('task_page')
+def bench_task_page(results, members=300, comments=5000, seed=0):
+    from django.template import engines
+    from django.test import Client
+
+    rng = random.Random(seed)
+    owner = make_user('bench_task_page')
+    task = Task.objects.create(title='描画ベンチマーク', description='テンプレート描画の計測用', user=owner)
+    User.objects.bulk_create([User(username=f'bench_member_{i}', password='!') for i in range(members)])
+    users = [owner] + list(User.objects.filter(username__startswith='bench_member_'))
+    Profile.objects.bulk_create([Profile(user=user, bio=f'{user.username} の自己紹介') for user in users[::2]])
+    TaskAssignment.objects.bulk_create(
+        [TaskAssignment(task=task, user=user, status=rng.choice(('todo', 'doing', 'done')),
+                        role_name=rng.choice(('', '', 'デザイン', '実装', 'レビュー')))
+         for user in users])
+    threads = ChatThread.objects.bulk_create([ChatThread(task=task, name=name) for name in ('メイン', '設計', '雑談')])
+    Comment.objects.bulk_create(
+        [Comment(task=task, user=rng.choice(users), thread=rng.choice(threads), content=f'メッセージ {i}\n進捗を共有します',
+                 message_type='report_done' if i % 50 == 0 else 'normal')
+         for i in range(comments)], batch_size=1000)
+
+    client = Client()
+    client.force_login(owner)
+    url = reverse('task_edit', kwargs={'pk': task.id})
+    client.get(url)
+
+    with measure(results, f'task page GET ({members} members, {comments} comments)'):
+        client.get(url)
+
+    timings, calls = Counter(), Counter()
+    with block_timer(timings, calls):
+        client.get(url)
+    for name, seconds in timings.most_common():
+        results.append({'label': f'  block {name} x{calls[name]}', 'seconds': seconds, 'queries': 0, 'count': 1})
+
+    # キャッシュ付きローダー: 解析済みテンプレートの再利用 vs 毎回の読み込み・解析
+    engine = engines['django'].engine
+    loops = 50
+    with measure(results, 'get_template task_form.html (cached loader)', loops):
+        for _ in range(loops):
+            engine.get_template('tasks/task_form.html')
+    with measure(results, 'get_template task_form.html (parse every time)', loops):
+        for _ in range(loops):
+            for loader in engine.template_loaders:
+                if hasattr(loader, 'reset'):
+                    loader.reset()
+            engine.get_template('tasks/task_form.html')
+
+
+# --- 招待: 1,000人の一括招待 ---
+
+@benchmark('invites')
+def bench_invites(results, users=1000, accepts=100):
+    sender = make_user('bench_invites')
+    User.objects.bulk_create([User(username=f'bench_invitee_{i}', email=f'invitee{i}@example.com', password='!')
+                              for i in range(users)])
+    invitees = list(User.objects.filter(username__startswith='bench_invitee_').order_by('id'))
+    # 半分はユーザー名、半分はメールアドレスで指定する
+    identifiers = [user.username if i % 2 else user.email for i, user in enumerate(invitees)]
+
+    def prepare(title):
+        # 1割は参加済み、1割は招待済みの状態から始める
+        task = Task.objects.create(title=title, user=sender)
+        TaskAssignment.objects.bulk_create([TaskAssignment(task=task, user=user) for user in invitees[:users // 10]])
+        Invitation.objects.bulk_create([Invitation(task=task, sender=sender, recipient=user)
+                                        for user in invitees[users // 10:users // 5]])
+        return task
+
+    task = prepare('bulk')
+    with measure(results, f'bulk invite ({users} users)'):
+        result = invitations.bulk_invite(task, sender, identifiers)
+    assert len(result.invited) == users - users // 5
+
+    with measure(results, 'bulk invite again (all skipped)'):
+        invitations.bulk_invite(task, sender, identifiers)
+
+    # 比較用: 1人ずつ解決・確認・作成する（従来の invite_user 相当）
+    task = prepare('one by one')
+    with measure(results, f'one-by-one invite ({users} users)', users):
+        for user in invitees:
+            recipient = User.objects.get(username=user.username)
+            if TaskAssignment.objects.filter(task=task, user=recipient).exists():
+                continue
+            if Invitation.objects.filter(task=task, recipient=recipient, status='pending').exists():
+                continue
+            Invitation.objects.create(task=task, sender=sender, recipient=recipient, status='pending')
+
+    pending = list(Invitation.objects.filter(task=task, status='pending').select_related('recipient')[:accepts])
+    with measure(results, 'accept invitation', accepts):
+        for invitation in pending:
+            invitations.accept(invitation.id, invitation.recipient)
+    with measure(results, 'accept again (idempotent)', accepts):
+        for invitation in pending:
+            invitations.accept(invitation.id, invitation.recipient)
+
+
+# --- アクティビティ: 書き込みコストと日次集計の読み出し ---
+
+@benchmark('activity')
+def bench_activity(results, members=50, days=90, events_per_day=100, writes=200, seed=0):
+    from datetime import timedelta
+    from django.utils import timezone
+
+    rng = random.Random(seed)
+    owner = make_user('bench_activity')
+    task = Task.objects.create(title='activity', user=owner)
+    User.objects.bulk_create([User(username=f'bench_actor_{i}', password='!') for i in range(members)])
+    users = list(User.objects.filter(username__startswith='bench_actor_'))
+    TaskAssignment.objects.bulk_create([TaskAssignment(task=task, user=user) for user in users])
+    assignments = list(TaskAssignment.objects.filter(task=task))
+
+    # 過去 days 日分のイベントと、それに対応する日次集計を用意する
+    now = timezone.now()
+    statuses = ('todo', 'doing', 'done')
+    events, stats = [], []
+    for offset in range(days, 0, -1):
+        at = now - timedelta(days=offset)
+        for _ in range(events_per_day):
+            old, new = rng.sample(statuses, 2)
+            events.append(ActivityEvent(task=task, actor=owner, kind='status', subject_id=rng.choice(assignments).id,
+                                        old_value=old, new_value=new, created_at=at))
+        stats.append(TaskDailyStat(task=task, day=timezone.localdate(at), todo=rng.randint(0, members),
+                                   subtask_leaf_count=100, subtask_done_count=min(100, days - offset)))
+    ActivityEvent.objects.bulk_create(events, batch_size=1000)
+    TaskDailyStat.objects.bulk_create(stats)
+
+    # 書き込み: ステータス更新 + イベント追記（集計の更新はコミット後のバックグラウンド）
+    with measure(results, 'status update + event (request path)', writes):
+        for _ in range(writes):
+            assignment = rng.choice(assignments)
+            old_status, assignment.status = assignment.status, rng.choice(statuses)
+            assignment.save(update_fields=['status'])
+            activity.record(task.id, owner, 'status', assignment.id, old_status, assignment.status)
+    with measure(results, 'daily bucket refresh (background)'):
+        activity.refresh_day(task.id, timezone.localdate())
+
+    with measure(results, f'timeline from daily buckets ({days} days)'):
+        activity.timeline(task.id, days)
+
+    # 比較用: イベントを全件走査して日ごとの件数を数える
+    with measure(results, f'timeline by scanning events ({len(events)} events)'):
+        per_day = {}
+        for event in ActivityEvent.objects.filter(task=task).order_by('created_at').iterator():
+            counts = per_day.setdefault(timezone.localdate(event.created_at), Counter())
+            counts[event.old_value] -= 1
+            counts[event.new_value] += 1
+
+
+# --- チャット: 未読数（通し番号の引き算 vs COUNT）とスレッド内検索 ---
+
+@benchmark('chat')
+def bench_chat(results, threads=20, messages=20000, posts=200, seed=0):
+    rng = random.Random(seed)
+    owner = make_user('bench_chat')
+    reader = make_user('bench_chat_reader')
+    task = Task.objects.create(title='chat', user=owner)
+    ChatThread.objects.bulk_create([ChatThread(task=task, name=f'thread {i}') for i in range(threads)])
+    chat_threads = list(ChatThread.objects.filter(task=task).order_by('id'))
+    words = ('進捗', '確認', 'レビュー', '資料', '締切', 'デプロイ', '修正', '会議')
+
+    # 1スレッドに messages 件、他のスレッドに少しずつ
+    big = chat_threads[0]
+    comments = [Comment(task=task, user=owner, thread=big, seq=seq, content=f'{rng.choice(words)} {rng.choice(words)} #{seq}')
+                for seq in range(1, messages + 1)]
+    for thread in chat_threads[1:]:
+        comments += [Comment(task=task, user=owner, thread=thread, seq=seq, content=f'{rng.choice(words)} #{seq}')
+                     for seq in range(1, 101)]
+    Comment.objects.bulk_create(comments, batch_size=1000)
+    ChatThread.objects.filter(id=big.id).update(last_seq=messages)
+    ChatThread.objects.filter(task=task).exclude(id=big.id).update(last_seq=100)
+    # 既読は半分まで
+    ThreadReadCursor.objects.bulk_create([
+        ThreadReadCursor(user=reader, thread=thread, last_read_seq=(messages if thread.id == big.id else 100) // 2)
+        for thread in chat_threads])
+
+    with measure(results, f'unread via last_seq - cursor ({threads} threads)'):
+        unread = {thread.id: thread.unread for thread in chat.threads_with_unread(task, reader)}
+    with measure(results, 'unread via COUNT(seq > cursor) per thread'):
+        cursors = dict(ThreadReadCursor.objects.filter(user=reader, thread__task=task)
+                       .values_list('thread_id', 'last_read_seq'))
+        counted = {thread.id: Comment.objects.filter(thread=thread, seq__gt=cursors.get(thread.id, 0)).count()
+                   for thread in chat_threads}
+    with measure(results, 'unread via COUNT(created_at > read_at) (no cursor seq)'):
+        read_at = Comment.objects.filter(thread=big, seq=messages // 2).values_list('created_at', flat=True).get()
+        Comment.objects.filter(thread=big, created_at__gt=read_at).count()
+    assert unread == counted
+
+    with measure(results, 'post message (seq + cursor)', posts):
+        for i in range(posts):
+            chat.post_comment(big, task=task, user=owner, content=f'追加 {i}')
+
+    with measure(results, f'search in thread ({messages} messages, limit {chat.SEARCH_LIMIT})'):
+        first = chat.search(big, 'レビュー')
+    with measure(results, 'search next page (keyset before=seq)'):
+        chat.search(big, 'レビュー', before=first[-1].seq)
+    with measure(results, 'search unscoped (task comments, no limit)'):
+        list(Comment.objects.filter(task=task, content__icontains='レビュー').select_related('user').order_by('-id'))
+    with measure(results, 'mark read', posts):
+        for i in range(posts):
+            chat.mark_read(reader, big, messages // 2 + i)
+
+
+# --- 起動: 新しいプロセスでアプリを読み込むまでの時間 ---
+
+STARTUP_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+from kanban_project.wsgi import application
+imported = time.perf_counter()
+from kanban_project.serving import warm_up
+warm_up()
+warmed = time.perf_counter()
+from wsgiref.util import setup_testing_defaults
+environ = {'PATH_INFO': '/healthz/'}
+setup_testing_defaults(environ)
+b''.join(application(environ, lambda status, headers: None))
+served = time.perf_counter()
+json.dump({'import': imported - start, 'warm_up': warmed - imported, 'first_request': served - warmed}, sys.stdout)
+'''
+
+
+def run_cold_start(runs):
+    """新しいインタープリタで wsgi を読み込み、各段階の時間（秒）を runs 回分合計して返す。"""
+    import json
+    import subprocess
+    import sys
+
+    totals = Counter()
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], cwd=settings.BASE_DIR, check=True,
+                                capture_output=True, text=True).stdout
+        totals['process'] += time.perf_counter() - start
+        totals.update(json.loads(output))
+    return totals
+
+
+@benchmark('startup')
+def bench_startup(results, runs=5, requests=500):
+    from django.test import Client
+
+    totals = run_cold_start(runs)
+    for key, label in (('process', 'cold process (interpreter to first response)'),
+                       ('import', '  import kanban_project.wsgi'),
+                       ('warm_up', '  warm_up (urls, views, templates)'),
+                       ('first_request', '  first request (/healthz/)')):
+        results.append({'label': label, 'seconds': totals[key], 'queries': 0, 'count': runs})
+
+    # import の内訳（python -X importtime）。バイトコードが無いとプロジェクトの分はコンパイル込みになる
+    entries = startup.import_profile('kanban_project.wsgi', warm=True)
+    packages = startup.by_package(entries)
+    project = sum(packages[name] for name in startup.PROJECT_PACKAGES)
+    for label, us in (('importtime: total', startup.total_us(entries)),
+                      ('importtime: django', packages['django']),
+                      ('importtime: project (kanban_project, tasks)', project),
+                      ('importtime: everything else', startup.total_us(entries) - packages['django'] - project)):
+        results.append({'label': label, 'seconds': us / 1e6, 'queries': 0, 'count': 1})
+
+    # ヘルスチェックはセッション等のミドルウェアを通らない
+    client = Client()
+    with measure(results, 'liveness /healthz/', requests):
+        for _ in range(requests):
+            client.get('/healthz/')
+    with measure(results, 'readiness /readyz/ (SELECT 1)', requests):
+        for _ in range(requests):
+            client.get('/readyz/')
+    with measure(results, 'anonymous page via full middleware (redirect)', requests):
+        for _ in range(requests):
+            client.get(reverse('board'))
+
+
+# --- 楽観的排他制御: 読み込み→save() と条件付き UPDATE の比較（複数スレッド） ---
+
+def legacy_toggle(subtask_id):
+    legacy_flip(SubTask.objects.get(id=subtask_id))
+
+
+def legacy_flip(subtask):
+    # 変更前の実装: 読み込んだ is_done を Python で反転して行全体を保存する
+    with transaction.atomic():
+        if subtask.children.exists():
+            raise ValueError('only leaf subtasks can be toggled')
+        subtask.is_done = not subtask.is_done
+        subtask.save()
+        wbs._rollup(subtask.task_id, wbs.path_ids(subtask.path), 0, 1 if subtask.is_done else -1)
+
+
+def versioned_toggle(subtask_id):
+    try:
+        wbs.toggle_subtask(SubTask.objects.get(id=subtask_id))
+    except concurrency.Conflict:
+        return 'conflict'
+
+
+def legacy_status(assignment_id, status):
+    assignment = TaskAssignment.objects.get(id=assignment_id)
+    assignment.status = status
+    assignment.save()
+
+
+def versioned_status(assignment_id, status):
+    try:
+        kanban.update_status(assignment_id, status)
+    except concurrency.Conflict:
+        return 'conflict'
+
+
+def run_threads(threads, ops, work):
+    """threads 本のスレッドで work(rng) を ops 回ずつ実行し、(経過秒, 結果ごとの件数) を返す。"""
+    import threading
+    from django.db import IntegrityError, OperationalError
+
+    outcomes = Counter()
+    lock = threading.Lock()
+
+    def worker(index):
+        rng = random.Random(index)
+        local = Counter()
+        try:
+            for _ in range(ops):
+                try:
+                    local[work(rng) or 'ok'] += 1
+                except OperationalError:  # SQLite の database is locked（読んだ後に書き込もうとしてロックを取れない）
+                    local['locked'] += 1
+                except IntegrityError:  # 集計値が負になるなど、ずれた差分を積み上げた
+                    local['integrity'] += 1
+        finally:
+            connection.close()
+        with lock:
+            outcomes.update(local)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - start, outcomes
+
+
+@benchmark('concurrency', transactional=False)
+def bench_concurrency(results, leaves=4, threads=8, ops=50, single=200):
+    from django.test import override_settings
+
+    if connection.vendor == 'sqlite' and connection.settings_dict['NAME'] == ':memory:':
+        raise RuntimeError('the concurrency benchmark needs a database file shared between threads')
+    # 準備中のサブタスク追加が積むコミット後の処理（日次集計）をスレッドプールに残さない。
+    # 計測中に別スレッドが書き込むと結果が揺れるので、このシナリオではコミット直後に同じスレッドで実行する
+    background.drain()
+    with override_settings(BACKGROUND_TASKS_SYNC=True):
+        _run_concurrency(results, leaves, threads, ops, single)
+
+
+def _run_concurrency(results, leaves, threads, ops, single):
+    owner = make_user('bench_concurrency')
+    try:
+        task = Task.objects.create(title='concurrency', user=owner)
+        assignment = TaskAssignment.objects.create(task=task, user=owner)
+        root = wbs.add_subtask(task, 'root')
+        leaf_ids = [wbs.add_subtask(task, f'leaf {i}', root).id for i in range(leaves)]
+
+        def drift():
+            task.refresh_from_db(fields=['subtask_done_count'])
+            return task.subtask_done_count - SubTask.objects.filter(task=task, is_done=True).exclude(id=root.id).count()
+
+        # 1スレッドでのクエリ数（ビューと同じく1件の読み込みから。トランザクションの外なので BEGIN/COMMIT も数える）
+        with measure(results, 'toggle: load + flip + save() (single thread)', single):
+            for i in range(single):
+                legacy_toggle(leaf_ids[i % leaves])
+        with measure(results, 'toggle: conditional UPDATE + version (single thread)', single):
+            for i in range(single):
+                versioned_toggle(leaf_ids[i % leaves])
+        # ビューと同じくリクエストのトランザクション内で切り替えたときの、切り替え自体の文の数。
+        # 読み込みは計測の外で済ませる（save() は行全体を書くので、各行を読み直して1回ずつ切り替える）
+        for label, toggle in (('flip + save()', legacy_flip), ('conditional UPDATE', wbs.toggle_subtask)):
+            loaded = list(SubTask.objects.filter(id__in=leaf_ids))
+            with transaction.atomic():
+                with measure(results, f'toggle inside a request transaction: {label}', leaves):
+                    for subtask in loaded:
+                        toggle(subtask)
+        with measure(results, 'status: load + save() (single thread)', single):
+            for i in range(single):
+                legacy_status(assignment.id, kanban.STATUSES[i % 3])
+        with measure(results, 'status: conditional UPDATE + version (single thread)', single):
+            for i in range(single):
+                versioned_status(assignment.id, kanban.STATUSES[i % 3])
+
+        # 同じ数件のサブタスクを複数スレッドから同時に切り替える。
+        # 読み込み→save() だと同じ値を読んだ2人がどちらも差分を積み上げ、集計がずれる
+        for label, toggle in (('load + save()', legacy_toggle), ('conditional UPDATE', versioned_toggle)):
+            wbs.rebuild(task)
+            seconds, outcomes = run_threads(threads, ops, lambda rng: toggle(rng.choice(leaf_ids)))
+            results.append({'label': f'toggle x{threads} threads, {label}: drift {drift()}, '
+                                     f"conflicts {outcomes['conflict']}, locked {outcomes['locked']}, "
+                                     f"integrity errors {outcomes['integrity']}",
+                            'seconds': seconds, 'queries': 0, 'count': threads * ops})
+        for label, update in (('load + save()', legacy_status), ('conditional UPDATE', versioned_status)):
+            seconds, outcomes = run_threads(threads, ops,
+                                            lambda rng: update(assignment.id, rng.choice(kanban.STATUSES)))
+            results.append({'label': f"status x{threads} threads, {label}: conflicts {outcomes['conflict']}, "
+                                     f"locked {outcomes['locked']}",
+                            'seconds': seconds, 'queries': 0, 'count': threads * ops})
+    finally:
+        Task.objects.filter(user=owner).delete()
+        owner.delete()
+
+
+# --- 期限カレンダー: 表示期間だけを (user, due_date) で引く vs 全件を読んで Python で振り分け ---
+
+@benchmark('calendar')
+def bench_calendar(results, tasks=10000, other_users=4, span_days=730, repeat=20, seed=0):
+    import json
+    from datetime import timedelta
+    from django.utils import timezone
+    from . import schedule
+
+    rng = random.Random(seed)
+    users = [make_user(f'bench_calendar_{i}') for i in range(other_users + 1)]
+    user = users[0]
+    now = timezone.now()
+    for owner in users:
+        created = Task.objects.bulk_create(
+            [Task(title=f'期限つきタスク {i}', user=owner, subtask_leaf_count=10, subtask_done_count=rng.randint(0, 10),
+                  due_date=now + timedelta(minutes=rng.randint(-span_days // 2 * 1440, span_days // 2 * 1440)))
+             for i in range(tasks)], batch_size=1000)
+        TaskAssignment.objects.bulk_create(
+            [TaskAssignment(task=task, user=owner, status=rng.choice(kanban.STATUSES), due_date=task.due_date,
+                            board_rank=f'{i:08d}') for i, task in enumerate(created)], batch_size=1000)
+    start, end = schedule.parse_window()
+
+    with measure(results, f'window {schedule.DEFAULT_DAYS} days, SQL day buckets (index)', repeat):
+        for _ in range(repeat):
+            days = schedule.due_calendar(user, start, end)
+    in_window = sum(len(items) for items in days.values())
+
+    with measure(results, 'window via Task.due_date join (no composite index)', repeat):
+        for _ in range(repeat):
+            list(Task.objects.filter(taskassignment__user=user,
+                                     due_date__gte=schedule.local_midnight(start),
+                                     due_date__lt=schedule.local_midnight(end + timedelta(days=1)))
+                 .order_by('due_date').values_list('id', 'due_date'))
+
+    # 比較用: ボードと同じく全件を期限順に読み、Python で現地の日付に振り分ける
+    with measure(results, f'all {tasks} tasks + Python bucketing', repeat):
+        for _ in range(repeat):
+            buckets = {}
+            for task in Task.objects.filter(taskassignment__user=user).order_by('due_date'):
+                day = timezone.localdate(task.due_date)
+                if start <= day <= end:
+                    buckets.setdefault(day.isoformat(), []).append(task)
+
+    compact = json.dumps({'fields': schedule.FIELDS, 'days': days}, ensure_ascii=False, separators=(',', ':'))
+    verbose = json.dumps({'days': {day: [dict(zip(schedule.FIELDS, item)) for item in items]
+                                   for day, items in days.items()}})
+    results.append({'label': f'payload, {in_window} tasks: compact arrays (utf-8)', 'bytes': len(compact.encode())})
+    results.append({'label': f'payload, {in_window} tasks: objects (ascii-escaped)', 'bytes': len(verbose.encode())})
+
+
+# --- メトリクス: 計測のオーバーヘッドと /metrics/ の集計 ---
+
+@benchmark('metrics')
+def bench_metrics(results, requests=500, threads=4, increments=50000, processes=8):
+    import json
+    import os
+    import shutil
+    import tempfile
+    import threading
+    from django.test import Client, override_settings
+    from django.urls import get_resolver
+
+    # 1リクエストあたりの計測コスト（ログインへのリダイレクトだけの軽いページで比べる）
+    without = [name for name in settings.MIDDLEWARE if name != 'tasks.metrics.MetricsMiddleware']
+    for label, middleware in (('request without MetricsMiddleware', without),
+                              ('request with MetricsMiddleware', settings.MIDDLEWARE)):
+        with override_settings(MIDDLEWARE=middleware):
+            client = Client()
+            client.get(reverse('board'))
+            with measure(results, label, requests):
+                for _ in range(requests):
+                    client.get(reverse('board'))
+
+    # カウンターの加算: スレッドごとの dict（ロックなし）と、共有の Counter をロックで守る場合
+    class LockedCounter:
+        def __init__(self):
+            self.values, self.lock = Counter(), threading.Lock()
+
+        def inc(self, *labels, amount=1):
+            with self.lock:
+                self.values[labels] += amount
+
+    def increment(counter):
+        for _ in range(increments):
+            counter.inc('board', 'GET', '200')
+
+    for label, counter in (('shared Counter + Lock', LockedCounter()),
+                           ('lock-free per-thread counters', metrics.RESPONSES)):
+        workers = [threading.Thread(target=increment, args=(counter,)) for _ in range(threads)]
+        with measure(results, f'{label}, {threads} threads', threads * increments):
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+
+    # URL 名すべてにリクエストがあった状態で /metrics/ を作る
+    names = [name for name in get_resolver().reverse_dict if isinstance(name, str)]
+    for name in names:
+        metrics.REQUEST_SECONDS.observe(0.02, name, 'GET')
+        metrics.RESPONSES.inc(name, 'GET', '200')
+        metrics.DB_QUERIES.inc(name, amount=5)
+        metrics.DB_SECONDS.inc(name, amount=0.004)
+    with measure(results, f'scrape, 1 process ({len(names)} URL names)', 100):
+        for _ in range(100):
+            body = metrics.render(metrics.collect())
+    results.append({'label': 'scrape size', 'bytes': len(body.encode())})
+
+    directory = tempfile.mkdtemp()
+    try:
+        with override_settings(METRICS_MULTIPROC_DIR=directory):
+            metrics.flush()
+            with open(f'{directory}/{os.getpid()}.json') as f:
+                rows = json.load(f)
+            for pid in range(1, processes):
+                with open(f'{directory}/{pid}.json', 'w') as f:
+                    json.dump(rows, f)
+            with measure(results, f'scrape, {processes} processes (files merged)', 100):
+                for _ in range(100):
+                    metrics.render(metrics.collect())
+            with measure(results, 'flush one process to file', 100):
+                for _ in range(100):
+                    metrics.flush()
+    finally:
+        shutil.rmtree(directory)
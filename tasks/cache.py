@@ -0,0 +1,185 @@
+import math
+import random
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# === 2段キャッシュ ===
+# プロセス内の小さな LRU（短い TTL）を共有キャッシュ（ファイル / Redis など）の前に置く。
+# 他プロセスでの削除はローカル層の TTL（LOCAL_TIMEOUT 秒）が切れるまで見えない点に注意。
+
+_MISSING = object()
+
+# プロセスごとのヒット/ミス数（監視用）
+STATS = Counter()
+
+
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = options.get('SHARED', 'shared')
+        self._local_max_entries = options.get('LOCAL_MAX_ENTRIES', 1000)
+        self._local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    # --- ローカル層 ---
+
+    def _local_get(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return _MISSING
+            expire_at, value = entry
+            if expire_at < time.monotonic():
+                del self._local[key]
+                return _MISSING
+            self._local.move_to_end(key)
+            return value
+
+    def _local_set(self, key, value, timeout):
+        ttl = self._local_timeout if timeout is None else min(timeout, self._local_timeout)
+        with self._lock:
+            self._local[key] = (time.monotonic() + ttl, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self._local_max_entries:
+                self._local.popitem(last=False)
+
+    def _local_delete(self, key):
+        with self._lock:
+            self._local.pop(key, None)
+
+    # --- Django のキャッシュAPI ---
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        value = self._local_get(local_key)
+        if value is not _MISSING:
+            STATS['local_hits'] += 1
+            return value
+        value = self.shared.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            STATS['misses'] += 1
+            return default
+        STATS['shared_hits'] += 1
+        self._local_set(local_key, value, None)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        timeout = self.get_backend_timeout(timeout)
+        self.shared.set(key, value, timeout, version=version)
+        if timeout is None or timeout > 0:
+            self._local_set(local_key, value, timeout)
+        else:
+            self._local_delete(local_key)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if self.shared.add(key, value, timeout, version=version):
+            self._local_delete(self.make_and_validate_key(key, version=version))
+            return True
+        return False
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._local_delete(self.make_and_validate_key(key, version=version))
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._local_delete(self.make_and_validate_key(key, version=version))
+        return self.shared.delete(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self._local_delete(self.make_and_validate_key(key, version=version))
+        return self.shared.incr(key, delta, version=version)
+
+    def has_key(self, key, version=None):
+        return self.get(key, _MISSING, version=version) is not _MISSING
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+        self.shared.clear()
+
+    def get_backend_timeout(self, timeout=DEFAULT_TIMEOUT):
+        # BaseCache は有効期限の時刻を返す。ここでは共有層に渡す秒数のまま扱う
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        return timeout
+
+
+def stats():
+    hits = STATS['local_hits'] + STATS['shared_hits']
+    total = hits + STATS['misses']
+    return {**{key: STATS[key] for key in ('local_hits', 'shared_hits', 'misses')},
+            'hit_ratio': round(hits / total, 4) if total else None}
+
+
+# === 名前空間つきのキー ===
+# 名前空間（task / board / profile / invitation）とスコープ（ユーザーIDなど）ごとに
+# バージョン番号を持ち、無効化はバージョンを上げるだけで古いキーをまとめて捨てる。
+# バージョンのキーもデータと同じ上限つきのキャッシュにあり、追い出されることがある。
+# 1 から振り直すと過去のバージョンのキーが生き返るので、初期値は現在時刻（マイクロ秒）にする。
+# 無効化 1 回で 1 しか増えないため、追い出し後に振り直した値は過去のどのバージョンよりも大きい。
+
+NAMESPACES = ('task', 'board', 'profile', 'invitation')
+
+
+def _initial_version():
+    return time.time_ns() // 1000
+
+
+def _version_key(namespace, scope):
+    if namespace not in NAMESPACES:
+        raise ValueError(f'unknown cache namespace: {namespace}')
+    return f'ns:{namespace}:{scope}'
+
+
+def namespace_version(namespace, scope):
+    cache = caches['default']
+    key = _version_key(namespace, scope)
+    version = cache.get(key)
+    if version is None:
+        initial = _initial_version()
+        cache.add(key, initial, None)
+        version = cache.get(key) or initial
+    return version
+
+
+def make_key(namespace, scope, *parts):
+    version = namespace_version(namespace, scope)
+    return ':'.join([namespace, str(scope), f'v{version}', *map(str, parts)])
+
+
+def invalidate(namespace, scope):
+    cache = caches['default']
+    key = _version_key(namespace, scope)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # 追い出された（またはまだ無い）場合も、振り直した値が新しいバージョンになる
+        cache.set(key, _initial_version(), None)
+
+
+def get_or_compute(key, compute, timeout=300, beta=1.0):
+    """期限切れ間際に確率的に早めに再計算し、同時に大量のリクエストが再計算に殺到するのを防ぐ。"""
+    cache = caches['default']
+    entry = cache.get(key)
+    now = time.time()
+    if entry is not None:
+        value, delta, expire_at = entry
+        # 再計算にかかった時間が長いほど、期限より早めに再計算しやすくする
+        if now - delta * beta * math.log(random.random() or 1e-12) < expire_at:
+            return value
+    start = time.time()
+    value = compute()
+    delta = time.time() - start
+    cache.set(key, (value, delta, time.time() + timeout), timeout)
+    return value
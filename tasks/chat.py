@@ -0,0 +1,50 @@
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import ChatThread, Comment, ThreadReadCursor
+
+# === チャット: 既読位置と検索 ===
+# メッセージにはスレッド内の通し番号 seq を振り、スレッドは最後の番号 last_seq を持つ。
+# 未読数は last_seq - 既読位置 の引き算だけで求まり（COUNT しない）、
+# 検索は (thread, seq) のインデックスでスレッド内の範囲に絞って新しい順にたどる。
+
+SEARCH_LIMIT = 50
+
+
+def post_comment(thread, **fields):
+    """thread に次の通し番号でメッセージを追加する（投稿者の既読位置も進める）。"""
+    with transaction.atomic():
+        ChatThread.objects.filter(id=thread.id).update(last_seq=F('last_seq') + 1)
+        thread.last_seq = ChatThread.objects.values_list('last_seq', flat=True).get(id=thread.id)
+        comment = Comment.objects.create(thread=thread, seq=thread.last_seq, **fields)
+        mark_read(comment.user, thread, thread.last_seq)
+    return comment
+
+
+def threads_with_unread(task, user):
+    """task のスレッド一覧を1クエリで取得し、各スレッドに last_read_seq と unread を付ける。"""
+    cursor = ThreadReadCursor.objects.filter(thread=OuterRef('pk'), user=user).values('last_read_seq')[:1]
+    threads = list(ChatThread.objects.filter(task=task)
+                   .annotate(last_read_seq=Coalesce(Subquery(cursor), Value(0)))
+                   .order_by('id'))
+    for thread in threads:
+        thread.unread = max(thread.last_seq - thread.last_read_seq, 0)
+    return threads
+
+
+def mark_read(user, thread, seq):
+    """既読位置を seq まで進める（戻すことはしない）。seq はクライアントの値なので 0..last_seq に収める。"""
+    seq = max(0, min(seq, thread.last_seq))
+    if ThreadReadCursor.objects.filter(user=user, thread=thread, last_read_seq__lt=seq).update(last_read_seq=seq):
+        return
+    ThreadReadCursor.objects.bulk_create([ThreadReadCursor(user=user, thread=thread, last_read_seq=seq)],
+                                         ignore_conflicts=True)
+
+
+def search(thread, query, before=None, limit=SEARCH_LIMIT):
+    """thread 内で query を含むメッセージを新しい順に返す。before（seq）より前から続きを探す。"""
+    comments = Comment.objects.filter(thread=thread, content__icontains=query)
+    if before:
+        comments = comments.filter(seq__lt=before)
+    return list(comments.select_related('user').order_by('-seq')[:limit])
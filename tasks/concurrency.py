@@ -0,0 +1,22 @@
+from django.db.models import F
+
+# === 楽観的排他制御 ===
+# 読み込み → Python で書き換え → save() だと、同時に操作したときに後から保存した方が先の変更を上書きする。
+# 代わりに「読んだときの version（と元の値）」を条件にした UPDATE 1文で必要な列だけを書き、version を1つ進める。
+# 0行なら読んだ後に誰かが先に書き換えているので Conflict を送出し、呼び出し側は最新の状態を返して
+# クライアントに画面を合わせてもらう（409）。
+
+
+class Conflict(Exception):
+    def __init__(self, current):
+        super().__init__('modified by someone else')
+        # 最新の状態（クライアントが画面を合わせるための値）
+        self.current = current
+
+
+def update_if_unchanged(queryset, version, **changes):
+    """queryset の行が version のままなら changes を書き込んで version を進め、新しい version を返す。
+    書き込めなければ None。"""
+    if queryset.filter(version=version).update(version=F('version') + 1, **changes):
+        return version + 1
+    return None
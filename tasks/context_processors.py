@@ -0,0 +1,8 @@
+from . import notifications
+
+
+def unread_notifications(request):
+    # テンプレートで使われたときだけ評価される（キャッシュ済みの未読数）
+    if not request.user.is_authenticated:
+        return {}
+    return {'unread_notification_count': lambda: notifications.unread_count(request.user)}
@@ -0,0 +1,39 @@
+from django.db import connections
+from django.http import HttpResponse
+
+# === ヘルスチェック ===
+# ロードバランサーやオーケストレーターからの監視用。セッション・認証・CSRF などのミドルウェアより前
+# （MIDDLEWARE の先頭）で応答し、セッションの読み込みや ALLOWED_HOSTS の検査を通らないようにする。
+#   /healthz/ : プロセスが応答できるか（生存確認）。DB には触れない
+#   /readyz/  : DB に接続できるか（リクエストを受けてよいか）。だめなら 503
+
+LIVENESS_PATH = '/healthz/'
+READINESS_PATH = '/readyz/'
+
+
+def check_database(alias='default'):
+    with connections[alias].cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+
+
+def plain_response(body, status=200):
+    response = HttpResponse(body, content_type='text/plain; charset=utf-8', status=status)
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+class HealthCheckMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path == LIVENESS_PATH:
+            return plain_response('ok')
+        if request.path == READINESS_PATH:
+            try:
+                check_database()
+            except Exception as exc:  # 接続できない理由は問わず「準備できていない」とする
+                return plain_response(f'database unavailable: {exc.__class__.__name__}', status=503)
+            return plain_response('ready')
+        return self.get_response(request)
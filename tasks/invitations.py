@@ -0,0 +1,102 @@
+import re
+from collections import namedtuple
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from . import activity, cache, notifications
+from .models import Invitation, TaskAssignment
+
+# === 招待 ===
+# ユーザー名・メールアドレスの一覧をまとめて招待する。ユーザーの解決・既存メンバーと未回答の招待の除外は
+# 件数に関係なく数クエリで行い、招待は bulk_create で一括作成する。
+
+BATCH_SIZE = 500
+SEPARATOR_RE = re.compile(r'[\s,、]+')
+
+InviteResult = namedtuple('InviteResult', ['invited', 'already_member', 'already_invited', 'not_found', 'skipped'])
+
+
+def parse_identifiers(text):
+    """カンマ・空白・改行区切りの入力を重複なしの一覧にする（入力順は保つ）。"""
+    return list(dict.fromkeys(part for part in SEPARATOR_RE.split(text or '') if part))
+
+
+def resolve_users(identifiers):
+    """ユーザー名またはメールアドレスを1クエリで解決し、(入力→ユーザーの辞書, 見つからなかった入力) を返す。
+
+    メールアドレスは大文字・小文字を区別しない（ユーザー名は Django の既定どおり区別する）。
+    """
+    identifiers = set(identifiers)
+    emails = {identifier.lower() for identifier in identifiers if '@' in identifier}
+    users = list(User.objects.annotate(email_lower=Lower('email'))
+                 .filter(Q(username__in=identifiers) | Q(email_lower__in=emails), is_active=True)
+                 .only('id', 'username', 'email'))
+    by_name = {user.username: user for user in users}
+    by_email = {user.email_lower: user for user in users if user.email_lower}
+    resolved = {}
+    for identifier in identifiers:
+        user = by_name.get(identifier)
+        if user is None and '@' in identifier:
+            user = by_email.get(identifier.lower())
+        if user is not None:
+            resolved[identifier] = user
+    return resolved, sorted(identifiers - resolved.keys())
+
+
+def bulk_invite(task, sender, identifiers):
+    resolved, not_found = resolve_users(identifiers)
+    # 自分自身は招待しない。黙って落とさず skipped として呼び出し元に返す
+    skipped = sorted(identifier for identifier, user in resolved.items() if user.id == sender.id)
+    by_id = {user.id: user.username for user in resolved.values() if user.id != sender.id}
+    user_ids = set(by_id)
+    members = set(TaskAssignment.objects.filter(task=task, user_id__in=user_ids).values_list('user_id', flat=True))
+    pending = set(Invitation.objects.filter(task=task, status='pending', recipient_id__in=user_ids)
+                  .values_list('recipient_id', flat=True))
+    to_invite = sorted(user_ids - members - pending)
+
+    # 同時に同じ相手を招待しても、未回答の招待の一意制約で1件に収まる
+    Invitation.objects.bulk_create(
+        [Invitation(task=task, sender=sender, recipient_id=user_id, status='pending') for user_id in to_invite],
+        batch_size=BATCH_SIZE, ignore_conflicts=True)
+    # bulk_create はシグナルを送らないので招待一覧のキャッシュは自分で無効化する
+    for user_id in to_invite:
+        cache.invalidate('invitation', user_id)
+    notifications.notify_invitations(task, sender, to_invite)
+
+    return InviteResult(invited=[by_id[user_id] for user_id in to_invite],
+                        already_member=sorted(by_id[user_id] for user_id in members),
+                        already_invited=sorted(by_id[user_id] for user_id in pending),
+                        not_found=not_found,
+                        skipped=skipped)
+
+
+def accept(invitation_id, user):
+    """招待を受けて参加する。(招待, 新たに参加したか) を返す。2回目以降は何もしない。"""
+    with transaction.atomic():
+        invitation = (Invitation.objects.select_for_update().select_related('task')
+                      .get(id=invitation_id, recipient=user))
+        if invitation.status != 'pending':
+            return invitation, False
+        # リンクからの参加と競合して一意制約に当たった場合も、get_or_create がセーブポイント内で
+        # IntegrityError を受けて既存の行を返すので、参加済みとして扱われる
+        assignment, joined = TaskAssignment.objects.get_or_create(task=invitation.task, user=user,
+                                                                  defaults={'status': 'todo'})
+        if joined:
+            activity.record(invitation.task_id, user, 'member_join', assignment.id, '', 'todo')
+        invitation.status = 'accepted'
+        invitation.save(update_fields=['status'])
+    if joined:
+        notifications.notify_membership(invitation.task, user, user, joined=True)
+    return invitation, joined
+
+
+def decline(invitation_id, user):
+    with transaction.atomic():
+        invitation = Invitation.objects.select_for_update().get(id=invitation_id, recipient=user)
+        if invitation.status == 'pending':
+            invitation.status = 'declined'
+            invitation.save(update_fields=['status'])
+    return invitation
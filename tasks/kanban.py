@@ -0,0 +1,105 @@
+import base64
+
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import RowNumber
+
+from . import cache, concurrency
+from .models import TaskAssignment
+
+# === カンバン列モード ===
+# 自分の TaskAssignment.status ごとに列を作り、各列を (board_rank, id) で独立にキーセットページングする
+
+STATUSES = ('todo', 'doing', 'done')
+STATUS_LABELS = {'todo': '未着手', 'doing': '進行中', 'done': '完了'}
+PAGE_SIZE = 20
+
+
+def _column_base(user):
+    return TaskAssignment.objects.filter(user=user).select_related('task')
+
+
+def encode_cursor(assign):
+    raw = f"{assign.board_rank}|{assign.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        rank, pk = raw.rsplit('|', 1)
+        return rank, int(pk)
+    except (ValueError, UnicodeError):
+        return None
+
+
+def _decorate(assign):
+    # 進捗・期限はタスクの集計値から計算するので追加クエリなし
+    task = assign.task
+    task.progress_percent = task.progress_percent()
+    task.color_class = task.color_class()
+    task.remaining_days = task.remaining_days()
+    task.my_status = assign.status
+    return assign
+
+
+def _count_columns(user_id):
+    # GROUP BY status の1クエリで全列の件数を取得
+    rows = TaskAssignment.objects.filter(user_id=user_id).values('status').annotate(n=Count('id')).order_by()
+    counts = dict.fromkeys(STATUSES, 0)
+    counts.update({row['status']: row['n'] for row in rows})
+    return counts
+
+
+def column_counts(user):
+    # 担当の追加・削除・移動で board 名前空間ごと無効化される
+    return cache.get_or_compute(cache.make_key('board', user.id, 'counts'), lambda: _count_columns(user.id))
+
+
+def first_pages(user, page_size=PAGE_SIZE):
+    """各列の先頭ページと件数をウィンドウ関数1クエリで返す。"""
+    ordering = [F('board_rank').asc(), F('id').asc()]
+    rows = (_column_base(user)
+            .annotate(position=Window(RowNumber(), partition_by=F('status'), order_by=ordering),
+                      column_total=Window(Count('id'), partition_by=F('status')))
+            .filter(position__lte=page_size)
+            .order_by('status', 'board_rank', 'id'))
+
+    columns = {status: {'status': status, 'label': STATUS_LABELS[status], 'cards': [], 'total': 0, 'next_cursor': None}
+               for status in STATUSES}
+    for assign in rows:
+        column = columns.get(assign.status)
+        if column is None:
+            continue
+        column['cards'].append(_decorate(assign))
+        column['total'] = assign.column_total
+    for column in columns.values():
+        if column['total'] > len(column['cards']):
+            column['next_cursor'] = encode_cursor(column['cards'][-1])
+    return [columns[status] for status in STATUSES]
+
+
+def column_page(user, status, cursor=None, page_size=PAGE_SIZE):
+    """1列分の次ページを (カード, 次カーソル) で返す。"""
+    qs = _column_base(user).filter(status=status)
+    if cursor:
+        position = decode_cursor(cursor)
+        if position is None:
+            return [], None
+        rank, pk = position
+        qs = qs.filter(Q(board_rank__gt=rank) | Q(board_rank=rank, id__gt=pk))
+    rows = list(qs.order_by('board_rank', 'id')[:page_size + 1])
+    has_more = len(rows) > page_size
+    cards = [_decorate(assign) for assign in rows[:page_size]]
+    return cards, (encode_cursor(cards[-1]) if has_more else None)
+
+
+def update_status(assignment_id, status, version=None):
+    """担当ステータスを status にし、(元のステータス, 新しい version) を返す。
+    version（省略時は読んだときの値）の後に他の人が書き換えていたら Conflict。"""
+    old_status, current_version = TaskAssignment.objects.values_list('status', 'version').get(id=assignment_id)
+    version = current_version if version is None else version
+    new_version = concurrency.update_if_unchanged(TaskAssignment.objects.filter(id=assignment_id), version, status=status)
+    if new_version is None:
+        current = TaskAssignment.objects.filter(id=assignment_id).values('status', 'version').first()
+        raise concurrency.Conflict(current or {'status': old_status, 'version': current_version})
+    return old_status, new_version
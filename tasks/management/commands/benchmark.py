@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from tasks.benchmarks import BENCHMARKS
+
+
+class Command(BaseCommand):
+    help = 'パフォーマンス計測用のシナリオを実行する（データはロールバックされる）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help=f"実行するシナリオ（省略時は全て）: {', '.join(BENCHMARKS)}")
+
+    def handle(self, *args, **options):
+        names = options['names'] or list(BENCHMARKS)
+        unknown = [name for name in names if name not in BENCHMARKS]
+        if unknown:
+            raise CommandError(f"unknown benchmark: {', '.join(unknown)}")
+
+        for name in names:
+            results = []
+            if getattr(BENCHMARKS[name], 'transactional', True):
+                with transaction.atomic():
+                    BENCHMARKS[name](results)
+                    transaction.set_rollback(True)
+            else:
+                BENCHMARKS[name](results)
+
+            self.stdout.write(self.style.MIGRATE_HEADING(f'== {name} =='))
+            for row in results:
+                if 'bytes' in row:
+                    self.stdout.write(f"  {row['label']:<48} {row['bytes']:>10,} bytes")
+                    continue
+                per_op = row['seconds'] / row['count'] * 1000
+                self.stdout.write(
+                    f"  {row['label']:<48} {row['seconds']:8.3f}s  {per_op:9.3f} ms/op  "
+                    f"{row['queries'] / row['count']:8.1f} queries/op")
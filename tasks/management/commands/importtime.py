@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from tasks import startup
+
+
+class Command(BaseCommand):
+    help = '新しいプロセスで wsgi などを import し、python -X importtime の内訳を表示する'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--module', default='kanban_project.wsgi')
+        parser.add_argument('--warm', action='store_true', help='serving.warm_up()（URL・ビュー・テンプレート）も含める')
+        parser.add_argument('--top', type=int, default=20)
+        parser.add_argument('--sort', choices=('self', 'cumulative'), default='self')
+
+    def handle(self, *args, **options):
+        entries = startup.import_profile(options['module'], warm=options['warm'])
+        total = startup.total_us(entries)
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"== import {options['module']}: {total / 1000:.1f} ms, {len(entries)} modules =="))
+
+        self.stdout.write(self.style.MIGRATE_HEADING('-- by package (self) --'))
+        for package, us in startup.by_package(entries).most_common(options['top']):
+            self.stdout.write(f'  {package:<40} {us / 1000:8.1f} ms  {us / total:6.1%}')
+
+        key = 'self_us' if options['sort'] == 'self' else 'cumulative_us'
+        self.stdout.write(self.style.MIGRATE_HEADING(f"-- top modules ({options['sort']}) --"))
+        for entry in sorted(entries, key=lambda e: getattr(e, key), reverse=True)[:options['top']]:
+            self.stdout.write(f'  {entry.name:<56} {entry.self_us / 1000:8.1f} ms self  '
+                              f'{entry.cumulative_us / 1000:8.1f} ms cumulative')
+
+        missing = startup.missing_bytecode(entries)
+        if missing:
+            reason = '（PYTHONDONTWRITEBYTECODE が有効）' if startup.bytecode_disabled() else ''
+            self.stdout.write(self.style.WARNING(
+                f'{len(missing)} 個のプロジェクトのモジュールにキャッシュ済みのバイトコードがなく、起動のたびにコンパイルしています'
+                f'{reason}。デプロイ時に `python -m compileall -q kanban_project tasks` を実行してください'))
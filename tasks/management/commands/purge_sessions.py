@@ -0,0 +1,27 @@
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = '期限切れセッションを少しずつ削除する（長時間テーブルをロックしない）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--sleep', type=float, default=0.0, help='チャンクごとの待ち時間（秒）')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        chunk_size = options['chunk_size']
+        total = 0
+        while True:
+            keys = list(Session.objects.filter(expire_date__lt=now).values_list('session_key', flat=True)[:chunk_size])
+            if not keys:
+                break
+            deleted, _ = Session.objects.filter(session_key__in=keys).delete()
+            total += deleted
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(f'{total} 件の期限切れセッションを削除しました'))
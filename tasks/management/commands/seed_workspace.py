@@ -0,0 +1,212 @@
+import os
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from tasks import ranking, seeding, wbs
+from tasks.models import Task, TaskAssignment, SubTask, ChatThread, Comment, Invitation, Profile
+
+SEED_PASSWORD = 'password'
+
+
+@contextmanager
+def fast_sqlite_load():
+    """投入中だけ SQLite のジャーナルをメモリに置き、fsync を止める（落ちたら DB ごと作り直す前提）。"""
+    if connection.vendor != 'sqlite':
+        yield
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode')
+        journal_mode = cursor.fetchone()[0]
+        cursor.execute('PRAGMA synchronous')
+        synchronous = cursor.fetchone()[0]
+        for pragma in ('journal_mode=MEMORY', 'synchronous=OFF', 'cache_size=-262144', 'temp_store=MEMORY'):
+            cursor.execute(f'PRAGMA {pragma}')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA journal_mode={journal_mode}')
+            cursor.execute(f'PRAGMA synchronous={synchronous}')
+
+
+@contextmanager
+def keep_timestamps(*models):
+    # auto_now_add のフィールドは bulk_create でも現在時刻で上書きされるので、生成した日時を残すために一時的に外す
+    fields = [field for model in models for field in model._meta.concrete_fields if getattr(field, 'auto_now_add', False)]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+SIBLING_RANKS = []
+
+
+def seeding_rank(position):
+    # 兄弟内の位置 → 末尾追加と同じランク（'1', '2', ...）
+    while len(SIBLING_RANKS) <= position:
+        SIBLING_RANKS.append(ranking.rank_after(SIBLING_RANKS[-1] if SIBLING_RANKS else None))
+    return SIBLING_RANKS[position]
+
+
+def next_id(model):
+    return (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+
+
+class Command(BaseCommand):
+    help = '負荷確認用に大量のユーザー・タスク・WBS・チャット・招待を作る（同じ --seed なら同じ内容）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--tasks', type=int, default=20000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='生成に使うプロセス数（0 ならこのプロセスで生成）')
+        parser.add_argument('--chunk-size', type=int, default=200, help='1回の生成・保存で扱うタスク数')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--chat-scale', type=float, default=1.0, help='チャット量の倍率')
+        parser.add_argument('--prefix', default='seed', help='作成するユーザー名の接頭辞')
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(f'{prefix}_ で始まるユーザーが既にいます。--prefix を変えてください')
+
+        self.rows = Counter()
+        self.seconds = Counter()
+        now = timezone.now().replace(minute=0, second=0, microsecond=0)
+        started = time.perf_counter()
+        with fast_sqlite_load(), keep_timestamps(Task, SubTask, ChatThread, Comment, Invitation):
+            first_user_id = self.create_users(prefix, options['users'], options['seed'], now)
+            # サブタスク・スレッドの親子関係に使う ID はここで順に割り当てる
+            self.next_ids = {model: next_id(model) for model in (Task, SubTask, ChatThread)}
+            self.board_ranks = ranking.spread(options['tasks'])
+            self.task_offset = 0
+
+            chunk_size = options['chunk_size']
+            chunks = [(options['seed'], index, min(chunk_size, options['tasks'] - start), first_user_id,
+                       options['users'], now, options['chat_scale'])
+                      for index, start in enumerate(range(0, options['tasks'], chunk_size))]
+            if options['workers'] > 0:
+                with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+                    # map は入力の順に結果を返すので、ID の割り当て順もワーカー数によらない
+                    for rows in pool.map(seeding.generate_chunk, chunks):
+                        self.save_chunk(rows)
+            else:
+                for rows in map(seeding.generate_chunk, chunks):
+                    self.save_chunk(rows)
+
+        if connection.vendor != 'sqlite':
+            # ID を明示して入れたので、PostgreSQL などではシーケンスを進めておく
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), [User, Task, SubTask, ChatThread]):
+                    cursor.execute(sql)
+        self.report(time.perf_counter() - started)
+
+    def insert(self, model, objs):
+        start = time.perf_counter()
+        model.objects.bulk_create(objs, batch_size=self.batch_size)
+        self.seconds[model.__name__] += time.perf_counter() - start
+        self.rows[model.__name__] += len(objs)
+
+    def create_users(self, prefix, count, seed, now):
+        first_id = next_id(User)
+        # パスワードのハッシュは重いので全員同じものを使う
+        password = make_password(SEED_PASSWORD)
+        users, profiles = [], []
+        with transaction.atomic():
+            for index, (family, given, bio) in enumerate(seeding.user_rows(seed, 0, count)):
+                username = f'{prefix}_{index:06d}'
+                users.append(User(id=first_id + index, username=username, email=f'{username}@example.com',
+                                  password=password, first_name=given, last_name=family, date_joined=now))
+                profiles.append(Profile(user_id=first_id + index, bio=bio))
+            self.insert(User, users)
+            self.insert(Profile, profiles)
+        return first_id
+
+    def allocate(self, model, count):
+        first = self.next_ids[model]
+        self.next_ids[model] += count
+        return first
+
+    def save_chunk(self, rows):
+        task_first = self.allocate(Task, len(rows['tasks']))
+        subtask_first = self.allocate(SubTask, len(rows['subtasks']))
+        thread_first = self.allocate(ChatThread, len(rows['threads']))
+
+        # サブタスク: ID・path・兄弟内のランクと、配下の末端数/完了数（子から親へ積み上げる）を決める
+        subtask_ids, paths = {}, {}
+        leaf, done = defaultdict(int), defaultdict(int)
+        for offset, (t, s, parent, _, is_done, _, _, _) in enumerate(rows['subtasks']):
+            subtask_ids[t, s] = subtask_first + offset
+        for t, s, parent, _, is_done, _, _, _ in reversed(rows['subtasks']):
+            if (t, s) not in leaf:
+                leaf[t, s], done[t, s] = 1, int(is_done)
+            key = (t, parent) if parent is not None else ('task', t)
+            leaf[key] += leaf[t, s]
+            done[key] += done[t, s]
+
+        tasks = []
+        due_dates = {}
+        for t, (title, description, owner, created, due) in enumerate(rows['tasks']):
+            due_dates[t] = due
+            tasks.append(Task(id=task_first + t, title=title, description=description, user_id=owner,
+                              created_at=created, due_date=due, subtask_leaf_count=leaf['task', t],
+                              subtask_done_count=done['task', t]))
+
+        subtasks = []
+        for t, s, parent, title, is_done, depth, position, created in rows['subtasks']:
+            pk = subtask_ids[t, s]
+            paths[t, s] = (paths[t, parent] if parent is not None else '') + wbs.path_segment(pk)
+            subtasks.append(SubTask(id=pk, task_id=task_first + t, title=title, is_done=is_done, created_at=created,
+                                    rank=seeding_rank(position), parent_id=subtask_ids[t, parent] if parent is not None else None,
+                                    path=paths[t, s], depth=depth, leaf_count=leaf[t, s], done_count=done[t, s]))
+
+        thread_ids = {}
+        threads = []
+        for offset, (t, h, name, created, last_seq) in enumerate(rows['threads']):
+            thread_ids[t, h] = thread_first + offset
+            threads.append(ChatThread(id=thread_first + offset, task_id=task_first + t, name=name,
+                                      created_at=created, last_seq=last_seq))
+
+        assignments = [TaskAssignment(task_id=task_first + t, user_id=user_id, status=status, role_name=role,
+                                      joined_at=joined, due_date=due_dates[t],
+                                      board_rank=self.board_ranks[self.task_offset + t])
+                       for t, user_id, status, role, joined in rows['assignments']]
+        comments = [Comment(task_id=task_first + t, thread_id=thread_ids[t, h], user_id=user_id, content=content,
+                            created_at=at, seq=seq, message_type=message_type)
+                    for t, h, user_id, content, at, seq, message_type in rows['comments']]
+        invitations = [Invitation(task_id=task_first + t, sender_id=sender, recipient_id=recipient, status=status,
+                                  created_at=created)
+                       for t, sender, recipient, status, created in rows['invitations']]
+        self.task_offset += len(tasks)
+
+        with transaction.atomic():
+            for model, objs in ((Task, tasks), (TaskAssignment, assignments), (SubTask, subtasks),
+                                (ChatThread, threads), (Comment, comments), (Invitation, invitations)):
+                self.insert(model, objs)
+        self.stdout.write(f'  {self.task_offset:,} tasks, {sum(self.rows.values()):,} rows', ending='\r')
+
+    def report(self, elapsed):
+        self.stdout.write('')
+        total = sum(self.rows.values())
+        for name, count in self.rows.most_common():
+            rate = count / self.seconds[name] if self.seconds[name] else 0
+            self.stdout.write(f'  {name:<16} {count:>10,} rows  {self.seconds[name]:8.2f}s insert  {rate:>10,.0f} rows/s')
+        self.stdout.write(self.style.SUCCESS(
+            f'{total:,} rows in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s including generation). '
+            f'パスワードは全員 {SEED_PASSWORD}'))
+
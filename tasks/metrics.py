@@ -0,0 +1,513 @@
+import ipaddress
+import json
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+
+# === メトリクス（Prometheus のテキスト形式） ===
+# 値はスレッドごとの dict（threading.local）に足し込み、/metrics/ で読むときに全スレッド分を合計する。
+# 書き込むのは自分のスレッドの dict だけなので、ロックを取らずに（取りこぼしもなく）数えられる。
+# 終了したスレッドの dict は、新しいスレッドの登録時と集計時にプロセス共通の _retired へ畳み込んで手放す
+# （スレッドを使い捨てるサーバーでも dict の数は生きているスレッドの数までしか増えない）。
+#
+# gunicorn などでワーカープロセスが複数あるときは、どのワーカーが /metrics/ に答えても全体の値になるよう
+# METRICS_MULTIPROC_DIR を設定する（gunicorn.conf.py が自動で設定する）。各プロセスは FLUSH_INTERVAL 秒ごとと
+# 終了時に自分の値を <pid>.json へ書き出し、/metrics/ はディレクトリ内のファイルを合計して返す。
+# 終了したワーカーの分はマスターが archive.json に足し込むので、max_requests で入れ替わってもファイルは増えない。
+
+METRICS_PATH = '/metrics/'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+FLUSH_INTERVAL = 5
+ARCHIVE_FILE = 'archive.json'
+LOCK_FILE = '.lock'
+OWNER_FILE = 'master.pid'
+
+# セッション数のゲージを数え直す間隔（秒）
+SESSIONS_CACHE_SECONDS = 60
+
+# レイテンシのバケット（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REGISTRY = {}
+
+# スレッドごとの値。キーは (メトリクス名, ラベル値のタプル, 種類)。種類はカウンターなら None、
+# ヒストグラムならバケットの番号（len(buckets) が +Inf）か 'sum'
+_local = threading.local()
+# (スレッドへの弱参照, そのスレッドの dict) の一覧と、終了したスレッドの分を合計したもの。どちらも _shards_lock で守る
+_SHARDS = []
+_retired = defaultdict(float)
+_shards_lock = threading.Lock()
+_sessions_cache = {}
+_state = {'flusher_pid': None}
+_flush_lock = threading.Lock()
+
+
+def _values():
+    try:
+        return _local.values
+    except AttributeError:
+        values = _local.values = defaultdict(float)
+        # 登録はスレッドごとに1回だけなので、ここではロックを取ってよい
+        with _shards_lock:
+            _prune()
+            _SHARDS.append((weakref.ref(threading.current_thread()), values))
+        return values
+
+
+def _prune():
+    """終了したスレッドの dict を _retired に足し込んで一覧から外す（_shards_lock を持って呼ぶ）。"""
+    alive = []
+    for ref, values in _SHARDS:
+        thread = ref()
+        if thread is not None and thread.is_alive():
+            alive.append((ref, values))
+        else:
+            # 終了したスレッドはもう書き込まないので、そのまま足してよい
+            for key, value in values.items():
+                _retired[key] += value
+    _SHARDS[:] = alive
+
+
+def reset():
+    """このプロセスで数えた値を捨てる（fork 直後の子プロセスはマスターの値を引き継がない）。"""
+    global _shards_lock
+    # fork 時に他のスレッドが持っていたロックは子プロセスでは解放されないので作り直す
+    _shards_lock = threading.Lock()
+    for _, values in _SHARDS:
+        values.clear()
+    _retired.clear()
+    _sessions_cache.clear()
+    _state['flusher_pid'] = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset)
+
+
+class Metric:
+    type = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY[name] = self
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, *labels, amount=1):
+        _values()[self.name, labels, None] += amount
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        values = _values()
+        # le は「以下」なので、value 以上の最初のバケットに入れる（累積は出力時に計算する）
+        values[self.name, labels, bisect_left(self.buckets, value)] += 1
+        values[self.name, labels, 'sum'] += value
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+class CounterFunction(Metric):
+    """他のモジュールがプロセス内で数えている値をカウンターとして出す。func() は {ラベル値のタプル: 値}。"""
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames, func):
+        super().__init__(name, documentation, labelnames)
+        self.func = func
+
+
+class Gauge(Metric):
+    """集計するときに値を入れるもの（collect() が設定する）。"""
+    type = 'gauge'
+
+
+class ScrapeGauge(Metric):
+    """/metrics/ を返すときに1回だけ計算する値（DB の件数や、合計済みの値から出す比率など）。
+    func(samples) は {ラベル値のタプル: 値}。samples は全プロセス分を合計した値。"""
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames, func):
+        super().__init__(name, documentation, labelnames)
+        self.func = func
+
+
+# === 値の集計 ===
+
+def process_samples():
+    """このプロセスの値（全スレッドの合計）。"""
+    with _shards_lock:
+        _prune()
+        merged = defaultdict(float, _retired)
+        shards = [values for _, values in _SHARDS]
+    for values in shards:
+        # dict のコピーは GIL を持ったまま行われるので、他のスレッドが書き込み中でも壊れない
+        for key, value in list(values.items()):
+            merged[key] += value
+    for metric in list(REGISTRY.values()):
+        if isinstance(metric, CounterFunction):
+            for labels, value in metric.func().items():
+                merged[metric.name, labels, None] += value
+    return merged
+
+
+def multiproc_dir():
+    return getattr(settings, 'METRICS_MULTIPROC_DIR', '')
+
+
+def _dump(path, samples):
+    tmp = f'{path}.{threading.get_ident()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump([[name, list(labels), kind, value] for (name, labels, kind), value in samples.items()], f,
+                  separators=(',', ':'))
+    # 読む側が書きかけのファイルを見ないよう、書き終えてから差し替える
+    os.replace(tmp, path)
+
+
+def _load(path, merged):
+    with open(path) as f:
+        for name, labels, kind, value in json.load(f):
+            merged[name, tuple(labels), kind] += value
+
+
+class _DirectoryLock:
+    # archive.json への足し込み（マスター）と集計（ワーカー）が同時に起きて二重に数えないようにする
+    def __init__(self, directory, exclusive):
+        self.path = os.path.join(directory, LOCK_FILE)
+        self.exclusive = exclusive
+
+    def __enter__(self):
+        import fcntl
+        self.file = open(self.path, 'a')
+        fcntl.flock(self.file, fcntl.LOCK_EX if self.exclusive else fcntl.LOCK_SH)
+
+    def __exit__(self, *exc_info):
+        self.file.close()
+
+
+def flush(directory=None):
+    """このプロセスの値を <pid>.json に書き出す（別のスレッドが書き出し中なら何もしない）。"""
+    directory = directory or multiproc_dir()
+    if not directory or not _flush_lock.acquire(blocking=False):
+        return
+    try:
+        _dump(os.path.join(directory, f'{os.getpid()}.json'), process_samples())
+    finally:
+        _flush_lock.release()
+
+
+def _flush_loop(directory):
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        flush(directory)
+
+
+def start_flusher():
+    """マルチプロセス時、このプロセスで定期的に書き出すスレッドを（まだなければ）起動する。"""
+    directory = multiproc_dir()
+    if directory and _state['flusher_pid'] != os.getpid():
+        _state['flusher_pid'] = os.getpid()
+        threading.Thread(target=_flush_loop, args=(directory,), daemon=True).start()
+
+
+def archive_process(directory, pid):
+    """終了したプロセスの値を archive.json に足し込み、<pid>.json を消す（gunicorn のマスターから呼ぶ）。"""
+    path = os.path.join(directory, f'{pid}.json')
+    if not os.path.exists(path):
+        return
+    with _DirectoryLock(directory, exclusive=True):
+        merged = defaultdict(float)
+        archive = os.path.join(directory, ARCHIVE_FILE)
+        for source in (archive, path):
+            try:
+                _load(source, merged)
+            except (FileNotFoundError, ValueError):
+                pass
+        _dump(archive, merged)
+        os.remove(path)
+
+
+def clear_directory(directory):
+    """前回の起動で残ったファイルを消す（同じ pid が再利用されると二重に数えてしまう）。"""
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.endswith(('.json', '.tmp')):
+            os.remove(os.path.join(directory, name))
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # 別ユーザーのプロセスとして生きている
+        return True
+    return True
+
+
+def claim_directory(directory):
+    """マスターの起動時に呼ぶ。ディレクトリを使っている別のマスターが生きていなければ前回の残りを消し、
+    自分を所有者として記録する。USR2 で起動した新しいマスターは、動いている旧マスターのファイルを消さない。"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, OWNER_FILE)
+    try:
+        with open(path) as f:
+            owner = int(f.read().strip())
+    except (FileNotFoundError, ValueError):
+        owner = None
+    if owner is None or owner == os.getpid() or not _process_alive(owner):
+        clear_directory(directory)
+    with open(path, 'w') as f:
+        f.write(str(os.getpid()))
+
+
+def collect():
+    """全体の値。マルチプロセスでなければこのプロセスの値だけ。"""
+    directory = multiproc_dir()
+    if not directory:
+        samples = process_samples()
+        samples[PROCESSES.name, (), None] = 1
+        return samples
+    # 答えるプロセス自身の分は最新にしてから読む
+    flush(directory)
+    samples = defaultdict(float)
+    processes = 0
+    with _DirectoryLock(directory, exclusive=False):
+        for name in os.listdir(directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                _load(os.path.join(directory, name), samples)
+            except (FileNotFoundError, ValueError):
+                continue
+            if name != ARCHIVE_FILE:
+                processes += 1
+    samples[PROCESSES.name, (), None] = processes
+    return samples
+
+
+# === テキスト形式への変換 ===
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format(value):
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def render(samples):
+    by_metric = defaultdict(dict)
+    for (name, labels, kind), value in samples.items():
+        by_metric[name].setdefault(labels, {})[kind] = value
+
+    lines = []
+    for metric in REGISTRY.values():
+        if isinstance(metric, ScrapeGauge):
+            series = {labels: {None: value} for labels, value in metric.func(samples).items()}
+        else:
+            series = by_metric.get(metric.name, {})
+        if not series:
+            continue
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        for labels, kinds in sorted(series.items()):
+            if isinstance(metric, Histogram):
+                cumulative = 0
+                for index, bound in enumerate(metric.buckets + (float('inf'),)):
+                    cumulative += kinds.get(index, 0)
+                    le = 'le="+Inf"' if index == len(metric.buckets) else f'le="{_format(bound)}"'
+                    lines.append(f'{metric.name}_bucket{_labels(metric.labelnames, labels, le)} {_format(cumulative)}')
+                lines.append(f'{metric.name}_sum{_labels(metric.labelnames, labels)} {_format(kinds.get("sum", 0))}')
+                lines.append(f'{metric.name}_count{_labels(metric.labelnames, labels)} {_format(cumulative)}')
+            else:
+                lines.append(f'{metric.name}{_labels(metric.labelnames, labels)} {_format(kinds[None])}')
+    return '\n'.join(lines) + '\n'
+
+
+# === 計測する値 ===
+
+def _cache_requests():
+    from . import cache
+    return {(result,): cache.STATS[key]
+            for key, result in (('local_hits', 'local_hit'), ('shared_hits', 'shared_hit'), ('misses', 'miss'))}
+
+
+def _cache_hit_ratio(samples):
+    counts = {labels[0]: value for (name, labels, _), value in samples.items() if name == CACHE_REQUESTS.name}
+    total = sum(counts.values())
+    if not total:
+        return {}
+    return {(): (counts.get('local_hit', 0) + counts.get('shared_hit', 0)) / total}
+
+
+def _background_running(samples):
+    counts = {labels[0]: value for (name, labels, _), value in samples.items() if name == BACKGROUND_JOBS.name}
+    if not counts:
+        return {}
+    return {(): counts.get('started', 0) - counts.get('finished', 0) - counts.get('failed', 0)}
+
+
+def _sessions(samples):
+    # DB に保存するモードだけ（cache / signed_cookies では数えられない）
+    if getattr(settings, 'SESSION_MODE', 'db') not in ('db', 'cached_db'):
+        return {}
+    # django_session 全体の COUNT になるので、スクレイプのたびには数えず SESSIONS_CACHE_SECONDS 秒使い回す
+    cached = _sessions_cache.get('value')
+    if cached is not None and time.monotonic() - _sessions_cache['at'] < SESSIONS_CACHE_SECONDS:
+        return cached
+    from django.contrib.sessions.models import Session
+    from django.db.models import Count, Q
+    now = timezone.now()
+    counts = Session.objects.aggregate(active=Count('pk', filter=Q(expire_date__gt=now)),
+                                       expired=Count('pk', filter=Q(expire_date__lte=now)))
+    value = {('active',): counts['active'], ('expired',): counts['expired']}
+    _sessions_cache.update(value=value, at=time.monotonic())
+    return value
+
+
+REQUEST_SECONDS = Histogram('kanban_http_request_duration_seconds',
+                            'Time to produce a response, by URL name.', ('view', 'method'))
+RESPONSES = Counter('kanban_http_responses_total', 'Responses by URL name and status code.',
+                    ('view', 'method', 'status'))
+DB_QUERIES = Counter('kanban_db_queries_total', 'SQL queries executed while handling requests.', ('view',))
+DB_SECONDS = Counter('kanban_db_query_seconds_total', 'Time spent in SQL queries while handling requests.', ('view',))
+DB_CONNECTIONS = Counter('kanban_db_connections_opened_total',
+                         'New database connections (high rates mean connections are not being reused).', ('alias',))
+CACHE_REQUESTS = CounterFunction('kanban_cache_requests_total', 'Lookups in the default tiered cache.', ('result',),
+                                 _cache_requests)
+CACHE_HIT_RATIO = ScrapeGauge('kanban_cache_hit_ratio', 'Share of cache lookups served from the local or shared tier.',
+                              (), _cache_hit_ratio)
+OTP_MAIL_SECONDS = Histogram('kanban_otp_mail_send_seconds', 'Time to send the login verification mail.',
+                             buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30))
+OTP_MAIL_FAILURES = Counter('kanban_otp_mail_failures_total', 'Verification mails that failed to send.', ('error',))
+BACKGROUND_JOBS = Counter('kanban_background_jobs_total', 'After-commit background jobs by state.', ('state',))
+BACKGROUND_RUNNING = ScrapeGauge('kanban_background_jobs_running', 'Background jobs queued or running.',
+                                 (), _background_running)
+SESSIONS = ScrapeGauge('kanban_sessions', 'Stored sessions by state (expired ones wait for purge_sessions).',
+                       ('state',), _sessions)
+PROCESSES = Gauge('kanban_metrics_processes', 'Processes whose values are included in this scrape.')
+
+
+# === /metrics/ ===
+
+def _allowed_address(address):
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    for network in getattr(settings, 'METRICS_ALLOWED_IPS', ()):
+        try:
+            if address in ipaddress.ip_network(network, strict=False):
+                return True
+        except ValueError:
+            continue
+    return False
+
+
+def is_allowed(request):
+    """METRICS_TOKEN の Bearer トークンか、METRICS_ALLOWED_IPS 内のアドレスからのリクエストだけ許可する。
+    どちらも未設定なら誰にも返さない。"""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    return _allowed_address(request.META.get('REMOTE_ADDR', ''))
+
+
+def metrics_response(request):
+    if not is_allowed(request):
+        return HttpResponse('forbidden', content_type='text/plain; charset=utf-8', status=403)
+    response = HttpResponse(render(collect()), content_type=CONTENT_TYPE)
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+# ラベルの値が増え続けないよう、任意の文字列が入るメソッドは既知のものだけに丸める
+METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
+
+
+def method_label(method):
+    return method if method in METHODS else 'other'
+
+
+class MetricsMiddleware:
+    """リクエストごとの時間・SQL の回数と時間を URL 名ごとに数え、METRICS_PATH ではその一覧を返す。
+    HealthCheckMiddleware の次に置く（ヘルスチェックは数えない）。"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path == METRICS_PATH:
+            return metrics_response(request)
+        start_flusher()
+
+        queries = [0, 0.0]
+
+        def record(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries[0] += 1
+                queries[1] += time.perf_counter() - started
+
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(record))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        # URL 名（名前空間つき）。静的ファイルや 404 などで解決されていなければ unmatched
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        method = method_label(request.method)
+        REQUEST_SECONDS.observe(elapsed, view, method)
+        RESPONSES.inc(view, method, str(response.status_code))
+        if queries[0]:
+            DB_QUERIES.inc(view, amount=queries[0])
+            DB_SECONDS.inc(view, amount=queries[1])
+        return response
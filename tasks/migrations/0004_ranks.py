@@ -0,0 +1,81 @@
+# Generated by Django 4.2.27 on 2026-10-19 03:55
+
+from itertools import groupby
+
+from django.db import migrations, models
+from django.db.models import F
+
+# tasks.ranking.spread の複製。マイグレーションは実行時点のアプリのコードに依存させない
+DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+BASE = len(DIGITS)
+
+
+def spread(count):
+    width = 1
+    while BASE ** width <= count + 1:
+        width += 1
+    step = BASE ** width // (count + 1)
+    ranks = []
+    for i in range(1, count + 1):
+        value = i * step
+        chars = []
+        for _ in range(width):
+            value, digit = divmod(value, BASE)
+            chars.append(DIGITS[digit])
+        ranks.append(''.join(reversed(chars)).rstrip(DIGITS[0]))
+    return ranks
+
+
+def backfill_ranks(apps, schema_editor):
+    # 既存データは今までの表示順（作成順・期限順）のままランクを振る
+    SubTask = apps.get_model('tasks', 'SubTask')
+    TaskAssignment = apps.get_model('tasks', 'TaskAssignment')
+
+    subtasks = SubTask.objects.order_by('task_id', 'created_at', 'id').only('id', 'task_id')
+    for _, rows in groupby(subtasks, key=lambda s: s.task_id):
+        rows = list(rows)
+        for row, rank in zip(rows, spread(len(rows))):
+            row.rank = rank
+        SubTask.objects.bulk_update(rows, ['rank'], batch_size=500)
+
+    assignments = (TaskAssignment.objects
+                   .order_by('user_id', F('task__due_date').asc(nulls_last=True), 'id')
+                   .only('id', 'user_id'))
+    for _, rows in groupby(assignments, key=lambda a: a.user_id):
+        rows = list(rows)
+        for row, rank in zip(rows, spread(len(rows))):
+            row.board_rank = rank
+        TaskAssignment.objects.bulk_update(rows, ['board_rank'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0003_rename_created_at_onetimepassword_updated_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='subtask',
+            options={'ordering': ['rank', 'id']},
+        ),
+        migrations.AddField(
+            model_name='subtask',
+            name='rank',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='taskassignment',
+            name='board_rank',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='subtask',
+            index=models.Index(fields=['task', 'rank'], name='tasks_subta_task_id_d9c284_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taskassignment',
+            index=models.Index(fields=['user', 'status', 'board_rank'], name='tasks_taska_user_id_c03b43_idx'),
+        ),
+        migrations.RunPython(backfill_ranks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 4.2.27 on 2026-10-19 03:58
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+import django.db.models.deletion
+
+
+def backfill_tree(apps, schema_editor):
+    # 既存のサブタスクはすべてルート直下の末端として扱う
+    SubTask = apps.get_model('tasks', 'SubTask')
+    Task = apps.get_model('tasks', 'Task')
+
+    rows = list(SubTask.objects.only('id', 'is_done'))
+    for row in rows:
+        row.path = format(row.id, '08x') + '/'
+        row.depth = 0
+        row.leaf_count = 1
+        row.done_count = 1 if row.is_done else 0
+    SubTask.objects.bulk_update(rows, ['path', 'depth', 'leaf_count', 'done_count'], batch_size=500)
+
+    tasks = list(Task.objects.annotate(leaves=Count('subtasks'), done=Count('subtasks', filter=Q(subtasks__is_done=True))))
+    for task in tasks:
+        task.subtask_leaf_count = task.leaves
+        task.subtask_done_count = task.done
+    Task.objects.bulk_update(tasks, ['subtask_leaf_count', 'subtask_done_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0004_ranks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subtask',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='subtask',
+            name='done_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='subtask',
+            name='leaf_count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='subtask',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='tasks.subtask'),
+        ),
+        migrations.AddField(
+            model_name='subtask',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='subtask_done_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='subtask_leaf_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_tree, migrations.RunPython.noop),
+    ]
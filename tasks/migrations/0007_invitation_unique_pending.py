@@ -0,0 +1,27 @@
+# Generated by Django 4.2.27 on 2026-10-19 04:13
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def drop_duplicate_pending(apps, schema_editor):
+    # 同じタスク・受信者への未回答の招待が重複していれば、最初の1件だけ残す
+    Invitation = apps.get_model('tasks', 'Invitation')
+    pending = Invitation.objects.filter(status='pending')
+    keep = pending.values('task_id', 'recipient_id').annotate(first_id=Min('id')).values_list('first_id', flat=True)
+    pending.exclude(id__in=list(keep)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0006_notification'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_pending, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='invitation',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'pending')), fields=('task', 'recipient'), name='unique_pending_invitation'),
+        ),
+    ]
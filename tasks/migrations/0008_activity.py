@@ -0,0 +1,51 @@
+# Generated by Django 4.2.27 on 2026-10-19 04:14
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tasks', '0007_invitation_unique_pending'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('todo', models.PositiveIntegerField(default=0)),
+                ('doing', models.PositiveIntegerField(default=0)),
+                ('done', models.PositiveIntegerField(default=0)),
+                ('subtask_leaf_count', models.PositiveIntegerField(default=0)),
+                ('subtask_done_count', models.PositiveIntegerField(default=0)),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='tasks.task')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ActivityEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20)),
+                ('subject_id', models.BigIntegerField(blank=True, null=True)),
+                ('old_value', models.CharField(blank=True, default='', max_length=100)),
+                ('new_value', models.CharField(blank=True, default='', max_length=100)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('actor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity', to='tasks.task')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='taskdailystat',
+            constraint=models.UniqueConstraint(fields=('task', 'day'), name='unique_task_daily_stat'),
+        ),
+        migrations.AddIndex(
+            model_name='activityevent',
+            index=models.Index(fields=['task', 'created_at'], name='tasks_activ_task_id_9faaa5_idx'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 4.2.27 on 2026-10-19 04:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_seq(apps, schema_editor):
+    # 既存のメッセージにスレッドごとの通し番号を投稿順で振る
+    ChatThread = apps.get_model('tasks', 'ChatThread')
+    Comment = apps.get_model('tasks', 'Comment')
+    for thread in ChatThread.objects.all():
+        comments = list(Comment.objects.filter(thread=thread).order_by('id').only('id'))
+        for seq, comment in enumerate(comments, start=1):
+            comment.seq = seq
+        Comment.objects.bulk_update(comments, ['seq'], batch_size=500)
+        ChatThread.objects.filter(id=thread.id).update(last_seq=len(comments))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tasks', '0008_activity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThreadReadCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_read_seq', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='chatthread',
+            name='last_seq',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='seq',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_seq, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='comment',
+            constraint=models.UniqueConstraint(fields=('thread', 'seq'), name='unique_comment_seq_in_thread'),
+        ),
+        migrations.AddField(
+            model_name='threadreadcursor',
+            name='thread',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_cursors', to='tasks.chatthread'),
+        ),
+        migrations.AddField(
+            model_name='threadreadcursor',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='threadreadcursor',
+            constraint=models.UniqueConstraint(fields=('user', 'thread'), name='unique_thread_read_cursor'),
+        ),
+    ]
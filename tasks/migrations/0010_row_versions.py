@@ -0,0 +1,23 @@
+# Generated by Django 4.2.27 on 2026-10-19 04:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0009_chat_read_cursors'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subtask',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='taskassignment',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
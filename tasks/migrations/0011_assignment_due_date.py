@@ -0,0 +1,32 @@
+# Generated by Django 4.2.27 on 2026-10-19 04:26
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_due_dates(apps, schema_editor):
+    # 既存の担当にタスクの期限を複製する
+    Task = apps.get_model('tasks', 'Task')
+    TaskAssignment = apps.get_model('tasks', 'TaskAssignment')
+    TaskAssignment.objects.update(
+        due_date=Subquery(Task.objects.filter(id=OuterRef('task_id')).values('due_date')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0010_row_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskassignment',
+            name='due_date',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(copy_due_dates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='taskassignment',
+            index=models.Index(fields=['user', 'due_date'], name='tasks_taska_user_id_22fcc9_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.27 on 2026-10-19 04:47
+
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+
+
+def drop_duplicate_assignments(apps, schema_editor):
+    # 同じタスク・ユーザーの参加が重複していれば、最初の1件（id が最小）だけ残す。
+    # 残す id を一覧にして渡すと、行数が多いとき SQLite の変数の上限を超えるので、サブクエリで絞り込む
+    TaskAssignment = apps.get_model('tasks', 'TaskAssignment')
+    earlier = TaskAssignment.objects.filter(task_id=OuterRef('task_id'), user_id=OuterRef('user_id'),
+                                            id__lt=OuterRef('id'))
+    TaskAssignment.objects.filter(Exists(earlier)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0011_assignment_due_date'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_assignments, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='taskassignment',
+            constraint=models.UniqueConstraint(fields=('task', 'user'), name='unique_task_assignment'),
+        ),
+    ]
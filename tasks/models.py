@@ -1,9 +1,12 @@
 from django.db import models
+from django.db.models import Max
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 import random
 from datetime import timedelta
 
+from .ranking import rank_after
+
 User = get_user_model()
 
 # === ユーザープロフィール ===
@@ -41,26 +44,28 @@ class Task(models.Model):
     # チーム用フィールド (ManyToManyFieldはTaskAssignmentで代用するため削除しても良いが、互換性のため残す場合あり)
     assigned_users = models.ManyToManyField(User, related_name='assigned_tasks', blank=True)
 
+    # WBSの末端サブタスク数と完了数（tasks.wbs が差分で更新する集計値）
+    subtask_leaf_count = models.PositiveIntegerField(default=0)
+    subtask_done_count = models.PositiveIntegerField(default=0)
+
     def __str__(self):
         return self.title
 
     def progress_percent(self):
-        total_subtasks = self.subtasks.count()
-        if total_subtasks == 0:
+        if self.subtask_leaf_count == 0:
             return 0
-        done_subtasks = self.subtasks.filter(is_done=True).count()
-        return int((done_subtasks / total_subtasks) * 100)
+        return int((self.subtask_done_count / self.subtask_leaf_count) * 100)
     
     def is_overdue(self):
         if self.due_date and self.progress_percent() < 100:
             return timezone.now() > self.due_date
         return False
 
-    # 期限までの残り日数
+    # 期限までの残り日数（現地時間の日付の差。UTC の日付や24時間単位では数えない）
     def remaining_days(self):
         if not self.due_date:
             return None
-        delta = self.due_date.date() - timezone.now().date()
+        delta = timezone.localdate(self.due_date) - timezone.localdate()
         return delta.days
 
     # カードの色判定
@@ -77,6 +82,8 @@ class ChatThread(models.Model):
     task = models.ForeignKey(Task, related_name='threads', on_delete=models.CASCADE)
     name = models.CharField(max_length=50, default='メイン')
     created_at = models.DateTimeField(auto_now_add=True)
+    # スレッド内の最後のメッセージ番号（Comment.seq）。未読数 = last_seq - 既読位置
+    last_seq = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.name
@@ -92,9 +99,33 @@ class TaskAssignment(models.Model):
     role_name = models.CharField(max_length=50, blank=True, null=True)
     joined_at = models.DateTimeField(default=timezone.now)
 
+    # カンバンボード上での並び順（ユーザーごとの分数ランク）
+    board_rank = models.CharField(max_length=64, blank=True, default='')
+    # 楽観的排他制御用。status を書き換えるたびに1つ増やす（tasks.concurrency）
+    version = models.PositiveIntegerField(default=0)
+    # Task.due_date の複製。期限カレンダーを (user, due_date) のインデックスで引くため（Task の保存時に揃える）
+    due_date = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'status', 'board_rank']),
+                   models.Index(fields=['user', 'due_date'])]
+        constraints = [
+            # 同じタスクへの参加は1人1件まで（招待の承諾とリンク参加が同時に来ても重複させない）
+            models.UniqueConstraint(fields=['task', 'user'], name='unique_task_assignment'),
+        ]
+
     def __str__(self):
         return f"{self.task.title} - {self.user.username}"
 
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.due_date is None:
+            self.due_date = self.task.due_date
+        # 新規参加時はボードの末尾に置く
+        if not self.board_rank:
+            last = TaskAssignment.objects.filter(user_id=self.user_id).aggregate(last=Max('board_rank'))['last']
+            self.board_rank = rank_after(last)
+        super().save(*args, **kwargs)
+
 
 # === チャットコメント ===
 class Comment(models.Model):
@@ -107,21 +138,65 @@ class Comment(models.Model):
     # ★追加機能: スレッドとメッセージタイプ
     thread = models.ForeignKey(ChatThread, related_name='comments', on_delete=models.CASCADE, null=True, blank=True)
     message_type = models.CharField(max_length=20, default='normal')
+    # スレッド内の通し番号（1から）。既読位置・検索のページングはこの範囲で行う
+    seq = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['thread', 'seq'], name='unique_comment_seq_in_thread')]
 
     def __str__(self):
         return f"{self.user.username}: {self.content[:20]}"
 
 
+class ThreadReadCursor(models.Model):
+    # (ユーザー, スレッド) ごとの既読位置
+    user = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    thread = models.ForeignKey(ChatThread, related_name='read_cursors', on_delete=models.CASCADE)
+    last_read_seq = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['user', 'thread'], name='unique_thread_read_cursor')]
+
+    def __str__(self):
+        return f"{self.user_id} {self.thread_id}: {self.last_read_seq}"
+
+
 # === ★WBS（サブタスク） ===
 class SubTask(models.Model):
     task = models.ForeignKey(Task, related_name='subtasks', on_delete=models.CASCADE)
     title = models.CharField(max_length=200)
     is_done = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    rank = models.CharField(max_length=64, blank=True, default='')
+
+    # 階層構造（マテリアライズドパス）: path は祖先から自分までのIDを連結したもの
+    parent = models.ForeignKey('self', related_name='children', on_delete=models.CASCADE, null=True, blank=True)
+    path = models.CharField(max_length=255, blank=True, default='', db_index=True)
+    depth = models.PositiveSmallIntegerField(default=0)
+    # 配下の末端サブタスク数と完了数（末端なら自分自身の 1 / is_done）
+    leaf_count = models.PositiveIntegerField(default=1)
+    done_count = models.PositiveIntegerField(default=0)
+    # 楽観的排他制御用。is_done を書き換えるたびに1つ増やす（tasks.concurrency）
+    version = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['rank', 'id']
+        indexes = [models.Index(fields=['task', 'rank'])]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # 新規サブタスクは兄弟の末尾に追加
+        if not self.rank:
+            siblings = SubTask.objects.filter(task_id=self.task_id, parent_id=self.parent_id)
+            self.rank = rank_after(siblings.aggregate(last=Max('rank'))['last'])
+        super().save(*args, **kwargs)
+
+    def is_complete(self):
+        return self.done_count == self.leaf_count
+
 
 # === 招待機能 ===
 class Invitation(models.Model):
@@ -131,5 +206,75 @@ class Invitation(models.Model):
     status = models.CharField(max_length=20, default='pending') # pending, accepted, declined
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            # 同じタスクへの未回答の招待は1人1件まで
+            models.UniqueConstraint(fields=['task', 'recipient'], condition=models.Q(status='pending'),
+                                    name='unique_pending_invitation'),
+        ]
+
+    def __str__(self):
+        return f"Invite from {self.sender} to {self.recipient}"
+
+# === 通知 ===
+class Notification(models.Model):
+    recipient = models.ForeignKey(User, related_name='notifications', on_delete=models.CASCADE)
+    actor = models.ForeignKey(User, related_name='+', on_delete=models.SET_NULL, null=True, blank=True)
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, null=True, blank=True)
+    kind = models.CharField(max_length=20) # invitation, mention, message, report_done, status, member
+    # 同じ group_key の未読通知は1件にまとめ、count を増やす（ダイジェスト）
+    group_key = models.CharField(max_length=100)
+    message = models.CharField(max_length=255)
+    count = models.PositiveIntegerField(default=1)
+    is_read = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['recipient', 'is_read', '-updated_at'])]
+        constraints = [
+            models.UniqueConstraint(fields=['recipient', 'group_key'], condition=models.Q(is_read=False),
+                                    name='unique_unread_notification_group'),
+        ]
+
+    def __str__(self):
+        return f"{self.recipient}: {self.message}"
+
+# === アクティビティ ===
+class ActivityEvent(models.Model):
+    # 追記のみ（更新・削除しない）。変更と同じトランザクションで書き込む
+    task = models.ForeignKey(Task, related_name='activity', on_delete=models.CASCADE)
+    actor = models.ForeignKey(User, related_name='+', on_delete=models.SET_NULL, null=True, blank=True)
+    kind = models.CharField(max_length=20) # status, subtask, subtask_add, subtask_delete, report_done, role, member_join, member_leave
+    subject_id = models.BigIntegerField(null=True, blank=True) # TaskAssignment / SubTask のID
+    old_value = models.CharField(max_length=100, blank=True, default='')
+    new_value = models.CharField(max_length=100, blank=True, default='')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['task', 'created_at'])]
+
+    def __str__(self):
+        return f"{self.task_id} {self.kind}: {self.old_value} -> {self.new_value}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('activity events are append-only')
+        super().save(*args, **kwargs)
+
+
+class TaskDailyStat(models.Model):
+    # タスクごと・日ごと（Asia/Tokyo）の集計。その日の最後の変更時点の状態を持つ
+    task = models.ForeignKey(Task, related_name='daily_stats', on_delete=models.CASCADE)
+    day = models.DateField()
+    todo = models.PositiveIntegerField(default=0)
+    doing = models.PositiveIntegerField(default=0)
+    done = models.PositiveIntegerField(default=0)
+    subtask_leaf_count = models.PositiveIntegerField(default=0)
+    subtask_done_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['task', 'day'], name='unique_task_daily_stat')]
+
     def __str__(self):
-        return f"Invite from {self.sender} to {self.recipient}"
\ No newline at end of file
+        return f"{self.task_id} {self.day}"
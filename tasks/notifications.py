@@ -0,0 +1,107 @@
+import re
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+
+from .background import run_after_commit
+from .models import Notification, TaskAssignment
+
+# === 通知のファンアウト ===
+# 書き込み時に受信者ごとの通知行を作る。受信者数に関係なく、まとめて UPDATE（既存の未読に加算）
+# と bulk_create（新規）を行い、処理自体はコミット後にバックグラウンドで実行する。
+
+BATCH_SIZE = 500
+UNREAD_CACHE_TIMEOUT = 60 * 10
+# ユーザー名に使える ASCII の文字だけを拾う（\w だと「@aliceさん」の「さん」まで名前に含まれる）
+MENTION_RE = re.compile(r'@([A-Za-z0-9.@+_-]+)')
+
+
+def unread_cache_key(user_id):
+    return f'notifications:unread:{user_id}'
+
+
+def unread_count(user):
+    return cache.get_or_set(unread_cache_key(user.id),
+                            lambda: Notification.objects.filter(recipient=user, is_read=False).count(),
+                            UNREAD_CACHE_TIMEOUT)
+
+
+def mark_all_read(user):
+    updated = Notification.objects.filter(recipient=user, is_read=False).update(is_read=True)
+    cache.delete(unread_cache_key(user.id))
+    return updated
+
+
+def _fan_out(recipient_ids, kind, group_key, message, task_id, actor_id):
+    now = timezone.now()
+    for start in range(0, len(recipient_ids), BATCH_SIZE):
+        chunk = recipient_ids[start:start + BATCH_SIZE]
+        pending = Notification.objects.filter(recipient_id__in=chunk, group_key=group_key, is_read=False)
+        existing = set(pending.values_list('recipient_id', flat=True))
+        if existing:
+            pending.update(count=F('count') + 1, message=message, actor_id=actor_id, updated_at=now)
+        Notification.objects.bulk_create(
+            [Notification(recipient_id=user_id, actor_id=actor_id, task_id=task_id, kind=kind,
+                          group_key=group_key, message=message, updated_at=now)
+             for user_id in chunk if user_id not in existing],
+            batch_size=BATCH_SIZE, ignore_conflicts=True)
+    cache.delete_many([unread_cache_key(user_id) for user_id in recipient_ids])
+
+
+def notify(recipient_ids, kind, group_key, message, task=None, actor=None):
+    """recipient_ids に通知する（actor 自身は除く）。同じ group_key の未読があればまとめる。"""
+    recipient_ids = sorted(set(recipient_ids) - {actor.id if actor else None})
+    if recipient_ids:
+        run_after_commit(_fan_out, recipient_ids, kind, group_key, message,
+                         task.id if task else None, actor.id if actor else None)
+
+
+def member_ids(task):
+    return list(TaskAssignment.objects.filter(task=task).values_list('user_id', flat=True))
+
+
+# --- イベントごとの通知 ---
+
+def notify_invitations(task, sender, recipient_ids):
+    # 一括招待でも受信者全員分を1回のファンアウトで作る
+    notify(recipient_ids, 'invitation', f'invitation:{task.id}',
+           f"{sender.username}さんから「{task.title}」への招待が届きました", task=task, actor=sender)
+
+
+def notify_comment(comment, members=None):
+    task, actor = comment.task, comment.user
+    members = set(member_ids(task) if members is None else members)
+
+    # @ユーザー名 のメンションはタスクのメンバーにだけ届ける
+    names = set(MENTION_RE.findall(comment.content or ''))
+    mentioned = set()
+    if names:
+        mentioned = set(User.objects.filter(username__in=names, id__in=members).values_list('id', flat=True))
+        notify(mentioned, 'mention', f'mention:{comment.thread_id or task.id}',
+               f"{actor.username}さんが「{task.title}」であなたをメンションしました", task=task, actor=actor)
+
+    if comment.message_type == 'report_done':
+        notify(members, 'report_done', f'report_done:{task.id}',
+               f"{actor.username}さんが「{task.title}」の完了を報告しました", task=task, actor=actor)
+    else:
+        # 同じスレッドの新着メッセージは未読の間1件の通知にまとめる
+        thread_name = comment.thread.name if comment.thread_id else 'メイン'
+        notify(members - mentioned, 'message', f'message:{comment.thread_id or task.id}',
+               f"「{task.title}」#{thread_name} に新着メッセージ（最新: {actor.username}さん）", task=task, actor=actor)
+
+
+def notify_status(task, actor, status):
+    # ステータス変更はタスク作成者にまとめて通知
+    notify([task.user_id], 'status', f'status:{task.id}',
+           f"{actor.username}さんが「{task.title}」のステータスを {status} に変更しました", task=task, actor=actor)
+
+
+def notify_membership(task, actor, user, joined):
+    if joined:
+        notify([task.user_id], 'member', f'member:{task.id}',
+               f"{user.username}さんが「{task.title}」に参加しました", task=task, actor=actor)
+    else:
+        notify([user.id], 'member', f'removed:{task.id}',
+               f"「{task.title}」のメンバーから外れました", task=task, actor=actor)
@@ -0,0 +1,83 @@
+from django.db import transaction
+
+from .background import run_after_commit
+
+# === 並び順用の分数ランク（文字列） ===
+# 辞書順で比較できる62進数の小数として扱い、2つのランクの間に必ず新しいランクを作れる。
+# 並び替えは移動した1行だけを書き換え、ランクが長くなりすぎたら一覧をまとめて振り直す。
+
+DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+BASE = len(DIGITS)
+MAX_RANK_LENGTH = 24
+
+
+def _midpoint(a, b):
+    # a < b を満たす a, b の中間（b=None は上限なし）。末尾が '0' のランクは作らない
+    if b is not None:
+        n = 0
+        while n < len(b) and (a[n] if n < len(a) else DIGITS[0]) == b[n]:
+            n += 1
+        if n > 0:
+            return b[:n] + _midpoint(a[n:], b[n:])
+    digit_a = DIGITS.index(a[0]) if a else 0
+    digit_b = DIGITS.index(b[0]) if b is not None else BASE
+    if digit_b - digit_a > 1:
+        return DIGITS[(digit_a + digit_b + 1) // 2]
+    if b is not None and len(b) > 1:
+        return b[0]
+    return DIGITS[digit_a] + _midpoint(a[1:], None)
+
+
+def rank_between(before=None, after=None):
+    """before と after の間に入るランクを返す（どちらも None/空文字なら端を意味する）。"""
+    before = before or ''
+    after = after or None
+    if after is not None and before >= after:
+        raise ValueError(f"rank {before!r} is not before {after!r}")
+    return _midpoint(before, after)
+
+
+def rank_after(last=None):
+    """末尾追加用。先頭桁を1つ進めるので、連続追加でもランクがほとんど伸びない。"""
+    if not last:
+        return DIGITS[1]
+    head = DIGITS.index(last[0])
+    if head < BASE - 1:
+        return DIGITS[head + 1]
+    return last[0] + rank_after(last[1:])
+
+
+def spread(count):
+    """count 個のランクを均等な間隔で生成する（振り直し・初期化用）。"""
+    width = 1
+    while BASE ** width <= count + 1:
+        width += 1
+    step = BASE ** width // (count + 1)
+    ranks = []
+    for i in range(1, count + 1):
+        value = i * step
+        chars = []
+        for _ in range(width):
+            value, digit = divmod(value, BASE)
+            chars.append(DIGITS[digit])
+        ranks.append(''.join(reversed(chars)).rstrip(DIGITS[0]))
+    return ranks
+
+
+def needs_rebalance(rank):
+    return len(rank) > MAX_RANK_LENGTH
+
+
+def rebalance(queryset, field):
+    """queryset の並び順を保ったまま field のランクを均等に振り直す。"""
+    with transaction.atomic():
+        rows = list(queryset.select_for_update().order_by(field, 'id').only('id', field))
+        for row, rank in zip(rows, spread(len(rows))):
+            setattr(row, field, rank)
+        queryset.model.objects.bulk_update(rows, [field], batch_size=500)
+    return len(rows)
+
+
+def schedule_rebalance(queryset, field):
+    # コミット後にバックグラウンドで振り直す（リクエストは待たせない）
+    run_after_commit(rebalance, queryset, field)
@@ -0,0 +1,46 @@
+from datetime import date, datetime, time, timedelta
+from itertools import groupby
+from operator import itemgetter
+
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import TaskAssignment
+
+# === 期限カレンダー ===
+# TaskAssignment に複製した due_date の (user, due_date) インデックスで表示中の期間だけを取り出し、
+# 現地時間（Asia/Tokyo）の日付への振り分けは SQL の TruncDate で行う（Python では日付の計算をしない）。
+# 応答は日付ごとに [id, タイトル, 自分のステータス, 進捗%] の配列を並べた小さな JSON にする。
+
+DEFAULT_DAYS = 42  # 6週間
+MAX_DAYS = 92
+FIELDS = ['id', 'title', 'status', 'progress']
+
+
+def parse_window(start=None, end=None):
+    """?start=&end=（YYYY-MM-DD、両端を含む）を日付にする。省略時は今週の月曜日から6週間。不正なら ValueError。"""
+    if start:
+        start = date.fromisoformat(start)
+    else:
+        today = timezone.localdate()
+        start = today - timedelta(days=today.weekday())
+    end = date.fromisoformat(end) if end else start + timedelta(days=DEFAULT_DAYS - 1)
+    if end < start:
+        raise ValueError('end is before start')
+    return start, min(end, start + timedelta(days=MAX_DAYS - 1))
+
+
+def local_midnight(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def due_calendar(user, start, end):
+    """start〜end（現地時間の日付）に期限がある user の担当タスクを日付ごとにまとめる。"""
+    rows = (TaskAssignment.objects
+            .filter(user=user, due_date__gte=local_midnight(start), due_date__lt=local_midnight(end + timedelta(days=1)))
+            .annotate(day=TruncDate('due_date', tzinfo=timezone.get_current_timezone()))
+            .order_by('due_date', 'task_id')
+            .values_list('day', 'task_id', 'task__title', 'status', 'task__subtask_leaf_count', 'task__subtask_done_count'))
+    return {day.isoformat(): [[task_id, title, status, done * 100 // leaf if leaf else 0]
+                              for _, task_id, title, status, leaf, done in items]
+            for day, items in groupby(rows, key=itemgetter(0))}
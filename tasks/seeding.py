@@ -0,0 +1,161 @@
+import math
+import random
+from datetime import timedelta
+
+# === 大量データの生成（seed_workspace コマンド用） ===
+# タスクをチャンクに分け、チャンクごとに (シード, チャンク番号) から決まる乱数で行を作る。
+# ワーカー数や実行順に関係なく同じシードなら同じデータになる。
+# このモジュールはプロセスプールの子プロセスで動くので Django（モデル・設定）には依存しない。
+# ID はまだ決まっていないので、タスク・サブタスク・スレッドはチャンク内の番号で参照し、
+# 親プロセスが ID を割り当てて保存する。
+
+FAMILY_NAMES = ['佐藤', '鈴木', '高橋', '田中', '伊藤', '渡辺', '山本', '中村', '小林', '加藤',
+                '吉田', '山田', '佐々木', '山口', '松本', '井上', '木村', '林', '清水', '斎藤']
+GIVEN_NAMES = ['翔太', '陽菜', '大輝', '美咲', '拓海', 'さくら', '健太', '結衣', '直樹', '葵',
+               '悠斗', '彩', '亮', '真央', '蓮', '楓', '誠', '愛', '駿', '千尋']
+BIOS = ['フロントエンド担当です。', 'デザインとUIが好きです。', 'インフラまわりを見ています。',
+        '企画・進行管理をしています。', '新人です。よろしくお願いします！', 'テストと品質保証の担当です。', '']
+
+PROJECT_WORDS = ['新機能', '管理画面', 'ログイン', '決済', '検索', '通知', 'API', 'LP', '社内ツール', 'アプリ',
+                 'ダッシュボード', 'レポート', '採用サイト', 'キャンペーン', 'データ移行']
+TASK_VERBS = ['の設計', 'の実装', 'の改修', 'のテスト', 'のリリース準備', 'のデザイン', 'の調査', 'の見積もり', 'の資料作成']
+SUBTASK_WORDS = ['要件整理', 'ワイヤーフレーム作成', 'DB設計', 'API実装', '画面実装', '単体テスト', '結合テスト',
+                 'レビュー対応', '本番反映', 'ドキュメント更新', '議事録作成', '仕様確認', '不具合修正', '性能確認']
+THREAD_NAMES = ['デザイン', '実装', '相談', '雑談', 'リリース', 'レビュー', '不具合']
+ROLE_NAMES = ['リーダー', 'デザイナー', 'エンジニア', 'レビュアー', 'PM', None, None, None]
+
+MESSAGE_OPENERS = ['お疲れさまです。', '確認しました。', 'すみません、', '了解です！', 'ありがとうございます。', '', '', '']
+MESSAGE_BODIES = ['{word}の件、今日中に見ておきます', '{word}で少し詰まっています', '{word}のレビューをお願いします',
+                  '{word}は明日の午前に対応します', '{word}の仕様、この認識で合っていますか？', '{word}終わりました',
+                  '{word}の資料を共有します', '{word}、もう少し時間をください', '{word}について相談させてください',
+                  '{word}の進捗はどうですか？']
+MESSAGE_CLOSERS = ['', '', '', 'よろしくお願いします。', '🙏', '！', '…', 'あとで確認します。']
+
+STATUS_WEIGHTS = (('todo', 45), ('doing', 30), ('done', 25))
+# メンバー以外への招待は未回答か辞退のみ（承諾済みなら参加しているはず）。
+# 承諾済みの招待は、オーナー以外のメンバーの一部に参加の経緯として付ける
+INVITATION_WEIGHTS = (('pending', 75), ('declined', 25))
+INVITED_MEMBER_RATE = 0.35
+
+
+def choose(rng, weighted):
+    values, weights = zip(*weighted)
+    return rng.choices(values, weights)[0]
+
+
+def geometric(rng, mean):
+    """平均 mean（1以上）の幾何分布。"""
+    if mean <= 1:
+        return 1
+    return 1 + int(math.log(1 - rng.random()) / math.log(1 - 1 / mean))
+
+
+def owner_weights(users):
+    # タスクを作る人は偏る（よく使う人ほど多く作る）: 順位の -0.8 乗に比例
+    weights = [1 / (rank + 1) ** 0.8 for rank in range(users)]
+    total = 0
+    cumulative = []
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+    return cumulative
+
+
+def user_rows(seed, first_index, count):
+    rng = random.Random(f'{seed}:users:{first_index}')
+    return [(rng.choice(FAMILY_NAMES), rng.choice(GIVEN_NAMES), rng.choice(BIOS)) for _ in range(count)]
+
+
+def task_title(rng):
+    return f'{rng.choice(PROJECT_WORDS)}{rng.choice(TASK_VERBS)}'
+
+
+def message_text(rng, words):
+    body = rng.choice(MESSAGE_BODIES).format(word=rng.choice(words))
+    return f'{rng.choice(MESSAGE_OPENERS)}{body}{rng.choice(MESSAGE_CLOSERS)}'
+
+
+def generate_chunk(args):
+    """1チャンク分のタスクとその関連行を作る。
+
+    args は (シード, チャンク番号, タスク数, ユーザーの先頭ID, ユーザー数, 基準時刻, 平均チャット量)。
+    返り値は行（タプル）のリストの dict。t はチャンク内のタスク番号、s はサブタスク番号、h はスレッド番号。
+    """
+    seed, chunk, count, first_user_id, users, now, chat_scale = args
+    rng = random.Random(f'{seed}:tasks:{chunk}')
+    cumulative = owner_weights(users)
+    rows = {'tasks': [], 'assignments': [], 'subtasks': [], 'threads': [], 'comments': [], 'invitations': []}
+
+    for t in range(count):
+        owner = first_user_id + rng.choices(range(users), cum_weights=cumulative)[0]
+        created = now - timedelta(days=rng.uniform(0, 365))
+        due = None
+        if rng.random() < 0.8:
+            # 期限は作成から数日〜数か月後の夕方〜夜（現地時間のずれは基準時刻からの相対で十分）
+            due = created + timedelta(days=rng.triangular(1, 120, 14), hours=rng.randint(0, 6))
+        title = task_title(rng)
+        rows['tasks'].append((title, f'{title}を進めるためのタスクです。', owner, created, due))
+
+        # チームの人数: 対数正規分布（中央値3人前後、まれに大人数）
+        size = max(1, min(users, int(rng.lognormvariate(1.1, 0.6))))
+        members = [owner] + rng.sample(range(first_user_id, first_user_id + users), min(users, size + 1))
+        members = list(dict.fromkeys(members))[:size]
+        for index, user_id in enumerate(members):
+            status = choose(rng, STATUS_WEIGHTS)
+            role = 'リーダー' if index == 0 else rng.choice(ROLE_NAMES)
+            joined = created + timedelta(hours=rng.uniform(0, 72 * index))
+            rows['assignments'].append((t, user_id, status, role, joined))
+            if index and rng.random() < INVITED_MEMBER_RATE:
+                invited = max(created, joined - timedelta(hours=rng.expovariate(1 / 12)))
+                rows['invitations'].append((t, owner, user_id, 'accepted', invited))
+        done_ratio = {'todo': 0.1, 'doing': 0.5, 'done': 1.0}[rows['assignments'][-len(members)][2]]
+
+        # WBS: 最大3階層。末端だけが完了状態を持つ
+        _generate_subtasks(rng, rows['subtasks'], t, created, done_ratio)
+
+        # スレッドとメッセージ: 短時間に集中する「会話」が不規則な間隔で起きる
+        thread_names = ['メイン'] + rng.sample(THREAD_NAMES, min(len(THREAD_NAMES), geometric(rng, 1.4) - 1))
+        words = [title] + rng.sample(SUBTASK_WORDS, 3)
+        for h, name in enumerate(thread_names):
+            seq = 0
+            at = created + timedelta(minutes=rng.uniform(0, 600))
+            sessions = int(rng.paretovariate(1.6) * chat_scale * (1 if h == 0 else 0.4))
+            last_author = None
+            for _ in range(sessions):
+                at += timedelta(hours=rng.expovariate(1 / 30))
+                if at > now:
+                    break
+                for _ in range(geometric(rng, 5)):
+                    # 直前の発言者とは別の人が返信しやすい
+                    candidates = [m for m in members if m != last_author] or members
+                    author = rng.choice(candidates if rng.random() < 0.7 else members)
+                    seq += 1
+                    rows['comments'].append((t, h, author, message_text(rng, words), at, seq, 'normal'))
+                    last_author = author
+                    at += timedelta(seconds=rng.expovariate(1 / 90))
+            rows['threads'].append((t, h, name, created, seq))
+
+        # 招待: メンバー以外へ（未回答か辞退）。未回答は1タスク1人1件まで
+        outsiders = [u for u in rng.sample(range(first_user_id, first_user_id + users), min(users, 4)) if u not in members]
+        for recipient in outsiders[:geometric(rng, 1.5) - 1]:
+            rows['invitations'].append((t, owner, recipient, choose(rng, INVITATION_WEIGHTS),
+                                        created + timedelta(hours=rng.uniform(0, 240))))
+    return rows
+
+
+def _generate_subtasks(rng, out, t, created, done_ratio):
+    """out に (t, s, 親の s, タイトル, 完了, 深さ, 兄弟内の位置, 作成日時) を親→子の順で追加する。"""
+    counter = [0]
+
+    def add(parent, depth, siblings):
+        for position in range(siblings):
+            s = counter[0]
+            counter[0] += 1
+            has_children = depth < 2 and rng.random() < 0.25
+            is_done = not has_children and rng.random() < done_ratio
+            out.append((t, s, parent, rng.choice(SUBTASK_WORDS), is_done, depth, position,
+                        created + timedelta(minutes=rng.uniform(0, 1440))))
+            if has_children:
+                add(s, depth + 1, geometric(rng, 3))
+
+    add(None, 0, geometric(rng, 4) if rng.random() < 0.85 else 0)
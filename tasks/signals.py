@@ -0,0 +1,47 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import access, cache, metrics
+from .models import Task, TaskAssignment, Invitation, Profile
+
+
+# === アクセス権・名前空間キャッシュの無効化 ===
+
+@receiver([post_save, post_delete], sender=TaskAssignment)
+def assignment_changed(sender, instance, **kwargs):
+    access.invalidate(instance.user_id)
+    cache.invalidate('board', instance.user_id)
+    cache.invalidate('profile', instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Invitation)
+def invitation_changed(sender, instance, **kwargs):
+    access.invalidate(instance.recipient_id)
+    cache.invalidate('invitation', instance.recipient_id)
+
+
+@receiver([post_save, post_delete], sender=Task)
+def task_changed(sender, instance, **kwargs):
+    # 作成者が作成したタスクの一覧
+    access.invalidate(instance.user_id)
+    cache.invalidate('task', instance.id)
+
+
+@receiver(post_save, sender=Task)
+def copy_due_date(sender, instance, created, **kwargs):
+    # 期限カレンダー用に各メンバーの TaskAssignment.due_date を揃える
+    if not created:
+        TaskAssignment.objects.filter(task=instance).exclude(due_date=instance.due_date).update(due_date=instance.due_date)
+
+
+@receiver([post_save, post_delete], sender=Profile)
+def profile_changed(sender, instance, **kwargs):
+    cache.invalidate('profile', instance.user_id)
+
+
+# === メトリクス ===
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    metrics.DB_CONNECTIONS.inc(connection.alias)
@@ -0,0 +1,61 @@
+import importlib.util
+import os
+import subprocess
+import sys
+from collections import Counter, namedtuple
+
+from django.conf import settings
+
+# === 起動時間の計測 ===
+# 新しいインタープリタで `python -X importtime` を使って module を読み込み、モジュールごとの
+# import 時間（自身の分 / 依存を含めた累計、マイクロ秒）を集める。
+
+ImportEntry = namedtuple('ImportEntry', ['name', 'self_us', 'cumulative_us', 'depth'])
+
+PROJECT_PACKAGES = ('kanban_project', 'tasks')
+
+
+def import_profile(module='kanban_project.wsgi', warm=False):
+    """module を新しいプロセスで import し、読み込まれた順の ImportEntry 一覧を返す。"""
+    code = f'import {module}'
+    if warm:
+        code += '\nfrom kanban_project.serving import warm_up\nwarm_up()'
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=settings.BASE_DIR,
+                            check=True, capture_output=True, text=True).stderr
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append(ImportEntry(name.strip(), int(self_us), int(cumulative_us), depth))
+    return entries
+
+
+def total_us(entries):
+    # 一番外側（depth 0）の累計の合計が import 全体の時間
+    return sum(entry.cumulative_us for entry in entries if entry.depth == 0)
+
+
+def by_package(entries):
+    """トップレベルのパッケージごとに自身の import 時間を合計する。"""
+    totals = Counter()
+    for entry in entries:
+        totals[entry.name.split('.')[0]] += entry.self_us
+    return totals
+
+
+def missing_bytecode(entries):
+    """キャッシュ済みのバイトコード（__pycache__/*.pyc）が無く、起動のたびにコンパイルされるプロジェクトのモジュール。"""
+    missing = []
+    for entry in entries:
+        if entry.name.split('.')[0] not in PROJECT_PACKAGES:
+            continue
+        spec = importlib.util.find_spec(entry.name)
+        if spec and spec.cached and not os.path.exists(spec.cached):
+            missing.append(entry.name)
+    return missing
+
+
+def bytecode_disabled():
+    return bool(os.environ.get('PYTHONDONTWRITEBYTECODE')) or sys.dont_write_bytecode
@@ -0,0 +1,35 @@
+from django import template
+
+register = template.Library()
+
+# 担当ステータスごとのメンバー進捗バー（幅, 色）
+MEMBER_PROGRESS = {
+    'done': ('100%', 'var(--prog-green)'),
+    'doing': ('50%', '#f59e0b'),
+    'todo': ('5%', '#cbd5e1'),
+}
+
+
+@register.filter
+def avatar_url(user):
+    """プロフィール画像のURL（プロフィール未作成・画像なしは空文字）。"""
+    profile = getattr(user, 'profile', None)
+    return profile.icon.url if profile is not None and profile.icon else ''
+
+
+@register.inclusion_tag('tasks/member_row.html', takes_context=True)
+def member_row(context, assign):
+    """メンバー1行。assign は user__profile を select_related 済みの TaskAssignment。"""
+    user = assign.user
+    profile = getattr(user, 'profile', None)
+    width, color = MEMBER_PROGRESS.get(assign.status, MEMBER_PROGRESS['todo'])
+    return {
+        'assign': assign,
+        'user': user,
+        'bio': (profile.bio if profile is not None else '') or '',
+        'icon_url': avatar_url(user),
+        'is_me': user.id == context['request'].user.id,
+        'is_owner': context.get('is_owner', False),
+        'progress_width': width,
+        'progress_color': color,
+    }
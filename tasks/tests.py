@@ -1,3 +1,1002 @@
-from django.test import TestCase
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import IntegrityError, OperationalError, connections, transaction
+from django.db.backends.sqlite3 import base as django_sqlite3
+from django.contrib.sessions.models import Session
+from django.http import HttpResponse
+from django.test.utils import CaptureQueriesContext
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from kanban_project.sqlite_backend import base as sqlite_backend
+
+from . import (access, activity, assets, background, cache, chat, health, invitations, kanban, metrics, notifications, ranking, schedule, seeding, views,
+               wbs)
+from .models import (Task, TaskAssignment, SubTask, Comment, Profile, Notification, OneTimePassword, Invitation,
+                     ActivityEvent, ChatThread, ThreadReadCursor)
+
+
+def make_user(username):
+    return User.objects.create_user(username, f'{username}@example.com', 'test-password')
+
+
+def make_task(owner, title='タスク', **fields):
+    task = Task.objects.create(title=title, user=owner, **fields)
+    TaskAssignment.objects.create(task=task, user=owner, status='todo', role_name='リーダー')
+    return task
+
+
+def post_json(client, name, data):
+    return client.post(reverse(name), json.dumps(data), content_type='application/json')
+
+
+class CacheIsolatedTestCase(TestCase):
+    # キャッシュはテストのロールバック対象外なので、前のテストの（同じIDの）値を持ち越さない
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+
+
+# === カンバン列モード ===
+
+class KanbanColumnTests(CacheIsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user('kanban')
+        for i in range(kanban.PAGE_SIZE + 5):
+            task = make_task(self.user, f'進行中 {i}')
+            TaskAssignment.objects.filter(task=task).update(status='doing')
+        make_task(self.user, '未着手')
+
+    def test_first_pages_counts_every_column(self):
+        columns = {column['status']: column for column in kanban.first_pages(self.user)}
+        self.assertEqual(columns['doing']['total'], kanban.PAGE_SIZE + 5)
+        self.assertEqual(len(columns['doing']['cards']), kanban.PAGE_SIZE)
+        self.assertIsNotNone(columns['doing']['next_cursor'])
+        self.assertEqual(columns['todo']['total'], 1)
+        self.assertIsNone(columns['todo']['next_cursor'])
+        self.assertEqual(columns['done']['cards'], [])
+
+    def test_column_pages_follow_board_rank_without_gaps(self):
+        first = kanban.first_pages(self.user)[1]
+        rest, cursor = kanban.column_page(self.user, 'doing', first['next_cursor'])
+        self.assertIsNone(cursor)
+        ranks = [(card.board_rank, card.id) for card in first['cards'] + rest]
+        self.assertEqual(len(ranks), kanban.PAGE_SIZE + 5)
+        self.assertEqual(ranks, sorted(ranks))
+
+    def test_invalid_cursor_returns_empty_page(self):
+        self.assertEqual(kanban.column_page(self.user, 'doing', 'not-a-cursor'), ([], None))
+
+    def test_column_api_returns_next_page(self):
+        self.client.force_login(self.user)
+        cursor = kanban.first_pages(self.user)[1]['next_cursor']
+        response = self.client.get(reverse('api_board_column', args=['doing']), {'cursor': cursor})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json()['next_cursor'])
+
+
+class MemberRowQueryTests(CacheIsolatedTestCase):
+    """タスク編集画面のメンバー一覧（member_row タグ）がメンバー数に比例してクエリを増やさないこと。"""
+
+    def setUp(self):
+        super().setUp()
+        self.owner = make_user('leader')
+        self.task = make_task(self.owner)
+        self.client.force_login(self.owner)
+
+    def render(self):
+        response = self.client.get(reverse('task_edit', args=[self.task.id]))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_query_count_does_not_grow_with_members(self):
+        self.render()
+        with CaptureQueriesContext(connections['default']) as captured:
+            self.render()
+        # 次のリクエストで queries_log が消えるので、ここで数えておく
+        one_member = len(captured)
+        for i, status in enumerate(['todo', 'doing', 'done'] * 3):
+            user = make_user(f'member{i}')
+            if i % 2:
+                Profile.objects.create(user=user, bio=f'自己紹介 {i}')
+            TaskAssignment.objects.create(task=self.task, user=user, status=status)
+        self.render()
+        with self.assertNumQueries(one_member):
+            response = self.render()
+        self.assertContains(response, 'class="m-card"', count=10)
+        self.assertContains(response, '自己紹介 1')
+
+
+# === 分数ランク ===
+
+class RankingTests(SimpleTestCase):
+    def assert_valid_rank(self, rank):
+        self.assertTrue(rank)
+        self.assertFalse(rank.endswith(ranking.DIGITS[0]), rank)
+        self.assertTrue(set(rank) <= set(ranking.DIGITS), rank)
+
+    def test_midpoint_is_strictly_between(self):
+        rng = random.Random(0)
+        ranks = ranking.spread(50)
+        for _ in range(500):
+            a, b = sorted(rng.sample(ranks, 2))
+            middle = ranking._midpoint(a, b)
+            self.assertLess(a, middle)
+            self.assertLess(middle, b)
+            self.assert_valid_rank(middle)
+
+    def test_midpoint_of_adjacent_digits_goes_one_level_deeper(self):
+        self.assertEqual(ranking._midpoint('1', '2'), '1V')
+        self.assertEqual(ranking._midpoint('', '1'), '0V')
+        self.assertEqual(ranking._midpoint('z', None), 'zV')
+
+    def test_rank_between_open_ends(self):
+        first = ranking.rank_between()
+        self.assert_valid_rank(first)
+        self.assertLess(ranking.rank_between(None, first), first)
+        self.assertGreater(ranking.rank_between(first, None), first)
+
+    def test_rank_between_rejects_unordered_neighbours(self):
+        with self.assertRaises(ValueError):
+            ranking.rank_between('5', '5')
+        with self.assertRaises(ValueError):
+            ranking.rank_between('6', '5')
+
+    def test_repeated_inserts_at_one_spot_stay_ordered(self):
+        order = ['1', '2']
+        for _ in range(200):
+            order.insert(1, ranking.rank_between(order[0], order[1]))
+        self.assertEqual(order, sorted(order))
+        self.assertEqual(len(set(order)), len(order))
+        self.assertTrue(any(ranking.needs_rebalance(rank) for rank in order))
+
+    def test_rank_after_always_increases(self):
+        rank, previous = None, ''
+        for _ in range(200):
+            rank = ranking.rank_after(rank)
+            self.assertGreater(rank, previous)
+            self.assert_valid_rank(rank)
+            previous = rank
+        self.assertLessEqual(len(rank), 5)
+
+    def test_spread_is_increasing(self):
+        for count in (1, 61, 62, 1000):
+            ranks = ranking.spread(count)
+            self.assertEqual(len(ranks), count)
+            self.assertEqual(ranks, sorted(set(ranks)))
+            for rank in ranks:
+                self.assert_valid_rank(rank)
+
+    def test_migration_backfill_matches_spread(self):
+        migration = import_module('tasks.migrations.0004_ranks')
+        for count in (1, 100, 5000):
+            self.assertEqual(migration.spread(count), ranking.spread(count))
+
+
+# === 階層WBS ===
+
+class WbsRollupTests(TestCase):
+    def setUp(self):
+        self.task = make_task(make_user('wbs'))
+
+    def counters(self):
+        self.task.refresh_from_db()
+        nodes = {pk: (leaf, done) for pk, leaf, done in
+                 SubTask.objects.filter(task=self.task).values_list('id', 'leaf_count', 'done_count')}
+        return (self.task.subtask_leaf_count, self.task.subtask_done_count), nodes
+
+    def assert_consistent(self):
+        # 差分で積み上げた集計値が、木全体から数え直した値と一致する
+        incremental = self.counters()
+        wbs.rebuild(self.task)
+        self.assertEqual(incremental, self.counters())
+
+    def test_rollup_after_add_toggle_and_delete(self):
+        design = wbs.add_subtask(self.task, '設計')
+        build = wbs.add_subtask(self.task, '実装')
+        self.assertEqual(self.counters()[0], (2, 0))
+
+        wbs.toggle_subtask(design, True)
+        self.assertEqual(self.counters()[0], (2, 1))
+        self.assertEqual(self.task.progress_percent(), 50)
+
+        # 完了した末端に子を足すと、親の完了は子の未完了に置き換わる（手元の design は切り替え前のまま）
+        screen = wbs.add_subtask(self.task, '画面', parent=design)
+        api = wbs.add_subtask(self.task, 'API', parent=design)
+        self.assertEqual(self.counters()[0], (3, 0))
+        self.assert_consistent()
+
+        wbs.toggle_subtask(screen, True)
+        wbs.toggle_subtask(api, True)
+        design.refresh_from_db()
+        self.assertEqual((design.leaf_count, design.done_count), (2, 2))
+        self.assertEqual(self.counters()[0], (3, 2))
+        self.assert_consistent()
+
+        # 最後の子を消すと親は末端に戻る（親の完了状態で数える）
+        wbs.delete_subtask(screen)
+        wbs.delete_subtask(api)
+        self.assertEqual(self.counters()[0], (2, 1))
+        self.assert_consistent()
+
+        wbs.delete_subtask(design)
+        wbs.delete_subtask(build)
+        self.assertEqual(self.counters()[0], (0, 0))
+        self.assertFalse(SubTask.objects.filter(task=self.task).exists())
+
+    def test_delete_removes_whole_subtree(self):
+        root = wbs.add_subtask(self.task, '親')
+        child = wbs.add_subtask(self.task, '子', parent=root)
+        wbs.toggle_subtask(wbs.add_subtask(self.task, '孫', parent=child), True)
+        wbs.delete_subtask(root)
+        self.assertFalse(SubTask.objects.filter(task=self.task).exists())
+        self.assertEqual(self.counters()[0], (0, 0))
+
+    def test_delete_twice_is_ignored(self):
+        keep = wbs.add_subtask(self.task, '残す')
+        gone = wbs.add_subtask(self.task, '消す')
+        wbs.delete_subtask(gone)
+        wbs.delete_subtask(gone)
+        self.assertEqual(self.counters()[0], (1, 0))
+        self.assertTrue(SubTask.objects.filter(id=keep.id).exists())
+
+    @override_settings(BACKGROUND_TASKS_SYNC=True)
+    def test_add_and_delete_update_timeline(self):
+        actor = self.task.user
+        with self.captureOnCommitCallbacks(execute=True):
+            first = wbs.add_subtask(self.task, '設計', actor=actor)
+            wbs.add_subtask(self.task, '実装', actor=actor)
+        self.assertEqual(activity.timeline(self.task.id, days=1)['total'], [2])
+        with self.captureOnCommitCallbacks(execute=True):
+            wbs.delete_subtask(first, actor=actor)
+        series = activity.timeline(self.task.id, days=1)
+        self.assertEqual((series['total'], series['remaining']), ([1], [1]))
+        events = ActivityEvent.objects.filter(task=self.task).order_by('id')
+        self.assertEqual(list(events.values_list('kind', 'old_value', 'new_value')),
+                         [('subtask_add', '', '設計'), ('subtask_add', '', '実装'), ('subtask_delete', '設計', '')])
+
+    def test_only_leaves_can_be_toggled(self):
+        parent = wbs.add_subtask(self.task, '親')
+        wbs.add_subtask(self.task, '子', parent=parent)
+        parent.refresh_from_db()
+        with self.assertRaises(ValueError):
+            wbs.toggle_subtask(parent, True)
+
+
+# === 通知・バックグラウンド処理 ===
+
+@override_settings(BACKGROUND_TASKS_SYNC=True)
+class StatusNotificationTests(CacheIsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = make_user('owner')
+        self.member = make_user('member')
+        self.task = make_task(self.owner)
+        self.other = make_task(self.member, '別のタスク')
+        TaskAssignment.objects.create(task=self.task, user=self.member, status='todo')
+        self.client.force_login(self.member)
+
+    def status_notifications(self):
+        return Notification.objects.filter(recipient=self.owner, kind='status').count()
+
+    def move(self, status, **neighbours):
+        with self.captureOnCommitCallbacks(execute=True):
+            return post_json(self.client, 'api_move_card', {'task_id': self.task.id, 'status': status, **neighbours})
+
+    def test_reorder_within_column_does_not_notify(self):
+        response = self.move('todo', before_task_id=self.other.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.status_notifications(), 0)
+
+    def test_moving_to_another_column_notifies_owner(self):
+        self.assertEqual(self.move('doing').status_code, 200)
+        self.assertEqual(self.status_notifications(), 1)
+
+    def test_update_status_notifies_only_on_change(self):
+        for status in ('todo', 'doing', 'doing'):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = post_json(self.client, 'api_update_status', {'task_id': self.task.id, 'status': status})
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.status_notifications(), 1)
+
+
+@override_settings(BACKGROUND_TASKS_SYNC=True)
+class CommentNotificationTests(CacheIsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = make_user('owner')
+        self.alice = make_user('alice')
+        self.task = make_task(self.owner)
+        TaskAssignment.objects.create(task=self.task, user=self.alice, status='todo')
+
+    def comment(self, content, user=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            notifications.notify_comment(Comment.objects.create(task=self.task, user=user or self.owner,
+                                                                content=content))
+
+    def test_mention_followed_by_japanese(self):
+        self.comment('@aliceさん確認お願いします')
+        self.assertTrue(Notification.objects.filter(recipient=self.alice, kind='mention').exists())
+        self.assertFalse(Notification.objects.filter(recipient=self.alice, kind='message').exists())
+
+    def test_unread_messages_are_coalesced(self):
+        for i in range(3):
+            self.comment(f'メッセージ {i}')
+        notification = Notification.objects.get(recipient=self.alice)
+        self.assertEqual((notification.kind, notification.count), ('message', 3))
+        self.assertEqual(notifications.unread_count(self.alice), 1)
+
+        # 既読にした後の新着は新しい1件になる
+        notifications.mark_all_read(self.alice)
+        self.comment('既読後')
+        self.assertEqual(Notification.objects.filter(recipient=self.alice, is_read=False).get().count, 1)
+
+
+class BackgroundPoolTests(TestCase):
+    def test_failed_job_is_logged_and_pool_keeps_running(self):
+        done = []
+
+        def fail():
+            raise RuntimeError('boom')
+
+        with self.assertLogs('tasks.background', 'ERROR') as logs:
+            with self.captureOnCommitCallbacks(execute=True):
+                background.run_after_commit(fail)
+                background.run_after_commit(done.append, 'ok')
+            background.drain()
+        self.assertIn('fail', logs.output[0])
+        self.assertEqual(done, ['ok'])
+
+
+# === アクセス権 ===
+
+class AccessRevocationTests(CacheIsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = make_user('owner')
+        self.member = make_user('member')
+        self.task = make_task(self.owner)
+        TaskAssignment.objects.create(task=self.task, user=self.member, status='todo')
+        self.client.force_login(self.member)
+
+    def add_subtask(self):
+        return post_json(self.client, 'api_add_subtask', {'task_id': self.task.id, 'title': '作業'})
+
+    def test_removed_member_loses_access(self):
+        self.assertEqual(self.client.get(reverse('task_edit', args=[self.task.id])).status_code, 200)
+        owner = self.client_class()
+        owner.force_login(self.owner)
+        owner.post(reverse('remove_member', args=[self.task.id]), {'user_id': self.member.id})
+        self.assertEqual(self.client.get(reverse('task_edit', args=[self.task.id])).status_code, 404)
+        self.assertEqual(self.add_subtask().status_code, 403)
+
+    def test_writes_are_checked_against_database_despite_stale_cache(self):
+        # 別のワーカーで外された場合: このプロセスのキャッシュにはまだメンバーとして残っている
+        self.assertEqual(self.client.get(reverse('task_edit', args=[self.task.id])).status_code, 200)
+        with mock.patch.object(access, 'invalidate'):
+            TaskAssignment.objects.filter(task=self.task, user=self.member).delete()
+        self.assertIn(self.task.id, caches['default'].get(access.cache_key(self.member.id))['members'])
+        self.assertEqual(self.add_subtask().status_code, 403)
+        self.assertFalse(SubTask.objects.filter(task=self.task).exists())
+
+    def test_outsider_cannot_read_or_write(self):
+        self.client.force_login(make_user('outsider'))
+        self.assertEqual(self.client.get(reverse('task_edit', args=[self.task.id])).status_code, 404)
+        self.assertEqual(self.add_subtask().status_code, 403)
+
+    def test_grant_on_another_worker_is_visible_on_next_get(self):
+        # 参加前の GET で「メンバーではない」がキャッシュされた後、別のワーカーで参加した場合
+        outsider = make_user('newcomer')
+        self.client.force_login(outsider)
+        self.assertEqual(self.client.get(reverse('task_edit', args=[self.task.id])).status_code, 404)
+        with mock.patch.object(access, 'invalidate'):
+            TaskAssignment.objects.create(task=self.task, user=outsider)
+        self.assertNotIn(self.task.id, caches['default'].get(access.cache_key(outsider.id))['members'])
+        self.assertEqual(self.client.get(reverse('task_edit', args=[self.task.id])).status_code, 200)
+
+    def test_join_by_link_then_get(self):
+        newcomer = make_user('newcomer')
+        self.client.force_login(newcomer)
+        self.client.get(reverse('task_edit', args=[self.task.id]))
+        with mock.patch.object(access, 'invalidate'):
+            response = self.client.get(reverse('join_task_via_link', args=[self.task.id]))
+        self.assertRedirects(response, reverse('task_edit', args=[self.task.id]))
+
+    def test_owner_only_actions_use_database_role(self):
+        response = post_json(self.client, 'api_update_role', {
+            'assignment_id': TaskAssignment.objects.get(task=self.task, user=self.member).id, 'role_name': 'PM'})
+        self.assertEqual(response.status_code, 403)
+
+
+# === 2段階認証の途中状態（署名付きCookie） ===
+
+@override_settings(PRE_2FA_SIGNED_COOKIE=True, SESSION_ENGINE='django.contrib.sessions.backends.db')
+class PreTwoFactorCookieTests(CacheIsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user('twofactor')
+        self.code = OneTimePassword.objects.create(user=self.user).generate_code()
+
+    def start(self, remember=False):
+        # ログイン画面のパスワード確認後と同じ Cookie を発行する
+        request = RequestFactory().post('/login/')
+        response = views._start_pre_2fa(request, HttpResponse(), self.user.id, remember)
+        self.client.cookies[views.PRE_2FA_COOKIE] = response.cookies[views.PRE_2FA_COOKIE].value
+
+    def test_pending_step_creates_no_session(self):
+        self.start()
+        response = self.client.get(reverse('verify_code'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, self.user.email)
+        self.assertEqual(Session.objects.count(), 0)
+
+    def test_correct_code_logs_in_and_clears_cookie(self):
+        self.start(remember=True)
+        response = self.client.post(reverse('verify_code'), {'code': self.code})
+        self.assertRedirects(response, reverse('board'), fetch_redirect_response=False)
+        self.assertEqual(int(self.client.session['_auth_user_id']), self.user.id)
+        self.assertEqual(self.client.session.get_expiry_age(), views.REMEMBER_ME_AGE)
+        self.assertEqual(response.cookies[views.PRE_2FA_COOKIE].value, '')
+
+    def test_wrong_code_keeps_pending_state(self):
+        self.start()
+        response = self.client.post(reverse('verify_code'), {'code': '000000' if self.code != '000000' else '111111'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_tampered_cookie_is_rejected(self):
+        self.start()
+        cookie = self.client.cookies[views.PRE_2FA_COOKIE].value
+        self.client.cookies[views.PRE_2FA_COOKIE] = cookie.replace(f'{self.user.id}-', f'{self.user.id + 1}-', 1)
+        self.assertRedirects(self.client.get(reverse('verify_code')), reverse('login'), fetch_redirect_response=False)
+
+    def test_expired_cookie_is_rejected(self):
+        self.start()
+        with mock.patch.object(views, 'PRE_2FA_MAX_AGE', -1):
+            response = self.client.get(reverse('verify_code'))
+        self.assertRedirects(response, reverse('login'), fetch_redirect_response=False)
+
+
+# === 招待・参加 ===
+
+@override_settings(BACKGROUND_TASKS_SYNC=True)
+class JoinIdempotencyTests(CacheIsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = make_user('owner')
+        self.guest = make_user('guest')
+        self.task = make_task(self.owner)
+        self.invitation = Invitation.objects.create(task=self.task, sender=self.owner, recipient=self.guest)
+
+    def joins(self):
+        return (TaskAssignment.objects.filter(task=self.task, user=self.guest).count(),
+                ActivityEvent.objects.filter(task=self.task, kind='member_join').count())
+
+    def test_duplicate_assignment_is_rejected(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            TaskAssignment.objects.create(task=self.task, user=self.owner)
+
+    def test_accept_twice_joins_once(self):
+        _, joined = invitations.accept(self.invitation.id, self.guest)
+        self.assertTrue(joined)
+        _, joined = invitations.accept(self.invitation.id, self.guest)
+        self.assertFalse(joined)
+        self.assertEqual(self.joins(), (1, 1))
+
+    def test_accept_after_joining_by_link(self):
+        self.client.force_login(self.guest)
+        self.client.get(reverse('join_task_via_link', args=[self.task.id]))
+        invitation, joined = invitations.accept(self.invitation.id, self.guest)
+        self.assertFalse(joined)
+        self.assertEqual(invitation.status, 'accepted')
+        self.assertEqual(self.joins(), (1, 1))
+
+    def test_join_by_link_racing_accept(self):
+        # 参加確認の直後に招待の承諾が割り込んだ場合
+        invitations.accept(self.invitation.id, self.guest)
+        self.client.force_login(self.guest)
+        with mock.patch.object(access, 'is_member', return_value=False):
+            response = self.client.get(reverse('join_task_via_link', args=[self.task.id]))
+        self.assertRedirects(response, reverse('task_edit', args=[self.task.id]), fetch_redirect_response=False)
+        self.assertEqual(self.joins(), (1, 1))
+
+
+@override_settings(BACKGROUND_TASKS_SYNC=True)
+class BulkInviteTests(CacheIsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = make_user('owner')
+        self.task = make_task(self.owner)
+        self.alice = make_user('alice')
+        self.alice.email = 'Alice@Example.com'
+        self.alice.save()
+
+    def test_email_matches_case_insensitively(self):
+        result = invitations.bulk_invite(self.task, self.owner, ['alice@example.COM', 'nobody@example.com'])
+        self.assertEqual(result.invited, ['alice'])
+        self.assertEqual(result.not_found, ['nobody@example.com'])
+
+    def test_sender_is_reported_as_skipped(self):
+        result = invitations.bulk_invite(self.task, self.owner, ['owner', 'alice'])
+        self.assertEqual(result.skipped, ['owner'])
+        self.assertEqual(result.invited, ['alice'])
+        self.assertFalse(Invitation.objects.filter(recipient=self.owner).exists())
+
+    def test_api_returns_skipped(self):
+        self.client.force_login(self.owner)
+        response = post_json(self.client, 'api_bulk_invite', {'task_id': self.task.id, 'users': ['owner']})
+        self.assertEqual(response.json()['skipped'], ['owner'])
+
+    @override_settings(BULK_INVITE_LIMIT=2)
+    def test_form_applies_limit(self):
+        self.client.force_login(self.owner)
+        self.client.post(reverse('invite_user', args=[self.task.id]), {'username': 'alice, bob, carol'})
+        self.assertFalse(Invitation.objects.exists())
+        self.client.post(reverse('invite_user', args=[self.task.id]), {'username': 'alice'})
+        self.assertEqual(Invitation.objects.count(), 1)
+
+
+# === チャットの既読位置 ===
+
+class ThreadReadTests(CacheIsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = make_user('owner')
+        self.reader = make_user('reader')
+        task = make_task(self.owner)
+        TaskAssignment.objects.create(task=task, user=self.reader)
+        self.thread = ChatThread.objects.create(task=task)
+        for text in ('一', '二', '三'):
+            chat.post_comment(self.thread, task=task, user=self.owner, content=text)
+        self.client.force_login(self.reader)
+
+    def mark(self, seq):
+        response = post_json(self.client, 'api_mark_thread_read', {'thread_id': self.thread.id, 'seq': seq})
+        self.assertEqual(response.status_code, 200)
+        return ThreadReadCursor.objects.get(user=self.reader, thread=self.thread).last_read_seq
+
+    def test_seq_is_clamped_to_thread(self):
+        self.assertEqual(self.mark(-5), 0)
+        self.assertEqual(self.mark(10 ** 6), 3)
+
+    def test_cursor_never_moves_back(self):
+        self.assertEqual(self.mark(2), 2)
+        self.assertEqual(self.mark(1), 2)
+        self.assertEqual(self.mark(-1), 2)
+
+
+# === 楽観的排他制御 ===
+
+class VersionedUpdateTests(CacheIsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = make_user('member')
+        self.task = make_task(self.user)
+        self.leaf = wbs.add_subtask(self.task, '末端')
+        self.client.force_login(self.user)
+
+    def toggle(self, is_done, version):
+        return post_json(self.client, 'api_toggle_subtask',
+                         {'subtask_id': self.leaf.id, 'is_done': is_done, 'version': version})
+
+    def test_toggle_returns_new_version(self):
+        response = self.toggle(True, 0)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['is_done'], response.json()['version']), (True, 1))
+        self.assertEqual(response.json()['progress'], 100)
+
+    def test_stale_toggle_returns_409_with_current_state(self):
+        self.toggle(True, 0)
+        response = self.toggle(False, 0)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual((response.json()['is_done'], response.json()['version']), (True, 1))
+        # 集計は1回分だけ積み上がっている
+        self.task.refresh_from_db()
+        self.assertEqual((self.task.subtask_leaf_count, self.task.subtask_done_count), (1, 1))
+
+    def test_toggle_requires_json_boolean(self):
+        for value in ('false', 0, None):
+            self.assertEqual(self.toggle(value, 0).status_code, 400)
+        self.leaf.refresh_from_db()
+        self.assertFalse(self.leaf.is_done)
+
+    def test_toggle_writes_three_statements(self):
+        # 条件付き UPDATE 1文 + 祖先と Task への積み上げ 2文（セーブポイントは作らない）
+        with self.assertNumQueries(3):
+            wbs.toggle_subtask(self.leaf, True)
+
+    def test_stale_status_update_returns_409(self):
+        def update(status, version):
+            return post_json(self.client, 'api_update_status',
+                             {'task_id': self.task.id, 'status': status, 'version': version})
+        self.assertEqual(update('doing', 0).json()['version'], 1)
+        response = update('done', 0)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json(), {'status': 'conflict', 'current_status': 'doing', 'version': 1})
+
+
+# === 期限カレンダー ===
+
+def utc(*args):
+    return datetime(*args, tzinfo=dt_timezone.utc)
+
+
+class DueCalendarTests(CacheIsolatedTestCase):
+    # Asia/Tokyo は UTC+9。UTC では同じ 3/9 でも、現地時間では 3/9 と 3/10 に分かれる
+    def setUp(self):
+        super().setUp()
+        self.user = make_user('calendar')
+        self.late = make_task(self.user, '3/9 23:30', due_date=utc(2026, 3, 9, 14, 30))
+        self.midnight = make_task(self.user, '3/10 0:00', due_date=utc(2026, 3, 9, 15, 0))
+        self.early = make_task(self.user, '3/10 0:30', due_date=utc(2026, 3, 9, 15, 30))
+        self.utc_end = make_task(self.user, '3/10 8:59', due_date=utc(2026, 3, 9, 23, 59))
+        self.next_day = make_task(self.user, '3/11 0:00', due_date=utc(2026, 3, 10, 15, 0))
+        self.client.force_login(self.user)
+
+    def ids(self, days):
+        return {day: [row[0] for row in rows] for day, rows in days.items()}
+
+    def test_buckets_by_local_date(self):
+        days = schedule.due_calendar(self.user, date(2026, 3, 9), date(2026, 3, 11))
+        self.assertEqual(self.ids(days), {
+            '2026-03-09': [self.late.id],
+            '2026-03-10': [self.midnight.id, self.early.id, self.utc_end.id],
+            '2026-03-11': [self.next_day.id],
+        })
+
+    def test_window_edges_are_local_midnights(self):
+        response = self.client.get(reverse('api_calendar'), {'start': '2026-03-10', 'end': '2026-03-10'})
+        self.assertEqual(self.ids(response.json()['days']),
+                         {'2026-03-10': [self.midnight.id, self.early.id, self.utc_end.id]})
+
+    def test_follows_active_time_zone(self):
+        with timezone.override(dt_timezone.utc):
+            days = schedule.due_calendar(self.user, date(2026, 3, 9), date(2026, 3, 10))
+        self.assertEqual(self.ids(days), {
+            '2026-03-09': [self.late.id, self.midnight.id, self.early.id, self.utc_end.id],
+            '2026-03-10': [self.next_day.id],
+        })
+
+    def test_moving_due_date_moves_bucket(self):
+        self.late.due_date += timedelta(hours=1)
+        self.late.save()
+        days = schedule.due_calendar(self.user, date(2026, 3, 9), date(2026, 3, 9))
+        self.assertEqual(days, {})
+
+
+# === 検証用データの生成 ===
+
+class SeedingTests(SimpleTestCase):
+    def test_accepted_invitations_belong_to_members(self):
+        rows = seeding.generate_chunk((0, 0, 300, 1, 50, datetime(2026, 1, 1, tzinfo=dt_timezone.utc), 0.1))
+        members = {(t, user_id) for t, user_id, *_ in rows['assignments']}
+        statuses = {status for *_, status, _ in rows['invitations']}
+        self.assertEqual(statuses, {'pending', 'accepted', 'declined'})
+        for t, _, recipient, status, _ in rows['invitations']:
+            self.assertEqual((t, recipient) in members, status == 'accepted')
+
+
+# === 2段キャッシュ ===
+
+class TieredCacheTests(CacheIsolatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = caches['default']
+        self.shared = caches['shared']
+        cache.STATS.clear()
+
+    def test_local_tier_hit_and_miss(self):
+        self.cache.set('k', 1)
+        # 他プロセスでの削除は、ローカル層の TTL が切れるまで見えない
+        self.shared.delete('k')
+        self.assertEqual(self.cache.get('k'), 1)
+        self.assertEqual(cache.STATS['local_hits'], 1)
+        later = time.monotonic() + self.cache._local_timeout + 1
+        with mock.patch('tasks.cache.time.monotonic', return_value=later):
+            self.assertIsNone(self.cache.get('k'))
+        self.assertEqual(cache.STATS['misses'], 1)
+
+    def test_shared_hit_fills_local_tier(self):
+        self.shared.set('k', 'shared')
+        self.assertEqual(self.cache.get('k'), 'shared')
+        self.assertEqual(self.cache.get('k'), 'shared')
+        self.assertEqual((cache.STATS['shared_hits'], cache.STATS['local_hits']), (1, 1))
+
+    def test_invalidate_bumps_version(self):
+        before = cache.make_key('board', 1, 'counts')
+        other = cache.make_key('board', 2, 'counts')
+        cache.invalidate('board', 1)
+        self.assertNotEqual(cache.make_key('board', 1, 'counts'), before)
+        self.assertEqual(cache.make_key('board', 2, 'counts'), other)
+
+    def test_evicted_version_does_not_revive_old_keys(self):
+        first = cache.namespace_version('board', 1)
+        cache.invalidate('board', 1)
+        second = cache.namespace_version('board', 1)
+        self.assertEqual(second, first + 1)
+        # 上限超えでバージョンのキーだけが追い出された状態
+        self.cache.delete(cache._version_key('board', 1))
+        self.assertGreater(cache.namespace_version('board', 1), second)
+        self.cache.delete(cache._version_key('board', 1))
+        cache.invalidate('board', 1)
+        self.assertGreater(cache.namespace_version('board', 1), second)
+
+    def test_get_or_compute_recomputes_early(self):
+        compute = mock.Mock(return_value='new')
+        # 再計算に 100 秒かかる値が、あと 60 秒で期限切れ
+        self.cache.set('k', ('old', 100.0, time.time() + 60), 300)
+        with mock.patch('tasks.cache.random.random', return_value=0.9):
+            self.assertEqual(cache.get_or_compute('k', compute), 'old')
+        compute.assert_not_called()
+        with mock.patch('tasks.cache.random.random', return_value=0.5):
+            self.assertEqual(cache.get_or_compute('k', compute), 'new')
+        compute.assert_called_once()
+        self.assertEqual(self.cache.get('k')[0], 'new')
+
+    def test_get_or_compute_computes_once_on_miss(self):
+        compute = mock.Mock(return_value=3)
+        self.assertEqual(cache.get_or_compute('k', compute), 3)
+        self.assertEqual(cache.get_or_compute('k', compute), 3)
+        compute.assert_called_once()
+
+
+# === 静的ファイルの配信 ===
+
+class StaticFilesTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        path = os.path.join(self.root, 'app.0123456789ab.css')
+        for suffix, body in (('', b'body {}' * 100), ('.gz', b'gzip'), ('.br', b'br')):
+            with open(path + suffix, 'wb') as f:
+                f.write(body)
+        with override_settings(STATIC_ROOT=self.root, STATIC_URL='/static/', SERVE_STATIC_FILES=True):
+            self.middleware = assets.StaticFilesMiddleware(lambda request: HttpResponse('app'))
+
+    def fetch(self, accept_encoding=None):
+        extra = {} if accept_encoding is None else {'HTTP_ACCEPT_ENCODING': accept_encoding}
+        response = self.middleware(RequestFactory().get('/static/app.0123456789ab.css', **extra))
+        self.assertEqual(response.status_code, 200)
+        body = b''.join(response.streaming_content)
+        response.close()
+        return response.get('Content-Encoding'), body
+
+    def test_parse_accept_encoding(self):
+        self.assertEqual(assets.parse_accept_encoding('gzip, BR;q=0.5 , identity;q=bad, *;q=0'),
+                         {'gzip': 1.0, 'br': 0.5, '*': 0.0})
+        self.assertEqual(assets.parse_accept_encoding(''), {})
+
+    def test_variant_selection(self):
+        self.assertEqual(self.fetch('gzip, deflate, br'), ('br', b'br'))
+        self.assertEqual(self.fetch('br;q=0.5, gzip'), ('gzip', b'gzip'))
+        self.assertEqual(self.fetch('br;q=0, gzip;q=0.1'), ('gzip', b'gzip'))
+        self.assertEqual(self.fetch('*'), ('br', b'br'))
+        self.assertEqual(self.fetch('*;q=0.5, br;q=0'), ('gzip', b'gzip'))
+
+    def test_identity_fallback(self):
+        # 部分一致（x-gzip-test）や q=0 では圧縮版を返さない
+        for header in (None, '', 'identity', 'x-gzip-test, brotli', 'gzip;q=0, br;q=0', '*;q=0'):
+            encoding, body = self.fetch(header)
+            self.assertIsNone(encoding, header)
+            self.assertEqual(body, b'body {}' * 100)
+
+    def test_vary_accept_encoding(self):
+        response = self.middleware(RequestFactory().get('/static/app.0123456789ab.css'))
+        response.close()
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertIn('immutable', response['Cache-Control'])
+        response = self.middleware(RequestFactory().get('/static/missing.css'))
+        self.assertEqual(response.content, b'app')
+
+
+# === ヘルスチェック ===
+
+class HealthCheckTests(TestCase):
+    def get(self, path, **extra):
+        with mock.patch('django.contrib.sessions.middleware.SessionMiddleware.process_request') as session, \
+                mock.patch('django.contrib.auth.middleware.AuthenticationMiddleware.process_request') as auth:
+            response = self.client.get(path, **extra)
+        # セッション・認証のミドルウェア（と ALLOWED_HOSTS の検査）を通らない
+        session.assert_not_called()
+        auth.assert_not_called()
+        self.assertEqual(response['Cache-Control'], 'no-store')
+        self.assertNotIn('Set-Cookie', response)
+        return response
+
+    def test_liveness_does_not_touch_database(self):
+        with self.assertNumQueries(0):
+            response = self.get(health.LIVENESS_PATH, HTTP_HOST='unknown.example')
+        self.assertEqual((response.status_code, response.content), (200, b'ok'))
+
+    def test_readiness_checks_database(self):
+        with self.assertNumQueries(1):
+            response = self.get(health.READINESS_PATH, HTTP_HOST='unknown.example')
+        self.assertEqual((response.status_code, response.content), (200, b'ready'))
+
+    def test_database_down(self):
+        with mock.patch.object(connections['default'], 'cursor', side_effect=OperationalError('unable to open')):
+            ready = self.get(health.READINESS_PATH)
+            alive = self.get(health.LIVENESS_PATH)
+        self.assertEqual(ready.status_code, 503)
+        self.assertEqual(ready.content, b'database unavailable: OperationalError')
+        self.assertEqual(alive.status_code, 200)
+
+
+# === メトリクス ===
+
+class MetricsEndpointTests(CacheIsolatedTestCase):
+    def scrape(self, **extra):
+        return self.client.get('/metrics/', **extra)
+
+    @override_settings(METRICS_TOKEN='', METRICS_ALLOWED_IPS=[])
+    def test_denied_without_configuration(self):
+        self.assertEqual(self.scrape().status_code, 403)
+
+    @override_settings(METRICS_TOKEN='secret', METRICS_ALLOWED_IPS=[])
+    def test_bearer_token(self):
+        self.assertEqual(self.scrape(HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        response = self.scrape(HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'kanban_metrics_processes 1')
+
+    @override_settings(METRICS_TOKEN='', METRICS_ALLOWED_IPS=['10.0.0.0/8', 'not-an-address'])
+    def test_allowed_networks(self):
+        self.assertEqual(self.scrape(REMOTE_ADDR='10.1.2.3').status_code, 200)
+        self.assertEqual(self.scrape(REMOTE_ADDR='192.168.0.1').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='secret', SESSION_MODE='db')
+    def test_session_gauge_is_cached(self):
+        metrics._sessions_cache.clear()
+        self.scrape(HTTP_AUTHORIZATION='Bearer secret')
+        with self.assertNumQueries(0):
+            response = self.scrape(HTTP_AUTHORIZATION='Bearer secret')
+        self.assertContains(response, 'kanban_sessions{state="active"}')
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_unknown_methods_share_one_label(self):
+        for method in ('BREW', 'PROPFIND', 'get'):
+            self.client.generic(method, '/')
+        self.client.get('/')
+        text = self.scrape(HTTP_AUTHORIZATION='Bearer secret').content.decode()
+        self.assertIn('method="other"', text)
+        self.assertIn('method="GET"', text)
+        for method in ('BREW', 'PROPFIND', 'get'):
+            self.assertNotIn(f'method="{method}"', text)
+
+
+class MetricsShardTests(SimpleTestCase):
+    def test_finished_threads_are_folded(self):
+        counter = metrics.Counter('kanban_test_shards_total', 'Test counter.')
+        self.addCleanup(metrics.REGISTRY.pop, counter.name)
+        before = len(metrics._SHARDS)
+
+        def work():
+            counter.inc(amount=2)
+
+        for _ in range(20):
+            thread = threading.Thread(target=work)
+            thread.start()
+            thread.join()
+        samples = metrics.process_samples()
+        self.assertEqual(samples[counter.name, (), None], 40)
+        # 終了したスレッドの dict は残らない
+        self.assertLessEqual(len(metrics._SHARDS), before + 1)
+
+
+class MetricsDirectoryTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        for name in ('12345.json', metrics.ARCHIVE_FILE):
+            with open(os.path.join(self.directory, name), 'w') as f:
+                f.write('[]')
+
+    def set_owner(self, pid):
+        with open(os.path.join(self.directory, metrics.OWNER_FILE), 'w') as f:
+            f.write(str(pid))
+
+    def json_files(self):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith('.json'))
+
+    def owner(self):
+        with open(os.path.join(self.directory, metrics.OWNER_FILE)) as f:
+            return int(f.read())
+
+    def test_fresh_start_clears_leftovers(self):
+        metrics.claim_directory(self.directory)
+        self.assertEqual(self.json_files(), [])
+        self.assertEqual(self.owner(), os.getpid())
+
+    def test_dead_owner_is_replaced(self):
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        self.set_owner(process.pid)
+        metrics.claim_directory(self.directory)
+        self.assertEqual(self.json_files(), [])
+        self.assertEqual(self.owner(), os.getpid())
+
+    def test_running_owner_keeps_files(self):
+        # USR2: 旧マスター（ここでは親プロセス）がまだ動いている
+        self.set_owner(os.getppid())
+        metrics.claim_directory(self.directory)
+        self.assertEqual(self.json_files(), ['12345.json', metrics.ARCHIVE_FILE])
+        self.assertEqual(self.owner(), os.getpid())
+
+
+# === SQLite の書き込みロック ===
+
+class SqliteWriteLockTests(SimpleTestCase):
+    """読んでから書くトランザクションと、別スレッドの書き込み（コミット後の処理など）が重なる場合。"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'lock.sqlite3')
+
+    def connect(self, wrapper_class):
+        settings_dict = {**connections['default'].settings_dict, 'NAME': self.path, 'OPTIONS': {'timeout': 5}}
+        return wrapper_class(settings_dict, alias='lock_test')
+
+    def read_then_write(self, wrapper_class):
+        """別スレッドの INSERT を挟んで、このスレッドで SELECT → INSERT する。(このスレッドの例外, 行数) を返す。"""
+        main = self.connect(wrapper_class)
+        main.cursor().execute('CREATE TABLE item (n integer)')
+        read_done, errors = threading.Event(), []
+
+        def writer():
+            other = self.connect(wrapper_class)
+            read_done.wait()
+            try:
+                other.cursor().execute('INSERT INTO item VALUES (1)')
+            except OperationalError as e:
+                errors.append(e)
+            finally:
+                other.close()
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        error = None
+        try:
+            main.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+            main.cursor().execute('SELECT max(n) FROM item')
+            read_done.set()
+            time.sleep(0.3)  # 書き込み側が先にロックを取りに行くのを待つ
+            main.cursor().execute('INSERT INTO item VALUES (2)')
+            main.commit()
+        except OperationalError as e:
+            error = e
+            main.rollback()
+        finally:
+            main.set_autocommit(True)
+            read_done.set()
+            thread.join()
+        count = main.cursor().execute('SELECT count(*) FROM item').fetchone()[0]
+        main.close()
+        self.assertEqual(errors, [])
+        return error, count
+
+    def test_default_begin_fails_to_upgrade(self):
+        # 標準の BEGIN（DEFERRED）では、読み取りロックからの昇格が待たずに失敗する
+        error, count = self.read_then_write(django_sqlite3.DatabaseWrapper)
+        self.assertIn('locked', str(error))
+        self.assertEqual(count, 1)
+
+    def test_begin_immediate_waits(self):
+        error, count = self.read_then_write(sqlite_backend.DatabaseWrapper)
+        self.assertIsNone(error)
+        self.assertEqual(count, 2)
@@ -19,6 +19,7 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('board/', views.board, name='board'),
     path('board/done/', views.done_tasks_view, name='done_tasks'),
+    path('board/kanban/', views.kanban_board, name='kanban_board'),
 
     # --- タスク操作 ---
     path('task/create/', views.TaskCreateView.as_view(), name='task_create'),
@@ -27,6 +28,9 @@ urlpatterns = [
     
     # API
     path('api/update_status/', views.api_update_status, name='api_update_status'),
+    path('api/calendar/', views.api_calendar, name='api_calendar'),
+    path('api/board/column/<str:status>/', views.api_board_column, name='api_board_column'),
+    path('api/board/move/', views.api_move_card, name='api_move_card'),
 
     # --- コミュニケーション & 招待 (復活!) ---
     path('task/<int:pk>/comment/', views.add_comment, name='add_comment'),
@@ -34,11 +38,19 @@ urlpatterns = [
     # ★ここを復活させました
     path('task/<int:pk>/invite/', views.invite_user, name='invite_user'),
     path('invitations/', views.invitation_list, name='invitation_list'),
+    path('api/bulk_invite/', views.api_bulk_invite, name='api_bulk_invite'),
     path('invitation/<int:pk>/<str:response>/', views.respond_invitation, name='respond_invitation'),
+
+    # --- 通知 ---
+    path('notifications/', views.notification_list, name='notification_list'),
+    path('api/notifications/unread/', views.api_unread_notifications, name='api_unread_notifications'),
     
     path('task/<int:pk>/join/', views.join_task_via_link, name='join_task_via_link'),
     path('task/<int:pk>/remove_member/', views.remove_member, name='remove_member'),
 
+    # --- 運用 ---
+    path('ops/cache/', views.cache_stats, name='cache_stats'),
+
     # --- プロフィール ---
     path('profile/', views.profile_view, name='profile'),
     path('profile/edit/', views.profile_edit, name='profile_edit'),
@@ -48,5 +60,9 @@ urlpatterns = [
     path('api/add_subtask/', views.api_add_subtask, name='api_add_subtask'),
     path('api/toggle_subtask/', views.api_toggle_subtask, name='api_toggle_subtask'),
     path('api/delete_subtask/', views.api_delete_subtask, name='api_delete_subtask'),
+    path('api/move_subtask/', views.api_move_subtask, name='api_move_subtask'),
     path('api/create_thread/', views.api_create_thread, name='api_create_thread'),
+    path('api/thread/read/', views.api_mark_thread_read, name='api_mark_thread_read'),
+    path('api/thread/<int:pk>/search/', views.api_search_thread, name='api_search_thread'),
+    path('api/task/<int:pk>/activity/', views.api_task_activity, name='api_task_activity'),
 ]
\ No newline at end of file
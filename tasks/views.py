@@ -1,6 +1,6 @@
 from datetime import timedelta
-from dateutil.relativedelta import relativedelta
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Count, F, Q
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.generic import CreateView, UpdateView, DeleteView
 from django.urls import reverse_lazy
@@ -8,18 +8,22 @@ from django.contrib import messages
 from django.contrib.auth import login
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.views import LoginView
+from django.core import signing
 from django.core.mail import send_mail
 from django.conf import settings
-from django.http import JsonResponse
+from django.http import JsonResponse, Http404
+from django.template.loader import render_to_string
 from django.views.decorators.http import require_POST
 from django.utils import timezone
 import json
 import random
 
-from .models import Task, TaskAssignment, Invitation, Comment, OneTimePassword, Profile, SubTask, ChatThread
+from .models import Task, TaskAssignment, Invitation, OneTimePassword, Profile, SubTask, ChatThread, Notification
 from .forms import CustomUserCreationForm, CustomAuthenticationForm, TaskForm, ProfileForm, VerificationCodeForm
+from . import kanban, ranking, wbs, notifications, access, cache, invitations, activity, chat, concurrency, schedule, metrics
 
 # === 認証関連 ===
 
@@ -34,30 +38,64 @@ class SignUpView(CreateView):
         messages.success(self.request, 'アカウント作成が完了しました！')
         return super().form_valid(form)
 
+# 2段階認証の途中状態（settings.PRE_2FA_SIGNED_COOKIE なら署名付きCookie、そうでなければセッション）
+PRE_2FA_COOKIE = 'pre_2fa'
+PRE_2FA_SALT = 'tasks.pre_2fa'
+PRE_2FA_MAX_AGE = 600
+REMEMBER_ME_AGE = 1209600
+
+def _start_pre_2fa(request, response, user_id, remember):
+    if settings.PRE_2FA_SIGNED_COOKIE:
+        response.set_signed_cookie(PRE_2FA_COOKIE, f'{user_id}-{int(remember)}', salt=PRE_2FA_SALT,
+                                   max_age=PRE_2FA_MAX_AGE, secure=request.is_secure(), httponly=True, samesite='Lax')
+    else:
+        request.session['pre_2fa_user_id'] = user_id
+        if remember:
+            request.session.set_expiry(REMEMBER_ME_AGE)
+    return response
+
+def _get_pre_2fa(request):
+    if settings.PRE_2FA_SIGNED_COOKIE:
+        try:
+            user_id, remember = request.get_signed_cookie(PRE_2FA_COOKIE, salt=PRE_2FA_SALT, max_age=PRE_2FA_MAX_AGE).split('-')
+            return int(user_id), remember == '1'
+        except (KeyError, ValueError, signing.BadSignature):
+            return None, False
+    return request.session.get('pre_2fa_user_id'), False
+
+def _clear_pre_2fa(request, response):
+    if settings.PRE_2FA_SIGNED_COOKIE:
+        response.delete_cookie(PRE_2FA_COOKIE, samesite='Lax')
+    elif 'pre_2fa_user_id' in request.session:
+        del request.session['pre_2fa_user_id']
+    return response
+
 class CustomLoginView(LoginView):
     authentication_form = CustomAuthenticationForm
     template_name = 'registration/login.html'
 
     def form_valid(self, form):
         user = form.get_user()
-        self.request.session['pre_2fa_user_id'] = user.id
-        if self.request.POST.get('remember_me'):
-            self.request.session.set_expiry(1209600)
 
         otp, _ = OneTimePassword.objects.get_or_create(user=user)
         code = otp.generate_code()
         
-        send_mail(
-            "【Kanban】認証コード",
-            f"コード: {code}\n有効期限は10分です。",
-            settings.DEFAULT_FROM_EMAIL,
-            [user.email],
-            fail_silently=False 
-        )
-        return redirect('verify_code')
+        try:
+            with metrics.OTP_MAIL_SECONDS.time():
+                send_mail(
+                    "【Kanban】認証コード",
+                    f"コード: {code}\n有効期限は10分です。",
+                    settings.DEFAULT_FROM_EMAIL,
+                    [user.email],
+                    fail_silently=False 
+                )
+        except Exception as exc:
+            metrics.OTP_MAIL_FAILURES.inc(exc.__class__.__name__)
+            raise
+        return _start_pre_2fa(self.request, redirect('verify_code'), user.id, bool(self.request.POST.get('remember_me')))
 
 def verify_code_view(request):
-    user_id = request.session.get('pre_2fa_user_id')
+    user_id, remember = _get_pre_2fa(request)
     if not user_id: return redirect('login')
     
     user = get_object_or_404(User, id=user_id)
@@ -70,11 +108,11 @@ def verify_code_view(request):
                 otp = OneTimePassword.objects.get(user=user)
                 if otp.code == code and otp.is_valid():
                     login(request, user, backend='django.contrib.auth.backends.ModelBackend')
+                    if remember:
+                        request.session.set_expiry(REMEMBER_ME_AGE)
                     otp.code = "" 
                     otp.save()
-                    if 'pre_2fa_user_id' in request.session:
-                        del request.session['pre_2fa_user_id']
-                    return redirect('board')
+                    return _clear_pre_2fa(request, redirect('board'))
                 else:
                     messages.error(request, 'コードが間違っているか、期限切れです。')
             except OneTimePassword.DoesNotExist:
@@ -91,9 +129,8 @@ def index(request):
 # === ボード表示関連 ===
 
 def enhance_task_data(task, current_user):
-    today = timezone.now().date()
     if task.due_date:
-        delta = (task.due_date - timezone.now()).days
+        delta = task.remaining_days()
         task.remaining_days = delta
         if delta < 0: task.color_class = 'urgency-red'
         elif delta <= 1: task.color_class = 'urgency-red'
@@ -131,23 +168,121 @@ def done_tasks_view(request):
     enhanced_tasks = [enhance_task_data(t, request.user) for t in tasks]
     return render(request, 'tasks/board.html', {'tasks': enhanced_tasks, 'view_type': 'done'})
 
+@login_required
+def kanban_board(request):
+    columns = kanban.first_pages(request.user)
+    return render(request, 'tasks/kanban.html', {'columns': columns, 'view_type': 'kanban'})
+
+@login_required
+def api_board_column(request, status):
+    if status not in kanban.STATUSES:
+        raise Http404
+    cards, next_cursor = kanban.column_page(request.user, status, request.GET.get('cursor'))
+    html = render_to_string('tasks/kanban_card.html', {'cards': cards}, request=request)
+    return JsonResponse({'status': 'success', 'html': html, 'next_cursor': next_cursor})
+
+@login_required
+@require_POST
+def api_move_card(request):
+    # ドラッグ&ドロップでの列移動（自分の担当ステータスのみ更新）
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'status': 'error'}, status=400)
+    new_status = data.get('status')
+    if new_status not in kanban.STATUSES:
+        return JsonResponse({'status': 'error', 'message': 'invalid status'}, status=400)
+    task_access = access.get_access(request, data.get('task_id'))
+    if task_access is None or not task_access.is_member:
+        return JsonResponse({'status': 'error'}, status=403)
+
+    # ドロップ先の前後のカードのランクから新しいランクを決め、移動したカードだけを更新する
+    before_id, after_id = _to_int(data.get('before_task_id')), _to_int(data.get('after_task_id'))
+    # 移動したカード自身の元のステータスも同じクエリで取る
+    rows = {task_id: (rank, status) for task_id, rank, status in TaskAssignment.objects.filter(
+        user=request.user, task_id__in=[i for i in (before_id, after_id, task_access.task_id) if i])
+        .values_list('task_id', 'board_rank', 'status')}
+    try:
+        rank = ranking.rank_between(rows.get(before_id, (None,))[0], rows.get(after_id, (None,))[0])
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'stale order'}, status=409)
+
+    old_status = rows.get(task_access.task_id, (None, None))[1]
+    with transaction.atomic():
+        updated = TaskAssignment.objects.filter(id=task_access.assignment_id).update(
+            status=new_status, board_rank=rank, version=F('version') + 1)
+        if not updated:
+            return JsonResponse({'status': 'error'}, status=404)
+        if old_status != new_status:
+            activity.record(task_access.task_id, request.user, 'status', task_access.assignment_id, old_status, new_status)
+            # 同じ列の中での並び替えは通知しない
+            notifications.notify_status(Task.objects.only('id', 'title', 'user_id').get(id=task_access.task_id),
+                                        request.user, new_status)
+    # update() はシグナルを送らないので自分で無効化する
+    cache.invalidate('board', request.user.id)
+    cache.invalidate('profile', request.user.id)
+    if ranking.needs_rebalance(rank):
+        ranking.schedule_rebalance(TaskAssignment.objects.filter(user=request.user), 'board_rank')
+    return JsonResponse({'status': 'success', 'rank': rank, 'counts': kanban.column_counts(request.user)})
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
 
 # === API (Ajaxステータス更新) ===
 
 @login_required
 @require_POST
 def api_update_status(request):
+    # 自分の担当ステータスの変更。version（省略可）が古ければ 409 と最新の状態を返す
     try:
         data = json.loads(request.body)
-        task_id = data.get('task_id')
-        new_status = data.get('status')
-        task = get_object_or_404(Task, id=task_id)
-        assignment = get_object_or_404(TaskAssignment, task=task, user=request.user)
-        assignment.status = new_status
-        assignment.save()
-        return JsonResponse({'status': 'success'})
-    except Exception as e:
-        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    except ValueError:
+        return JsonResponse({'status': 'error'}, status=400)
+    new_status = data.get('status')
+    if new_status not in kanban.STATUSES:
+        return JsonResponse({'status': 'error', 'message': 'invalid status'}, status=400)
+    task_access = access.get_access(request, data.get('task_id'))
+    if task_access is None or not task_access.is_member:
+        return JsonResponse({'status': 'error'}, status=403)
+    try:
+        with transaction.atomic():
+            old_status, version = kanban.update_status(task_access.assignment_id, new_status, _to_int(data.get('version')))
+            if old_status != new_status:
+                activity.record(task_access.task_id, request.user, 'status', task_access.assignment_id, old_status, new_status)
+                notifications.notify_status(Task.objects.only('id', 'title', 'user_id').get(id=task_access.task_id),
+                                            request.user, new_status)
+    except TaskAssignment.DoesNotExist:
+        return JsonResponse({'status': 'error'}, status=404)
+    except concurrency.Conflict as e:
+        return JsonResponse({'status': 'conflict', 'current_status': e.current['status'],
+                             'version': e.current['version']}, status=409)
+    # update() はシグナルを送らないので自分で無効化する
+    cache.invalidate('board', request.user.id)
+    cache.invalidate('profile', request.user.id)
+    return JsonResponse({'status': 'success', 'version': version})
+
+@login_required
+def api_calendar(request):
+    # 期限カレンダー: ?start=YYYY-MM-DD&end=YYYY-MM-DD の期間に期限がある自分の担当タスク（日付ごと）
+    try:
+        start, end = schedule.parse_window(request.GET.get('start'), request.GET.get('end'))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'invalid date range'}, status=400)
+    return JsonResponse({'status': 'success', 'start': start.isoformat(), 'end': end.isoformat(),
+                         'fields': schedule.FIELDS, 'days': schedule.due_calendar(request.user, start, end)},
+                        json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')})
+
+@login_required
+def api_task_activity(request, pk):
+    # バーンダウン・累積フロー図用の日次集計（?days=30）
+    if not access.is_member(request, pk):
+        return JsonResponse({'status': 'error'}, status=403)
+    days = _to_int(request.GET.get('days')) or 30
+    return JsonResponse({'status': 'success', **activity.timeline(pk, days)})
 
 
 # === タスク作成・編集 ===
@@ -175,12 +310,13 @@ class TaskCreateView(LoginRequiredMixin, CreateView):
 
         # 5. 関連データの作成（ID確定後なのでエラーにならない）
         # 作成者をリーダーとして追加
-        TaskAssignment.objects.create(
+        assignment = TaskAssignment.objects.create(
             task=self.object, 
             user=self.request.user, 
             status='todo',
             role_name='リーダー'
         )
+        activity.record(self.object.id, self.request.user, 'member_join', assignment.id, '', 'todo')
         
         # デフォルトのチャットスレッドを作成
         ChatThread.objects.create(task=self.object, name='メイン')
@@ -196,34 +332,48 @@ class TaskUpdateView(LoginRequiredMixin, UpdateView):
     def get_success_url(self):
         return reverse_lazy('task_edit', kwargs={'pk': self.object.pk})
 
-    def get_queryset(self):
-        return Task.objects.filter(taskassignment__user=self.request.user).distinct()
+    def get_object(self, queryset=None):
+        if not access.is_member(self.request, self.kwargs.get('pk')):
+            raise Http404
+        return super().get_object(queryset)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         task = self.object
-        if not task.threads.exists():
+        threads = chat.threads_with_unread(task, self.request.user)
+        if not threads:
             ChatThread.objects.create(task=task, name='メイン')
-
-        assignments = TaskAssignment.objects.filter(task=task)
-        context['todo_members'] = assignments.filter(status='todo')
-        context['doing_members'] = assignments.filter(status='doing')
-        context['done_members'] = assignments.filter(status='done')
-        context['is_owner'] = (task.user == self.request.user)
+            threads = chat.threads_with_unread(task, self.request.user)
+        context['threads'] = threads
+        # テンプレート側で関連を辿らないよう、投稿者とプロフィールはまとめて取得しておく
+        context['comments'] = list(task.comments.select_related('user__profile').order_by('id'))
+
+        # 1クエリで取得してステータスごとに振り分ける（表示は 完了 → 進行中 → 未着手）
+        members = {status: [] for status in kanban.STATUSES}
+        for assign in TaskAssignment.objects.filter(task=task).select_related('user__profile').order_by('joined_at', 'id'):
+            members.setdefault(assign.status, []).append(assign)
+        context['member_groups'] = [{'status': status, 'label': kanban.STATUS_LABELS[status], 'members': members[status]}
+                                    for status in reversed(kanban.STATUSES)]
+        context['is_owner'] = access.is_owner(self.request, task.id)
+        context['wbs_tree'] = wbs.load_tree(task)
         return context
 
 class TaskDeleteView(LoginRequiredMixin, DeleteView):
     model = Task
     template_name = 'tasks/task_confirm_delete.html'
     success_url = reverse_lazy('board')
-    def get_queryset(self):
-        return Task.objects.filter(user=self.request.user)
+    def get_object(self, queryset=None):
+        if not access.is_owner(self.request, self.kwargs.get('pk')):
+            raise Http404
+        return super().get_object(queryset)
 
 
 # === コメント・ファイル添付 ===
 
 @login_required
 def add_comment(request, pk):
+    if not access.is_member(request, pk):
+        raise Http404
     task = get_object_or_404(Task, id=pk)
     if request.method == 'POST':
         content = request.POST.get('content')
@@ -234,18 +384,23 @@ def add_comment(request, pk):
         if content or attachment:
             thread = None
             if thread_id:
-                try: thread = ChatThread.objects.get(id=thread_id)
+                try: thread = ChatThread.objects.get(id=thread_id, task=task)
                 except ChatThread.DoesNotExist: thread = task.threads.first()
             else: thread = task.threads.first()
+            if thread is None: thread = ChatThread.objects.create(task=task, name='メイン')
 
-            Comment.objects.create(task=task, user=request.user, content=content if content else "", attachment=attachment, thread=thread, message_type=msg_type)
-            
-            if msg_type == 'report_done':
-                try:
-                    assign = TaskAssignment.objects.get(task=task, user=request.user)
-                    assign.status = 'done'
-                    assign.save()
-                except TaskAssignment.DoesNotExist: pass
+            with transaction.atomic():
+                comment = chat.post_comment(thread, task=task, user=request.user, content=content if content else "", attachment=attachment, message_type=msg_type)
+                notifications.notify_comment(comment)
+
+                if msg_type == 'report_done':
+                    try:
+                        assign = TaskAssignment.objects.get(task=task, user=request.user)
+                        old_status, assign.status = assign.status, 'done'
+                        assign.save()
+                        activity.record(task.id, request.user, 'report_done', assign.id, old_status, 'done')
+                        notifications.notify_status(task, request.user, 'done')
+                    except TaskAssignment.DoesNotExist: pass
 
     return redirect('task_edit', pk=pk)
 
@@ -255,66 +410,134 @@ def add_comment(request, pk):
 @login_required
 def join_task_via_link(request, pk):
     task = get_object_or_404(Task, id=pk)
-    if TaskAssignment.objects.filter(task=task, user=request.user).exists():
+    if access.is_member(request, task.id):
+        messages.info(request, "すでにこのタスクに参加しています。")
+        return redirect('task_edit', pk=task.id)
+    with transaction.atomic():
+        # 確認後に別リクエストで参加済みになっていても、一意制約に当たった側は get で既存の行を返す
+        assignment, joined = TaskAssignment.objects.get_or_create(task=task, user=request.user,
+                                                                  defaults={'status': 'todo'})
+        if joined:
+            activity.record(task.id, request.user, 'member_join', assignment.id, '', 'todo')
+    if not joined:
         messages.info(request, "すでにこのタスクに参加しています。")
         return redirect('task_edit', pk=task.id)
-    TaskAssignment.objects.create(task=task, user=request.user, status='todo')
+    notifications.notify_membership(task, request.user, request.user, joined=True)
     messages.success(request, f"タスク「{task.title}」に参加しました！")
     return redirect('task_edit', pk=task.id)
 
 @login_required
 def remove_member(request, pk):
     task = get_object_or_404(Task, id=pk)
-    if task.user != request.user:
+    if not access.is_owner(request, task.id):
         messages.error(request, "権限がありません。")
         return redirect('task_edit', pk=pk)
     if request.method == 'POST':
         user_id = request.POST.get('user_id')
         if user_id:
-            TaskAssignment.objects.filter(task=task, user_id=user_id).delete()
+            removed = TaskAssignment.objects.filter(task=task, user_id=user_id).select_related('user').first()
+            if removed:
+                with transaction.atomic():
+                    activity.record(task.id, request.user, 'member_leave', removed.id, removed.status, '')
+                    removed.delete()
+                notifications.notify_membership(task, request.user, removed.user, joined=False)
             messages.success(request, "メンバーを削除しました。")
     return redirect('task_edit', pk=pk)
 
 @login_required
 def invite_user(request, pk):
+    if not access.is_member(request, pk):
+        raise Http404
     task = get_object_or_404(Task, id=pk)
     if request.method == 'POST':
-        username = request.POST.get('username')
-        try:
-            user_to_invite = User.objects.get(username=username)
-            if user_to_invite == request.user: messages.warning(request, "自分自身は招待できません。")
-            elif TaskAssignment.objects.filter(task=task, user=user_to_invite).exists(): messages.warning(request, "既に参加しています。")
-            else:
-                Invitation.objects.create(task=task, sender=request.user, recipient=user_to_invite, status='pending')
-                messages.success(request, f"{username} に招待を送りました。")
-        except User.DoesNotExist:
-            messages.error(request, f"ユーザー {username} は見つかりません。")
+        # カンマ・改行区切りで複数人をまとめて招待できる
+        identifiers = invitations.parse_identifiers(request.POST.get('username'))
+        if len(identifiers) > settings.BULK_INVITE_LIMIT:
+            messages.error(request, f"一度に招待できるのは {settings.BULK_INVITE_LIMIT} 人までです。")
+            return redirect('task_edit', pk=task.id)
+        result = invitations.bulk_invite(task, request.user, identifiers)
+        if result.skipped:
+            messages.warning(request, "自分自身は招待できません。")
+        if result.invited:
+            messages.success(request, f"{', '.join(result.invited)} に招待を送りました。")
+        if result.already_member:
+            messages.warning(request, f"{', '.join(result.already_member)} は既に参加しています。")
+        if result.already_invited:
+            messages.info(request, f"{', '.join(result.already_invited)} は招待済みです。")
+        for identifier in result.not_found:
+            messages.error(request, f"ユーザー {identifier} は見つかりません。")
     return redirect('task_edit', pk=task.id)
 
+@login_required
+@require_POST
+def api_bulk_invite(request):
+    # {"task_id": 1, "users": ["alice", "bob@example.com", ...]}
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'status': 'error'}, status=400)
+    if not access.is_member(request, data.get('task_id')):
+        return JsonResponse({'status': 'error'}, status=403)
+    identifiers = data.get('users')
+    if not isinstance(identifiers, list) or not all(isinstance(i, str) for i in identifiers):
+        return JsonResponse({'status': 'error', 'message': 'users must be a list of strings'}, status=400)
+    if len(identifiers) > settings.BULK_INVITE_LIMIT:
+        return JsonResponse({'status': 'error', 'message': 'too many users'}, status=400)
+    task = get_object_or_404(Task, id=data['task_id'])
+    result = invitations.bulk_invite(task, request.user, [i.strip() for i in identifiers if i.strip()])
+    return JsonResponse({'status': 'success', **result._asdict()})
+
 @login_required
 def invitation_list(request):
-    invitations = Invitation.objects.filter(recipient=request.user, status='pending').order_by('-created_at')
+    user_id = request.user.id
+    invitations = cache.get_or_compute(
+        cache.make_key('invitation', user_id, 'pending'),
+        lambda: list(Invitation.objects.filter(recipient_id=user_id, status='pending')
+                     .select_related('sender', 'task').order_by('-created_at')))
     return render(request, 'tasks/invitation_list.html', {'invitations': invitations})
 
 @login_required
 def respond_invitation(request, pk, response):
-    invitation = get_object_or_404(Invitation, id=pk, recipient=request.user)
-    if response == 'accepted':
-        invitation.status = 'accepted'
-        TaskAssignment.objects.create(task=invitation.task, user=request.user, status='todo')
-        invitation.save()
-        messages.success(request, f"{invitation.task.title} に参加しました！")
-    elif response == 'declined':
-        invitation.status = 'declined'
-        invitation.save()
+    try:
+        if response == 'accepted':
+            invitation, joined = invitations.accept(pk, request.user)
+            if joined:
+                messages.success(request, f"{invitation.task.title} に参加しました！")
+        elif response == 'declined':
+            invitations.decline(pk, request.user)
+    except Invitation.DoesNotExist:
+        raise Http404
     return redirect('invitation_list')
 
+# === 通知 ===
+
+@login_required
+def notification_list(request):
+    items = list(Notification.objects.filter(recipient=request.user).select_related('actor', 'task').order_by('-updated_at')[:50])
+    # 一覧を開いたら既読にする（表示は開く前の未読状態のまま）
+    notifications.mark_all_read(request.user)
+    return render(request, 'tasks/notification_list.html', {'notifications': items})
+
+@login_required
+def api_unread_notifications(request):
+    return JsonResponse({'status': 'success', 'unread': notifications.unread_count(request.user)})
+
+# === 運用 ===
+
+@staff_member_required
+def cache_stats(request):
+    # このプロセスのキャッシュのヒット/ミス数
+    return JsonResponse({'status': 'success', 'cache': cache.stats()})
+
 # プロフィール関連
 @login_required
 def profile_view(request):
     Profile.objects.get_or_create(user=request.user)
-    user_assigns = TaskAssignment.objects.filter(user=request.user)
-    context = {'tasks_count': user_assigns.count(), 'done_count': user_assigns.filter(status='done').count()}
+    user_id = request.user.id
+    context = cache.get_or_compute(
+        cache.make_key('profile', user_id, 'counts'),
+        lambda: TaskAssignment.objects.filter(user_id=user_id).aggregate(
+            tasks_count=Count('id'), done_count=Count('id', filter=Q(status='done'))))
     return render(request, 'tasks/profile.html', context)
 
 @login_required
@@ -332,49 +555,144 @@ def profile_edit(request):
 
 # --- JSON API ---
 
+@login_required
 @require_POST
 def api_update_role(request):
     data = json.loads(request.body)
     try:
         assign = TaskAssignment.objects.get(id=data.get('assignment_id'))
-        if request.user != assign.task.user: return JsonResponse({'status': 'error'}, status=403)
-        assign.role_name = data.get('role_name')
-        assign.save()
+        if not access.is_owner(request, assign.task_id): return JsonResponse({'status': 'error'}, status=403)
+        old_role, assign.role_name = assign.role_name, data.get('role_name')
+        with transaction.atomic():
+            assign.save()
+            activity.record(assign.task_id, request.user, 'role', assign.id, old_role, assign.role_name)
         return JsonResponse({'status': 'success'})
     except TaskAssignment.DoesNotExist: return JsonResponse({'status': 'error'}, status=404)
 
+@login_required
 @require_POST
 def api_create_thread(request):
     data = json.loads(request.body)
+    if not access.is_member(request, data.get('task_id')):
+        return JsonResponse({'status': 'error'}, status=403)
     task = Task.objects.get(id=data.get('task_id'))
     thread = ChatThread.objects.create(task=task, name=data.get('name'))
     return JsonResponse({'status': 'success', 'thread_id': thread.id, 'name': thread.name})
 
+@login_required
+@require_POST
+def api_mark_thread_read(request):
+    # スレッドを開いたときに既読位置を進める
+    data = json.loads(request.body)
+    thread = get_object_or_404(ChatThread, id=data.get('thread_id'))
+    if not access.is_member(request, thread.task_id):
+        return JsonResponse({'status': 'error'}, status=403)
+    seq = _to_int(data.get('seq'))
+    chat.mark_read(request.user, thread, thread.last_seq if seq is None else seq)
+    return JsonResponse({'status': 'success'})
+
+@login_required
+def api_search_thread(request, pk):
+    # スレッド内のメッセージ検索（?q=...&before=<seq> で続きを取得）
+    thread = get_object_or_404(ChatThread, id=pk)
+    if not access.is_member(request, thread.task_id):
+        return JsonResponse({'status': 'error'}, status=403)
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'status': 'success', 'results': [], 'next_before': None})
+    comments = chat.search(thread, query, before=_to_int(request.GET.get('before')))
+    results = [{'id': c.id, 'seq': c.seq, 'user': c.user.username, 'content': c.content,
+                'created_at': timezone.localtime(c.created_at).strftime('%m/%d %H:%M')} for c in comments]
+    next_before = comments[-1].seq if len(comments) == chat.SEARCH_LIMIT else None
+    return JsonResponse({'status': 'success', 'results': results, 'next_before': next_before})
+
+def _wbs_state(task, subtask=None):
+    # 集計値だけを読み直して進捗と祖先の完了状態を返す（祖先があれば Task の集計値も同じクエリで JOIN して読む）
+    nodes = []
+    if subtask is None:
+        task.refresh_from_db(fields=['subtask_leaf_count', 'subtask_done_count'])
+    else:
+        rows = list(SubTask.objects.filter(id__in=wbs.path_ids(subtask.path))
+                    .values_list('id', 'leaf_count', 'done_count', 'task__subtask_leaf_count', 'task__subtask_done_count'))
+        nodes = [{'id': pk, 'is_complete': leaf == done} for pk, leaf, done, _, _ in rows]
+        if rows:
+            task.subtask_leaf_count, task.subtask_done_count = rows[0][3:]
+        else:
+            task.refresh_from_db(fields=['subtask_leaf_count', 'subtask_done_count'])
+    return {'progress': task.progress_percent(), 'is_overdue': task.is_overdue(), 'nodes': nodes}
+
+@login_required
 @require_POST
 def api_add_subtask(request):
     data = json.loads(request.body)
+    if not access.is_member(request, data.get('task_id')):
+        return JsonResponse({'status': 'error'}, status=403)
     task = Task.objects.get(id=data.get('task_id'))
-    subtask = SubTask.objects.create(task=task, title=data.get('title'))
-    return JsonResponse({'status': 'success', 'subtask_id': subtask.id, 'title': subtask.title, 'progress': task.progress_percent(), 'is_overdue': task.is_overdue()})
+    parent = None
+    if data.get('parent_id'):
+        parent = get_object_or_404(SubTask, id=data.get('parent_id'), task=task)
+    try:
+        subtask = wbs.add_subtask(task, data.get('title'), parent=parent, actor=request.user)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    return JsonResponse({'status': 'success', 'subtask_id': subtask.id, 'title': subtask.title, **_wbs_state(task, subtask)})
 
+@login_required
 @require_POST
 def api_toggle_subtask(request):
-    data = json.loads(request.body)
-    subtask = SubTask.objects.get(id=data.get('subtask_id'))
-    subtask.is_done = not subtask.is_done
-    subtask.save()
+    # is_done（切り替え後の値）と version を受け取り、その間に他の人が切り替えていたら 409 と最新の状態を返す
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'status': 'error'}, status=400)
+    # "false" などの文字列を真偽値に読み替えない（JSON の true/false のみ）
+    if not isinstance(data.get('is_done'), bool):
+        return JsonResponse({'status': 'error', 'message': 'is_done must be a boolean'}, status=400)
+    subtask = get_object_or_404(SubTask.objects.select_related('task'), id=data.get('subtask_id'))
+    if not access.is_member(request, subtask.task_id):
+        return JsonResponse({'status': 'error'}, status=403)
+    try:
+        with transaction.atomic():
+            wbs.toggle_subtask(subtask, data.get('is_done'), _to_int(data.get('version')))
+            activity.record(subtask.task_id, request.user, 'subtask', subtask.id,
+                            'open' if subtask.is_done else 'done', 'done' if subtask.is_done else 'open')
+    except concurrency.Conflict as e:
+        return JsonResponse({'status': 'conflict', **e.current, **_wbs_state(subtask.task, subtask)}, status=409)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
 
-    task = subtask.task
-    if task.progress_percent() == 100:
-        # 必要であればここでTaskAssignmentのステータスをDoneにする処理を追加可能
-        pass
+    return JsonResponse({'status': 'success', 'is_done': subtask.is_done, 'version': subtask.version,
+                         **_wbs_state(subtask.task, subtask)})
+
+@login_required
+@require_POST
+def api_move_subtask(request):
+    # WBSの並び替え: 前後のサブタスクの間のランクを付け、移動した行だけを書き換える
+    data = json.loads(request.body)
+    subtask = get_object_or_404(SubTask, id=data.get('subtask_id'))
+    if not access.is_member(request, subtask.task_id):
+        return JsonResponse({'status': 'error'}, status=403)
+    before_id, after_id = _to_int(data.get('before_id')), _to_int(data.get('after_id'))
+    siblings = SubTask.objects.filter(task_id=subtask.task_id, parent_id=subtask.parent_id)
+    neighbors = dict(siblings.filter(id__in=[i for i in (before_id, after_id) if i]).values_list('id', 'rank'))
+    try:
+        rank = ranking.rank_between(neighbors.get(before_id), neighbors.get(after_id))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'stale order'}, status=409)
 
-    return JsonResponse({'status': 'success', 'is_done': subtask.is_done, 'progress': subtask.task.progress_percent(), 'is_overdue': task.is_overdue()})
+    SubTask.objects.filter(id=subtask.id).update(rank=rank)
+    if ranking.needs_rebalance(rank):
+        ranking.schedule_rebalance(siblings, 'rank')
+    return JsonResponse({'status': 'success', 'rank': rank})
 
+@login_required
 @require_POST
 def api_delete_subtask(request):
     data = json.loads(request.body)
-    subtask = SubTask.objects.get(id=data.get('subtask_id'))
+    subtask = get_object_or_404(SubTask.objects.select_related('task'), id=data.get('subtask_id'))
+    if not access.is_member(request, subtask.task_id):
+        return JsonResponse({'status': 'error'}, status=403)
     task = subtask.task
-    subtask.delete()
-    return JsonResponse({'status': 'success', 'progress': task.progress_percent(),'is_overdue': task.is_overdue()})
\ No newline at end of file
+    wbs.delete_subtask(subtask, actor=request.user)
+    parent = SubTask.objects.filter(id=subtask.parent_id).first()
+    return JsonResponse({'status': 'success', **_wbs_state(task, parent)})
\ No newline at end of file
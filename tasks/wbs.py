@@ -0,0 +1,153 @@
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+
+from . import activity, concurrency
+from .models import Task, SubTask
+
+# === 階層WBS ===
+# SubTask.path に祖先のIDを連結して持たせ、部分木は path の前方一致1クエリで取得する。
+# 進捗は末端サブタスクの数/完了数を祖先と Task に差分で積み上げるので、表示時に木を辿らない。
+
+# path は 255 文字まで（1階層 9 文字）
+MAX_DEPTH = 28
+
+
+def path_segment(pk):
+    return format(pk, '08x') + '/'
+
+
+def path_ids(path):
+    """path に含まれるID（祖先から自分まで）"""
+    return [int(segment, 16) for segment in path.split('/') if segment]
+
+
+def _rollup(task_id, ids, leaf_delta, done_delta):
+    if not (leaf_delta or done_delta):
+        return
+    if ids:
+        SubTask.objects.filter(id__in=ids).update(leaf_count=F('leaf_count') + leaf_delta,
+                                                  done_count=F('done_count') + done_delta)
+    Task.objects.filter(id=task_id).update(subtask_leaf_count=F('subtask_leaf_count') + leaf_delta,
+                                           subtask_done_count=F('subtask_done_count') + done_delta)
+
+
+def add_subtask(task, title, parent=None, actor=None):
+    with transaction.atomic():
+        depth = 0
+        parent_path = ''
+        parent_was_leaf = False
+        if parent is not None:
+            # 集計値は手元のインスタンスではなくトランザクション内で読み直す（読んだ後に切り替えられていることがある）
+            current = (SubTask.objects.select_for_update().filter(id=parent.id)
+                       .values_list('depth', 'path', 'done_count').first())
+            if current is None:
+                raise ValueError('parent subtask no longer exists')
+            parent_depth, parent_path, parent_done = current
+            depth = parent_depth + 1
+            if depth >= MAX_DEPTH:
+                raise ValueError('WBS is nested too deeply')
+            parent_was_leaf = not parent.children.exists()
+
+        subtask = SubTask.objects.create(task=task, title=title, parent=parent, depth=depth, leaf_count=1, done_count=0)
+        subtask.path = parent_path + path_segment(subtask.id)
+        SubTask.objects.filter(id=subtask.id).update(path=subtask.path)
+
+        if parent is None:
+            _rollup(task.id, [], 1, 0)
+        elif parent_was_leaf:
+            # 親は末端ではなくなり、親自身の (1, 完了) が新しい子の (1, 0) に置き換わる
+            _rollup(task.id, path_ids(parent_path), 0, -parent_done)
+        else:
+            _rollup(task.id, path_ids(parent_path), 1, 0)
+        activity.record(task.id, actor, 'subtask_add', subtask.id, '', title[:100])
+    return subtask
+
+
+def toggle_subtask(subtask, is_done=None, version=None):
+    """末端サブタスクの完了状態を is_done（省略時は読んだときの反対）にする。
+    読んだ後（version は省略時は読んだときの値）に他の人が切り替えていたら Conflict。"""
+    target = not subtask.is_done if is_done is None else is_done
+    version = subtask.version if version is None else version
+    # 完了の切り替えは末端のみ（親の完了状態は子の集計で決まる）。子が無いことも同じ UPDATE の条件にする
+    leaf = SubTask.objects.filter(id=subtask.id, is_done=not target).exclude(
+        Exists(SubTask.objects.filter(parent_id=OuterRef('pk'))))
+    # 書き込みは UPDATE 3文だけにする（呼び出し側のトランザクション内ならセーブポイントも作らない）。
+    # Conflict はブロックを抜けてから送出するので、呼び出し側のトランザクションを巻き戻し待ちにしない
+    with transaction.atomic(savepoint=False):
+        new_version = concurrency.update_if_unchanged(leaf, version, is_done=target)
+        if new_version is not None:
+            _rollup(subtask.task_id, path_ids(subtask.path), 0, 1 if target else -1)
+    if new_version is None:
+        current = (SubTask.objects.filter(id=subtask.id)
+                   .annotate(has_children=Exists(SubTask.objects.filter(parent_id=OuterRef('pk'))))
+                   .values('is_done', 'version', 'has_children').first())
+        if current is None or current.pop('has_children'):
+            raise ValueError('only leaf subtasks can be toggled')
+        raise concurrency.Conflict(current)
+    subtask.is_done, subtask.version = target, new_version
+    return subtask
+
+
+def delete_subtask(subtask, actor=None):
+    with transaction.atomic():
+        current = (SubTask.objects.select_for_update().filter(id=subtask.id)
+                   .values_list('path', 'parent_id', 'leaf_count', 'done_count').first())
+        if current is None:
+            return  # 先に他の人が消していた
+        path, parent_id, leaf_count, done_count = current
+        ancestors = path_ids(path)[:-1]
+        leaf_delta, done_delta = -leaf_count, -done_count
+        if parent_id is not None:
+            has_siblings = SubTask.objects.filter(parent_id=parent_id).exclude(id=subtask.id).exists()
+            if not has_siblings:
+                # 子がいなくなった親は再び末端として数える
+                parent_done = SubTask.objects.filter(id=parent_id).values_list('is_done', flat=True).first()
+                leaf_delta += 1
+                done_delta += 1 if parent_done else 0
+        SubTask.objects.filter(task_id=subtask.task_id, path__startswith=path).delete()
+        _rollup(subtask.task_id, ancestors, leaf_delta, done_delta)
+        activity.record(subtask.task_id, actor, 'subtask_delete', subtask.id, subtask.title[:100], '')
+
+
+def load_tree(task, root=None):
+    """task（または root 以下の部分木）を1クエリで取得し、兄弟をランク順に並べた木で返す。"""
+    nodes = SubTask.objects.filter(task=task)
+    if root is not None:
+        nodes = nodes.filter(path__startswith=root.path)
+    nodes = list(nodes.order_by('rank', 'id'))
+
+    index = {node.id: node for node in nodes}
+    roots = []
+    for node in nodes:
+        node.child_nodes = []
+    for node in nodes:
+        parent = index.get(node.parent_id)
+        (parent.child_nodes if parent is not None else roots).append(node)
+    return roots
+
+
+def rebuild(task):
+    """path・深さ・集計値を木全体から作り直す（一括投入後や不整合の修復用）。"""
+    with transaction.atomic():
+        roots = load_tree(task)
+        changed = []
+
+        def visit(node, parent_path, depth):
+            node.path = parent_path + path_segment(node.id)
+            node.depth = depth
+            if node.child_nodes:
+                node.leaf_count = node.done_count = 0
+                for child in node.child_nodes:
+                    visit(child, node.path, depth + 1)
+                    node.leaf_count += child.leaf_count
+                    node.done_count += child.done_count
+            else:
+                node.leaf_count, node.done_count = 1, 1 if node.is_done else 0
+            changed.append(node)
+
+        for root in roots:
+            visit(root, '', 0)
+        SubTask.objects.bulk_update(changed, ['path', 'depth', 'leaf_count', 'done_count'], batch_size=500)
+        task.subtask_leaf_count = sum(root.leaf_count for root in roots)
+        task.subtask_done_count = sum(root.done_count for root in roots)
+        task.save(update_fields=['subtask_leaf_count', 'subtask_done_count'])